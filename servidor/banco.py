@@ -0,0 +1,355 @@
+# Camada de acesso ao SQLite (tabela vinculos)
+# - Pool de conexões reaproveitadas entre as threads do Flask, em vez de abrir e
+#   fechar o arquivo a cada consulta
+# - Journal em modo WAL: leituras não bloqueiam a escrita de /api/vincular
+# - Como cada conexão vive muito tempo, o cache de statements do módulo sqlite3
+#   (cached_statements) reaproveita as consultas já preparadas
+import queue
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from cache import CacheLRU
+from hexa_client import dump_public_key, load_public_key
+
+DB_NAME = 'sistema_henry.sqlite'
+
+# Credenciais usadas quando o vínculo não traz usuário/senha do relógio
+CREDENCIAIS_PADRAO = ("admin", "123")
+
+
+# Nenhuma conexão do pool ficou livre dentro do prazo (as rotas respondem 503)
+class PoolEsgotado(TimeoutError):
+    pass
+
+
+# Pool de conexões SQLite compartilhado entre threads
+# Parâmetros:
+# - caminho: arquivo do banco
+# - tamanho: máximo de conexões abertas ao mesmo tempo
+# - timeout: segundos aguardando uma conexão livre (e o lock de escrita do SQLite)
+class PoolSQLite:
+    def __init__(self, caminho=DB_NAME, tamanho=8, timeout=5.0):
+        self.caminho = caminho
+        self.tamanho = tamanho
+        self.timeout = timeout
+        self._livres = queue.LifoQueue()
+        self._criadas = 0
+        self._lock = threading.Lock()
+
+    def _nova_conexao(self):
+        conn = sqlite3.connect(self.caminho, timeout=self.timeout, check_same_thread=False,
+                               cached_statements=256)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    # Empresta uma conexão do pool pelo tempo do bloco with
+    # Uma transação deixada aberta pelo bloco é desfeita antes da devolução
+    @contextmanager
+    def conexao(self):
+        try:
+            conn = self._livres.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                criar = self._criadas < self.tamanho
+                if criar:
+                    self._criadas += 1
+            if criar:
+                try:
+                    conn = self._nova_conexao()
+                except Exception:
+                    with self._lock:
+                        self._criadas -= 1
+                    raise
+            else:
+                try:
+                    conn = self._livres.get(timeout=self.timeout)
+                except queue.Empty:
+                    raise PoolEsgotado(f"Pool SQLite esgotado: nenhuma das {self.tamanho} conexões "
+                                       f"ficou livre em {self.timeout}s.") from None
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+            self._livres.put(conn)
+
+    # Fecha as conexões livres do pool
+    def fechar(self):
+        while True:
+            try:
+                self._livres.get_nowait().close()
+            except queue.Empty:
+                break
+            with self._lock:
+                self._criadas -= 1
+
+
+# Consultas da aplicação sobre o pool
+# - Permissões (user_id, ns) e credenciais por NS ficam em cache (CacheLRU), pois só
+#   mudam em vincular(), que invalida exatamente as chaves afetadas
+# - Chaves públicas RSA dos relógios ficam em cache já montadas (objeto da chave),
+#   sem validade: só mudam em salvar_chave_publica() / remover_chave_publica()
+# - Com vários processos no mesmo banco (workers HTTP), vincular() num deles também
+#   incrementa versao_vinculos; os outros conferem essa versão no máximo a cada
+#   intervalo_versao segundos e limpam os caches de permissão e credenciais se mudou
+# Parâmetros:
+# - caminho: arquivo do banco
+# - tamanho_pool: conexões SQLite abertas no máximo
+# - tamanho_cache / ttl_cache: entradas e validade (segundos) de cada cache
+# - intervalo_versao: segundos entre conferências da versão dos vínculos
+class BancoDados:
+    def __init__(self, caminho=DB_NAME, tamanho_pool=8, tamanho_cache=10000, ttl_cache=300.0,
+                 intervalo_versao=1.0):
+        self.pool = PoolSQLite(caminho, tamanho_pool)
+        self.intervalo_versao = intervalo_versao
+        self._versao_vinculos = None
+        self._proxima_conferencia = 0.0
+        self.cache_permissoes = CacheLRU(tamanho_cache, ttl_cache)    # (user_id, ns) -> bool
+        self.cache_credenciais = CacheLRU(tamanho_cache, ttl_cache)   # ns -> (usuario, senha)
+        self.cache_chaves = CacheLRU(tamanho_cache, ttl=None)         # ns -> chave pública RSA (ou None)
+
+    def init_db(self):
+        with self.pool.conexao() as conn, conn:
+            # Tabela que vincula o Usuário do Site ao Relógio Físico
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS vinculos (
+                    user_id TEXT,
+                    relogio_ns TEXT,
+                    relogio_ip TEXT,
+                    user_relogio TEXT,
+                    pass_relogio TEXT,
+                    PRIMARY KEY (user_id, relogio_ns)
+                )
+            """)
+            # Bancos criados antes das credenciais do relógio ganham as colunas novas
+            colunas = {linha[1] for linha in conn.execute("PRAGMA table_info(vinculos)")}
+            for coluna in ("user_relogio", "pass_relogio"):
+                if coluna not in colunas:
+                    conn.execute(f"ALTER TABLE vinculos ADD COLUMN {coluna} TEXT")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_vinculos_ns ON vinculos (relogio_ns)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_vinculos_ip ON vinculos (relogio_ip)")
+            # Contador de alterações em vinculos, lido pelos outros processos do mesmo banco
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS versao_vinculos (
+                    id INTEGER PRIMARY KEY CHECK (id = 1),
+                    versao INTEGER NOT NULL
+                )
+            """)
+            conn.execute("INSERT OR IGNORE INTO versao_vinculos (id, versao) VALUES (1, 0)")
+            # Próximo NSR a ler de cada relógio, por consumidor (download de um usuário, coletor...)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS cursores_registros (
+                    relogio_ns TEXT,
+                    consumidor TEXT,
+                    proximo_nsr INTEGER NOT NULL,
+                    atualizado_em REAL NOT NULL,
+                    PRIMARY KEY (relogio_ns, consumidor)
+                )
+            """)
+            # Registros de ponto já coletados dos relógios (consultados sem ir ao equipamento)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS registros_ponto (
+                    relogio_ns TEXT,
+                    nsr INTEGER,
+                    tipo TEXT,
+                    data TEXT,
+                    hora TEXT,
+                    pis TEXT,
+                    coletado_em REAL NOT NULL,
+                    PRIMARY KEY (relogio_ns, nsr)
+                )
+            """)
+            # Chave pública RSA de cada relógio (resposta do RA), para autenticar só com o EA
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS chaves_relogio (
+                    relogio_ns TEXT PRIMARY KEY,
+                    modulo TEXT NOT NULL,
+                    expoente TEXT NOT NULL,
+                    atualizado_em REAL NOT NULL
+                )
+            """)
+
+    # Permissão do usuário sobre o NS e credenciais do relógio
+    # Com as duas em cache não há SQL; senão, uma única consulta traz as duas
+    # Retorna (permitido, (usuario_relogio, senha_relogio))
+    # As credenciais vêm do vínculo mais recente do NS que as tenha
+    def permissao_e_credenciais(self, user_id, ns):
+        self._conferir_versao()
+        achou_permissao, permitido = self.cache_permissoes.obter((user_id, ns))
+        achou_credenciais, credenciais = self.cache_credenciais.obter(ns)
+        if achou_permissao and achou_credenciais:
+            return permitido, credenciais
+
+        geracoes = self.cache_permissoes.geracao(), self.cache_credenciais.geracao()
+        with self.pool.conexao() as conn:
+            linha = conn.execute("""
+                SELECT EXISTS (SELECT 1 FROM vinculos WHERE user_id = ? AND relogio_ns = ?),
+                       user_relogio, pass_relogio
+                FROM vinculos WHERE relogio_ns = ?
+                ORDER BY user_relogio IS NULL, rowid DESC LIMIT 1
+            """, (user_id, ns, ns)).fetchone()
+        if linha is None:
+            permitido, credenciais = False, CREDENCIAIS_PADRAO
+        else:
+            permitido, credenciais = bool(linha[0]), self._credenciais(linha[1], linha[2])
+        self.cache_permissoes.guardar((user_id, ns), permitido, geracoes[0])
+        self.cache_credenciais.guardar(ns, credenciais, geracoes[1])
+        return permitido, credenciais
+
+    def usuario_tem_permissao(self, user_id, ns):
+        self._conferir_versao()
+        achou, permitido = self.cache_permissoes.obter((user_id, ns))
+        if achou:
+            return permitido
+        geracao = self.cache_permissoes.geracao()
+        with self.pool.conexao() as conn:
+            permitido = conn.execute("SELECT 1 FROM vinculos WHERE user_id = ? AND relogio_ns = ?",
+                                     (user_id, ns)).fetchone() is not None
+        self.cache_permissoes.guardar((user_id, ns), permitido, geracao)
+        return permitido
+
+    # Credenciais do relógio salvas no momento do vínculo
+    def credenciais_relogio(self, ns):
+        self._conferir_versao()
+        achou, credenciais = self.cache_credenciais.obter(ns)
+        if achou:
+            return credenciais
+        geracao = self.cache_credenciais.geracao()
+        with self.pool.conexao() as conn:
+            linha = conn.execute("""
+                SELECT user_relogio, pass_relogio FROM vinculos
+                WHERE relogio_ns = ? ORDER BY user_relogio IS NULL, rowid DESC LIMIT 1
+            """, (ns,)).fetchone()
+        credenciais = self._credenciais(*linha) if linha else CREDENCIAIS_PADRAO
+        self.cache_credenciais.guardar(ns, credenciais, geracao)
+        return credenciais
+
+    @staticmethod
+    def _credenciais(usuario, senha):
+        return (usuario or CREDENCIAIS_PADRAO[0], senha or CREDENCIAIS_PADRAO[1])
+
+    def vincular(self, user_id, ns, ip, user_relogio=None, pass_relogio=None):
+        with self.pool.conexao() as conn, conn:
+            conn.execute("""
+                INSERT OR REPLACE INTO vinculos (user_id, relogio_ns, relogio_ip, user_relogio, pass_relogio)
+                VALUES (?, ?, ?, ?, ?)
+            """, (user_id, ns, ip, user_relogio, pass_relogio))
+            conn.execute("UPDATE versao_vinculos SET versao = versao + 1 WHERE id = 1")
+        self.cache_permissoes.invalidar((user_id, ns))
+        self.cache_credenciais.invalidar(ns)
+
+    # Limpa os caches de permissão e credenciais se outro processo alterou os vínculos
+    # (consulta o banco no máximo uma vez a cada intervalo_versao segundos)
+    def _conferir_versao(self):
+        agora = time.monotonic()
+        if agora < self._proxima_conferencia:
+            return
+        self._proxima_conferencia = agora + self.intervalo_versao
+        with self.pool.conexao() as conn:
+            linha = conn.execute("SELECT versao FROM versao_vinculos WHERE id = 1").fetchone()
+        versao = linha[0] if linha else 0
+        if versao != self._versao_vinculos:
+            if self._versao_vinculos is not None:
+                self.cache_permissoes.limpar()
+                self.cache_credenciais.limpar()
+            self._versao_vinculos = versao
+
+    # --- Chaves públicas RSA dos relógios ---
+
+    # Chave pública guardada do relógio (None se ainda não houve RA com ele)
+    def chave_publica(self, ns):
+        achou, chave = self.cache_chaves.obter(ns)
+        if achou:
+            return chave
+        geracao = self.cache_chaves.geracao()
+        with self.pool.conexao() as conn:
+            linha = conn.execute("SELECT modulo, expoente FROM chaves_relogio WHERE relogio_ns = ?",
+                                 (ns,)).fetchone()
+        chave = load_public_key(*linha) if linha else None
+        self.cache_chaves.guardar(ns, chave, geracao)
+        return chave
+
+    def salvar_chave_publica(self, ns, chave):
+        modulo, expoente = dump_public_key(chave)
+        with self.pool.conexao() as conn, conn:
+            conn.execute("""
+                INSERT OR REPLACE INTO chaves_relogio (relogio_ns, modulo, expoente, atualizado_em)
+                VALUES (?, ?, ?, ?)
+            """, (ns, modulo, expoente, time.time()))
+        self.cache_chaves.invalidar(ns)
+        self.cache_chaves.guardar(ns, chave)
+
+    def remover_chave_publica(self, ns):
+        with self.pool.conexao() as conn, conn:
+            conn.execute("DELETE FROM chaves_relogio WHERE relogio_ns = ?", (ns,))
+        self.cache_chaves.invalidar(ns)
+
+    # --- Cursores de leitura dos registros de ponto ---
+
+    # Próximo NSR a ler do relógio para o consumidor (None se nunca leu)
+    def obter_cursor(self, ns, consumidor):
+        with self.pool.conexao() as conn:
+            linha = conn.execute(
+                "SELECT proximo_nsr FROM cursores_registros WHERE relogio_ns = ? AND consumidor = ?",
+                (ns, consumidor)).fetchone()
+        return linha[0] if linha else None
+
+    def salvar_cursor(self, ns, consumidor, proximo_nsr):
+        with self.pool.conexao() as conn, conn:
+            conn.execute("""
+                INSERT OR REPLACE INTO cursores_registros (relogio_ns, consumidor, proximo_nsr, atualizado_em)
+                VALUES (?, ?, ?, ?)
+            """, (ns, consumidor, proximo_nsr, time.time()))
+
+    # --- Registros de ponto coletados ---
+
+    # Grava um lote de registros (PunchRecord, em ordem de NSR) e avança o cursor do
+    # consumidor para depois do último, tudo na mesma transação
+    def salvar_registros(self, ns, registros, consumidor):
+        agora = time.time()
+        with self.pool.conexao() as conn, conn:
+            conn.executemany("""
+                INSERT OR IGNORE INTO registros_ponto (relogio_ns, nsr, tipo, data, hora, pis, coletado_em)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            """, [(ns, r.nsr, r.type, r.date, r.time, r.pis, agora) for r in registros])
+            conn.execute("""
+                INSERT OR REPLACE INTO cursores_registros (relogio_ns, consumidor, proximo_nsr, atualizado_em)
+                VALUES (?, ?, ?, ?)
+            """, (ns, consumidor, registros[-1].nsr + 1, agora))
+
+    # Registros coletados do relógio a partir de um NSR, em ordem
+    # Retorna tuplas (nsr, tipo, data, hora, pis)
+    def consultar_registros(self, ns, desde_nsr=1, limite=1000):
+        with self.pool.conexao() as conn:
+            return conn.execute("""
+                SELECT nsr, tipo, data, hora, pis FROM registros_ponto
+                WHERE relogio_ns = ? AND nsr >= ? ORDER BY nsr LIMIT ?
+            """, (ns, desde_nsr, limite)).fetchall()
+
+    # Contadores dos caches de permissão, credenciais e chaves públicas
+    def estatisticas_cache(self):
+        return {
+            "permissoes": self.cache_permissoes.estatisticas(),
+            "credenciais": self.cache_credenciais.estatisticas(),
+            "chaves": self.cache_chaves.estatisticas(),
+        }
+
+    # Lista (relogio_ns, relogio_ip) vinculados ao usuário
+    def relogios_do_usuario(self, user_id):
+        with self.pool.conexao() as conn:
+            return conn.execute("SELECT relogio_ns, relogio_ip FROM vinculos WHERE user_id = ?",
+                                (user_id,)).fetchall()
+
+    # Todos os pares (user_id, relogio_ns)
+    def todos_vinculos(self):
+        with self.pool.conexao() as conn:
+            return conn.execute("SELECT user_id, relogio_ns FROM vinculos").fetchall()
+
+    # NS vinculados a um IP (candidatos na identificação de um relógio recém-conectado)
+    def ns_por_ip(self, ip):
+        with self.pool.conexao() as conn:
+            return [r[0] for r in conn.execute(
+                "SELECT DISTINCT relogio_ns FROM vinculos WHERE relogio_ip = ?", (ip,))]
@@ -0,0 +1,284 @@
+# Micro-benchmarks do protocolo HEXA (sem rede)
+# - framer: recepção de pacotes grandes (AFD / registros de ponto), leitura antiga
+#   (recv(3) + bytes concatenados + fatias) contra o HexaFramer (recv_into + memoryview)
+# - checksum: laço byte a byte contra xor_checksum, conferindo que os resultados são iguais
+# - aes: Cipher novo por pacote contra AesSessionCipher (individual e em lote)
+# - logs: comando cifrado montado + resposta analisada com os prints de debug antigos
+#   contra o logging (desligado, e em DEBUG com dumps de pacotes via fila)
+# - resposta: análise de respostas cifradas como era feita (str + split('+') duas vezes +
+#   dicionário) contra o HexaResponse, com tempo e memória alocada
+#
+# Uso: python bench/bench_protocolo.py [framer|checksum|aes|logs|resposta ...] [--pacotes 2000]
+import argparse
+import contextlib
+import logging
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes  # noqa: E402
+
+from hexa_client import AesSessionCipher, HexaFramer, HexaProtocolClient, parse_punch_records, xor_checksum  # noqa: E402
+from logs import configurar_logs  # noqa: E402
+
+# Tamanho máximo devolvido por recv(), simulando segmentos chegando do TCP
+SEGMENTO = 16384
+
+
+# Socket falso que devolve um fluxo pré-montado em pedaços de até SEGMENTO bytes
+class SocketFalso:
+    def __init__(self, fluxo):
+        self._fluxo = memoryview(fluxo)
+        self._pos = 0
+
+    def recv(self, n):
+        n = min(n, SEGMENTO, len(self._fluxo) - self._pos)
+        dados = bytes(self._fluxo[self._pos:self._pos + n])
+        self._pos += n
+        return dados
+
+    def recv_into(self, buffer):
+        n = min(len(buffer), SEGMENTO, len(self._fluxo) - self._pos)
+        buffer[:n] = self._fluxo[self._pos:self._pos + n]
+        self._pos += n
+        return n
+
+
+# Monta registros de ponto no formato de texto do AFD até preencher o payload
+def pacote_afd(cliente, tamanho):
+    registro = "000012345]3]01012024]0800]012345678901]"
+    dados = (registro * (tamanho // len(registro) + 1))[:tamanho]
+    return cliente._build_packet("RR", status="000", data=dados)
+
+
+# Leitura como era feita em _send_and_receive/_parse_response antes do HexaFramer
+def ler_antigo(sock, n_pacotes):
+    for _ in range(n_pacotes):
+        header = sock.recv(3)
+        bytes_to_read = int.from_bytes(header[1:3], 'little') + 2
+        response_data = b''
+        while len(response_data) < bytes_to_read:
+            response_data += sock.recv(bytes_to_read - len(response_data))
+        full_response = header + response_data
+        payload = full_response[3:-2]
+        checksum_data = full_response[1:-2]
+    return payload, checksum_data
+
+
+def ler_framer(sock, n_pacotes):
+    framer = HexaFramer()
+    for _ in range(n_pacotes):
+        frame = framer.next_frame()
+        while frame is None:
+            framer.recv_into(sock)
+            frame = framer.next_frame()
+        payload = frame[3:-2]
+        checksum_data = frame[1:-2]
+    return payload, checksum_data
+
+
+def bench_framer(n_pacotes):
+    cliente = HexaProtocolClient('bench')
+    print("Framer (pacotes/s)")
+    for tamanho in (1024, 8192, 32768, 65000):
+        fluxo = pacote_afd(cliente, tamanho) * n_pacotes
+        for nome, funcao in (("antigo", ler_antigo), ("HexaFramer", ler_framer)):
+            inicio = time.perf_counter()
+            funcao(SocketFalso(fluxo), n_pacotes)
+            decorrido = time.perf_counter() - inicio
+            print(f"  {tamanho:>6} B  {nome:<12} {n_pacotes / decorrido:>10.0f}")
+
+
+# Checksum como era calculado antes de xor_checksum
+def checksum_laco(data):
+    checksum = 0
+    for byte in data:
+        checksum ^= byte
+    return checksum
+
+
+def bench_checksum(n_pacotes):
+    print("Checksum (MB/s)")
+    for tamanho in (64, 256, 1024, 4096, 16384, 65536):
+        dados = os.urandom(tamanho)
+        assert xor_checksum(dados) == checksum_laco(dados) == xor_checksum(memoryview(dados))
+        for nome, funcao in (("laço", checksum_laco), ("xor_checksum", xor_checksum)):
+            inicio = time.perf_counter()
+            for _ in range(n_pacotes):
+                funcao(dados)
+            decorrido = time.perf_counter() - inicio
+            print(f"  {tamanho:>6} B  {nome:<12} {tamanho * n_pacotes / decorrido / 1e6:>10.1f}")
+
+
+# Criptografia como era feita em _build_packet/_parse_response antes do AesSessionCipher
+def cifrar_antigo(chave, payload):
+    iv = os.urandom(16)
+    encryptor = Cipher(algorithms.AES(chave), modes.CBC(iv)).encryptor()
+    padded_data = payload + (b'\x00' * (16 - (len(payload) % 16)))
+    return iv + encryptor.update(padded_data) + encryptor.finalize()
+
+
+def decifrar_antigo(chave, dados):
+    decryptor = Cipher(algorithms.AES(chave), modes.CBC(dados[:16])).decryptor()
+    return decryptor.update(dados[16:]) + decryptor.finalize()
+
+
+def bench_aes(n_pacotes):
+    chave = os.urandom(16)
+    contexto = AesSessionCipher(chave)
+    print("AES-CBC (pacotes/s)")
+    for tamanho in (32, 128, 1024, 8192):
+        payloads = [os.urandom(tamanho) for _ in range(n_pacotes)]
+        cifrados = [cifrar_antigo(chave, p) for p in payloads]
+        assert contexto.decrypt_many(cifrados) == [decifrar_antigo(chave, c) for c in cifrados]
+
+        casos = (
+            ("cifrar antigo", lambda: [cifrar_antigo(chave, p) for p in payloads]),
+            ("cifrar sessão", lambda: [contexto.encrypt(p) for p in payloads]),
+            ("cifrar lote", lambda: contexto.encrypt_many(payloads)),
+            ("decifrar antigo", lambda: [decifrar_antigo(chave, c) for c in cifrados]),
+            ("decifrar sessão", lambda: [contexto.decrypt(c) for c in cifrados]),
+            ("decifrar lote", lambda: contexto.decrypt_many(cifrados)),
+        )
+        for nome, funcao in casos:
+            inicio = time.perf_counter()
+            funcao()
+            decorrido = time.perf_counter() - inicio
+            print(f"  {tamanho:>6} B  {nome:<16} {n_pacotes / decorrido:>10.0f}")
+
+
+# Analisa a resposta com os três prints que _parse_response fazia em cada pacote cifrado
+def analisar_com_prints(cliente, pacote):
+    print("DEBUG: Tentando descriptografar a resposta...")
+    resposta = cliente._parse_response(pacote)
+    print("DEBUG: Descriptografia bem-sucedida.")
+    print(f"DEBUG: Payload final para parsing: {repr(resposta['data'])}")
+    return resposta
+
+
+def bench_logs(n_pacotes):
+    cliente = HexaProtocolClient('bench')
+    cliente.aes_key = os.urandom(16)
+    cliente.is_authenticated = True
+    respostas = [cliente._build_packet("RQ", status="000", data=f"{i}]ponto]12345", index=f"{i % 100:02d}",
+                                       use_aes=True) for i in range(n_pacotes)]
+
+    def rodar(analisar):
+        inicio = time.perf_counter()
+        for pacote in respostas:
+            cliente._build_packet("RQ", index=cliente._next_index(), use_aes=True)
+            analisar(cliente, pacote)
+        return n_pacotes / (time.perf_counter() - inicio)
+
+    print("Logs (comandos/s: montar pacote cifrado + analisar resposta)")
+    # Saída com buffer de linha num arquivo temporário, como stdout num terminal ou num
+    # serviço com PYTHONUNBUFFERED (cada linha é uma escrita)
+    with tempfile.TemporaryFile('w', buffering=1) as saida:
+        with contextlib.redirect_stdout(saida):
+            taxa = rodar(analisar_com_prints)
+        print(f"  {'prints antigos':<28} {taxa:>10.0f}")
+
+        print(f"  {'logging desligado':<28} {rodar(HexaProtocolClient._parse_response):>10.0f}")
+
+        destino = logging.StreamHandler(saida)
+        ouvinte = configurar_logs(nivel="DEBUG", debug_pacotes=True, destino=destino)
+        taxa = rodar(HexaProtocolClient._parse_response)
+        ouvinte.stop()
+        print(f"  {'DEBUG + dumps (fila)':<28} {taxa:>10.0f}")
+        logging.getLogger().handlers.clear()
+        logging.getLogger("hexa.packets").setLevel(logging.WARNING)
+
+# Análise de resposta como era feita em _parse_response antes do HexaResponse (sem os logs)
+def analisar_antigo(cliente, pacote):
+    pacote = memoryview(pacote)
+    payload_bytes = pacote[3:-2]
+    xor_checksum(pacote[1:-2])
+    try:
+        comando = str(payload_bytes, 'utf-8').split('+')[1]
+    except (UnicodeDecodeError, IndexError):
+        comando = None
+    if cliente.is_authenticated and comando is None:
+        payload_bytes = cliente._session_cipher().decrypt(payload_bytes)
+    partes = bytes(payload_bytes).rstrip(b'\x00').decode('utf-8', errors='ignore').split('+')
+    resposta = {"index": "??", "command": "??", "status": "??", "data": ""}
+    if len(partes) >= 3:
+        resposta["index"] = partes[0]; resposta["command"] = partes[1]; resposta["status"] = partes[2]
+        if len(partes) > 3:
+            resposta["data"] = "+".join(partes[3:])
+    return resposta
+
+
+def bench_resposta(n_pacotes):
+    cliente = HexaProtocolClient('bench')
+    cliente.aes_key = os.urandom(16)
+    cliente.is_authenticated = True
+    registro = "000012345]3]01012024]0800]012345678901]"
+    casos = (("RQ", "U[5]R[100]"), ("RC", "NS[00014003750006771]"), ("RR", registro * 100))
+
+    print(f"Resposta ({n_pacotes} respostas cifradas: tempo total / memória retida pelos resultados)")
+    for comando, dados in casos:
+        pacotes = [cliente._build_packet(comando, status="000", data=dados, index=f"{i % 100:02d}", use_aes=True)
+                   for i in range(n_pacotes)]
+        antigo = analisar_antigo(cliente, pacotes[0])
+        novo = cliente._parse_response(pacotes[0])
+        assert antigo == novo.as_dict()
+
+        for nome, analisar in (("dict + split", analisar_antigo), ("HexaResponse", HexaProtocolClient._parse_response)):
+            tracemalloc.start()
+            inicio = time.perf_counter()
+            resultados = [analisar(cliente, p) for p in pacotes]
+            decorrido = time.perf_counter() - inicio
+            retida, pico = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            # Tempo sem o tracemalloc ligado, que distorce a medição
+            inicio = time.perf_counter()
+            resultados = [analisar(cliente, p) for p in pacotes]
+            decorrido = time.perf_counter() - inicio
+            del resultados
+            print(f"  {len(dados) + 12:>6} B {comando}  {nome:<14} {decorrido * 1000:>8.1f} ms"
+                  f"   retida {retida / 1024:>8.0f} KB   pico {pico / 1024:>8.0f} KB")
+
+    # Percorrer os registros de ponto de uma resposta RR: dicionário por registro (como a
+    # API montaria a partir do data antigo) contra os PunchRecord de parse_punch_records
+    antiga = analisar_antigo(cliente, pacotes[0])
+    resposta = cliente._parse_response(pacotes[0])
+
+    def registros_antigos():
+        campos = antiga["data"].split(']')
+        return [{"nsr": int(campos[i]), "tipo": campos[i + 1], "data": campos[i + 2], "hora": campos[i + 3],
+                 "pis": campos[i + 4]} for i in range(0, len(campos) - 4, 5)]
+
+    for nome, percorrer in (("dicts", lambda: sum(1 for _ in registros_antigos())),
+                            ("PunchRecord", lambda: sum(1 for _ in parse_punch_records(resposta)))):
+        tracemalloc.start()
+        percorrer()
+        pico = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        inicio = time.perf_counter()
+        for _ in range(1000):
+            percorrer()
+        decorrido = time.perf_counter() - inicio
+        print(f"  registros RR  {nome:<12} {decorrido:>8.3f} ms/resposta   pico {pico / 1024:>8.1f} KB")
+
+
+BENCHMARKS = {
+    'framer': bench_framer,
+    'checksum': bench_checksum,
+    'aes': bench_aes,
+    'logs': bench_logs,
+    'resposta': bench_resposta,
+}
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('benchmarks', nargs='*', help=f"um ou mais de: {', '.join(BENCHMARKS)} (padrão: todos)")
+    parser.add_argument('--pacotes', type=int, default=2000)
+    args = parser.parse_args()
+    for nome in args.benchmarks or BENCHMARKS:
+        if nome not in BENCHMARKS:
+            parser.error(f"benchmark desconhecido: {nome}")
+        BENCHMARKS[nome](args.pacotes)
@@ -0,0 +1,171 @@
+# Teste de carga da API HTTP e da camada SQLite
+# - api: sobe o Flask (servidor-henry.py) numa porta livre, com um banco temporário,
+#   e dispara POST /api/comando de várias threads ao mesmo tempo. Os relógios ficam
+#   offline, então cada requisição mede o caminho HTTP + permissão/credenciais no banco
+# - banco: a consulta de permissão + credenciais feita por várias threads, abrindo o
+#   SQLite duas vezes por comando (como antes do pool) contra BancoDados (pool + WAL,
+#   consulta única) sem e com o cache, com escritas de /api/vincular em paralelo
+#
+# Uso: python bench/carga_api.py [api|banco ...] [--threads 64] [--requisicoes 5000] [--vinculos 2000]
+import argparse
+import http.client
+import importlib.util
+import json
+import logging
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+DIR_SERVIDOR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, DIR_SERVIDOR)
+
+from werkzeug.serving import make_server  # noqa: E402
+
+from banco import BancoDados  # noqa: E402
+
+
+# Percentil (0-100) de uma lista já ordenada
+def percentil(ordenados, p):
+    return ordenados[min(len(ordenados) - 1, int(len(ordenados) * p / 100))]
+
+
+# Executa funcao(i) para i em range(n) com a quantidade de threads pedida
+# Retorna (tempo total, latências ordenadas em ms, quantidade de erros)
+def disparar(funcao, n, threads):
+    latencias = [0.0] * n
+    erros = []
+
+    def medir(i):
+        inicio = time.perf_counter()
+        try:
+            funcao(i)
+        except Exception as e:
+            erros.append(e)
+        latencias[i] = (time.perf_counter() - inicio) * 1000
+
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        list(executor.map(medir, range(n)))
+    return time.perf_counter() - inicio, sorted(latencias), len(erros)
+
+
+def relatar(nome, n, decorrido, latencias, erros):
+    print(f"  {nome:<22} {n / decorrido:>9.0f} req/s   p50 {percentil(latencias, 50):>7.2f} ms"
+          f"   p99 {percentil(latencias, 99):>7.2f} ms   erros {erros}")
+
+
+# Cria n vínculos usuario<i % 50> -> NS<i>
+def popular(banco, n):
+    for i in range(n):
+        banco.vincular(f"usuario{i % 50}", f"NS{i:08d}", f"10.0.{i // 250}.{i % 250}")
+
+
+# Carrega o servidor-henry.py (nome com hífen) como módulo
+def carregar_servidor():
+    spec = importlib.util.spec_from_file_location("servidor_henry", os.path.join(DIR_SERVIDOR, "servidor-henry.py"))
+    modulo = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(modulo)
+    return modulo
+
+
+def bench_api(args):
+    # O servidor usa o banco no diretório atual: roda dentro de um diretório temporário
+    os.chdir(tempfile.mkdtemp(prefix="carga_api_"))
+    servidor = carregar_servidor()
+    servidor.init_db()
+    popular(servidor.banco, args.vinculos)
+
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)  # Sem uma linha de log por requisição
+    http_servidor = make_server('127.0.0.1', 0, servidor.app, threaded=True)
+    threading.Thread(target=http_servidor.serve_forever, daemon=True).start()
+    porta = http_servidor.server_port
+
+    def requisicao(i):
+        corpo = json.dumps({"user_id": f"usuario{i % 50}", "ns": f"NS{i % args.vinculos:08d}", "comando": "RQ"})
+        conexao = http.client.HTTPConnection('127.0.0.1', porta, timeout=30)
+        conexao.request('POST', '/api/comando', corpo, {'Content-Type': 'application/json'})
+        resposta = conexao.getresponse()
+        resposta.read()
+        conexao.close()
+        if resposta.status != 200:
+            raise RuntimeError(f"HTTP {resposta.status}")
+
+    print(f"POST /api/comando ({args.threads} threads, {args.requisicoes} requisições)")
+    relatar("pool + WAL + cache", args.requisicoes, *disparar(requisicao, args.requisicoes, args.threads))
+    http_servidor.shutdown()
+    print(f"  cache de permissões: {servidor.banco.cache_permissoes.estatisticas()}")
+
+
+# Permissão e credenciais como eram consultadas antes do BancoDados (duas conexões por comando)
+def consultar_antigo(caminho, user_id, ns):
+    conn = sqlite3.connect(caminho)
+    permitido = conn.execute("SELECT 1 FROM vinculos WHERE user_id = ? AND relogio_ns = ?",
+                             (user_id, ns)).fetchone() is not None
+    conn.close()
+    conn = sqlite3.connect(caminho)
+    credenciais = conn.execute("SELECT user_relogio, pass_relogio FROM vinculos WHERE relogio_ns = ?",
+                               (ns,)).fetchone()
+    conn.close()
+    return permitido, credenciais
+
+
+def vincular_antigo(caminho, user_id, ns, ip):
+    conn = sqlite3.connect(caminho)
+    conn.execute("INSERT OR REPLACE INTO vinculos (user_id, relogio_ns, relogio_ip) VALUES (?, ?, ?)",
+                 (user_id, ns, ip))
+    conn.commit()
+    conn.close()
+
+
+def bench_banco(args):
+    print(f"Permissão + credenciais ({args.threads} threads, {args.requisicoes} consultas, 1 escrita a cada 20)")
+    for nome in ("antigo (connect/close)", "pool + WAL", "pool + WAL + cache"):
+        caminho = os.path.join(tempfile.mkdtemp(prefix="carga_banco_"), "bench.sqlite")
+        # ttl_cache=0: toda entrada já nasce vencida, ou seja, sem cache
+        banco = BancoDados(caminho, ttl_cache=300.0 if nome.endswith("cache") else 0)
+        banco.init_db()
+        popular(banco, args.vinculos)
+        if nome != "antigo (connect/close)":
+            consultar, vincular = banco.permissao_e_credenciais, banco.vincular
+        else:
+            # O banco antigo não usava WAL
+            banco.pool.fechar()
+            with sqlite3.connect(caminho) as conn:
+                conn.execute("PRAGMA journal_mode=DELETE")
+
+            def consultar(user_id, ns, caminho=caminho):
+                return consultar_antigo(caminho, user_id, ns)
+
+            def vincular(user_id, ns, ip, caminho=caminho):
+                vincular_antigo(caminho, user_id, ns, ip)
+
+        def operacao(i):
+            ns = f"NS{i % args.vinculos:08d}"
+            if i % 20 == 0:
+                vincular(f"usuario{i % 50}", ns, "10.1.0.1")
+            else:
+                consultar(f"usuario{i % 50}", ns)
+
+        relatar(nome, args.requisicoes, *disparar(operacao, args.requisicoes, args.threads))
+
+
+BENCHMARKS = {
+    'api': bench_api,
+    'banco': bench_banco,
+}
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('benchmarks', nargs='*', help=f"um ou mais de: {', '.join(BENCHMARKS)} (padrão: todos)")
+    parser.add_argument('--threads', type=int, default=64)
+    parser.add_argument('--requisicoes', type=int, default=5000)
+    parser.add_argument('--vinculos', type=int, default=2000)
+    args = parser.parse_args()
+    for nome in args.benchmarks or BENCHMARKS:
+        if nome not in BENCHMARKS:
+            parser.error(f"benchmark desconhecido: {nome}")
+        BENCHMARKS[nome](args)
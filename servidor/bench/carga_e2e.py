@@ -0,0 +1,499 @@
+# Benchmarks de ponta a ponta com relógios simulados (bench/simulador.py)
+# - cliente: HexaProtocolClient direto contra o simulador; mede o handshake RA/EA,
+#   comandos um a um (RQ) e em pipeline (send_commands)
+# - api: servidor-henry.py completo (Flask + motor TCP + sessões + banco temporário)
+#   com N relógios simulados conectados na porta do motor; várias threads disparam
+#   POST /api/comando para relógios aleatórios
+# - registros: GET /api/registros (NDJSON) lendo os registros de ponto de um relógio
+# - workers: o mesmo POST /api/comando no modo de produção: um processo gateway
+#   (servidor-henry.py --gateway) e --workers processos HTTP (wsgi.py) falando com
+#   ele pelo socket Unix; as requisições são distribuídas entre as portas dos workers
+# - quedas: silencia 10% dos relógios (param de responder sem fechar o socket) no meio
+#   de uma carga de POST /api/comando, sem e com a detecção do motor (heartbeat a cada
+#   --heartbeat segundos, comandos seguidos sem resposta, inatividade); mostra quanto
+#   tempo as conexões mortas levam para cair e a latência das requisições no período
+# - fila: fila de comandos por relógio (sessoes.py) com poucos relógios e muitas threads:
+#   latência de comandos interativos com a coleta (RR) ocupando os relógios, com e sem
+#   prioridade; leituras idênticas agrupadas; recusas com a fila cheia
+# - cache: painéis consultando RC/RQ dos mesmos relógios por POST /api/comando, sem o
+#   cache de respostas (CACHE_RESPOSTAS), com ele vazio e com ele já preenchido; mostra
+#   as idas ao relógio em cada fase (os demais benchmarks da API enviam "cache": false
+#   para medir a ida ao relógio)
+# Cada benchmark mostra vazão, p50/p99 e a memória residente do processo;
+# --json grava os números num arquivo para comparar execuções (regressões)
+#
+# Uso: python bench/carga_e2e.py [cliente|api|registros ...] [--relogios 200] [--threads 32]
+#                                [--requisicoes 5000] [--latencia 0.002] [--jitter 0.001]
+#                                [--fragmentar] [--workers 4] [--heartbeat 1.0]
+#                                [--json resultados.json]
+import argparse
+import http.client
+import json
+import logging
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from werkzeug.serving import make_server  # noqa: E402
+
+from banco import BancoDados  # noqa: E402
+from carga_api import DIR_SERVIDOR, carregar_servidor, disparar, percentil, relatar  # noqa: E402
+from carga_motor import memoria_mb  # noqa: E402
+from gateway import ClienteGateway  # noqa: E402
+from hexa_client import HexaProtocolClient  # noqa: E402
+from simulador import Simulador  # noqa: E402
+
+
+# Imprime a linha do benchmark e retorna os números para o --json
+def resultado(nome, n, decorrido, latencias, erros):
+    relatar(nome, n, decorrido, latencias, erros)
+    return {
+        "por_segundo": round(n / decorrido, 1),
+        "p50_ms": round(percentil(latencias, 50), 3),
+        "p99_ms": round(percentil(latencias, 99), 3),
+        "erros": erros,
+        "rss_mb": round(memoria_mb(), 1),
+    }
+
+
+def criar_simulador(args, **extra):
+    simulador = Simulador(args.latencia, args.jitter, args.fragmentar, bits_rsa=args.bits_rsa, **extra)
+    simulador.iniciar()
+    return simulador
+
+
+def bench_cliente(args):
+    simulador = criar_simulador(args)
+    porta = simulador.executar(simulador.servir())
+    clientes = [HexaProtocolClient('127.0.0.1', porta) for _ in range(args.threads)]
+    for cliente in clientes:
+        if not cliente.connect():
+            raise RuntimeError("Simulador não aceitou a conexão.")
+
+    resultados = {}
+    print(f"HexaProtocolClient ({args.threads} conexões, latência {args.latencia * 1000:.1f} ms"
+          f" ± {args.jitter * 1000:.1f} ms{', fragmentado' if args.fragmentar else ''})")
+
+    def handshake(i):
+        if not clientes[i].authenticate('admin', '123'):
+            raise RuntimeError("Autenticação recusada.")
+
+    resultados["handshake"] = resultado("handshake RA/EA", args.threads, *disparar(handshake, args.threads, args.threads))
+
+    # Mesmo cliente autenticado de novo, agora com a chave pública guardada (só EA)
+    resultados["handshake_chave"] = resultado(
+        "handshake só EA", args.threads, *disparar(handshake, args.threads, args.threads))
+
+    def comando(i):
+        resposta = clientes[i % args.threads].send_command('RQ')
+        if resposta.status != '000':
+            raise RuntimeError(f"status {resposta.status}")
+
+    # Uma thread por cliente: o lock do socket serializa os comandos de cada conexão
+    resultados["comando"] = resultado("RQ um a um", args.requisicoes,
+                                      *disparar(comando, args.requisicoes, args.threads))
+
+    lote = [('RQ', '00', '')] * args.janela
+
+    def pipeline(i):
+        respostas = clientes[i % args.threads].send_commands(lote, window=args.janela)
+        if any(r.status != '000' for r in respostas):
+            raise RuntimeError("resposta com falha no lote")
+
+    n_lotes = max(1, args.requisicoes // args.janela)
+    decorrido, latencias, erros = disparar(pipeline, n_lotes, args.threads)
+    relatar(f"RQ em pipeline ({args.janela})", n_lotes * args.janela, decorrido, latencias, erros)
+    resultados["pipeline"] = {
+        "por_segundo": round(n_lotes * args.janela / decorrido, 1),
+        "p50_lote_ms": round(percentil(latencias, 50), 3),
+        "p99_lote_ms": round(percentil(latencias, 99), 3),
+        "erros": erros,
+    }
+
+    for cliente in clientes:
+        cliente.disconnect()
+    simulador.parar()
+    return resultados
+
+
+# Sobe o servidor completo num diretório temporário, com o motor e o HTTP em portas livres,
+# e conecta `relogios` relógios simulados
+# - motor: atributos do MotorTCP alterados antes de iniciar (ex.: inatividade)
+# - extra: argumentos do Simulador
+# Retorna (módulo do servidor, simulador, servidor HTTP, NS conectados)
+def subir_servidor(args, relogios, motor=None, **extra):
+    os.chdir(tempfile.mkdtemp(prefix="carga_e2e_"))
+    servidor = carregar_servidor()
+    servidor.motor.porta = 0
+    for nome, valor in (motor or {}).items():
+        setattr(servidor.motor, nome, valor)
+    servidor.init_db()
+    servidor.motor.iniciar()
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)  # Sem uma linha de log por requisição
+    http_servidor = make_server('127.0.0.1', 0, servidor.app, threaded=True)
+    threading.Thread(target=http_servidor.serve_forever, daemon=True).start()
+
+    memoria_inicial = memoria_mb()
+    simulador = criar_simulador(args, **extra)
+    inicio = time.perf_counter()
+    lista_ns = simulador.executar(simulador.conectar('127.0.0.1', servidor.motor.porta, relogios))
+    while len(servidor.registro) < len(lista_ns):
+        if time.perf_counter() - inicio > 60 + relogios / 10:
+            raise RuntimeError(f"Só {len(servidor.registro)} de {len(lista_ns)} relógios identificados.")
+        time.sleep(0.05)
+    print(f"  {len(lista_ns)} relógios identificados em {time.perf_counter() - inicio:.2f} s"
+          f" (+{memoria_mb() - memoria_inicial:.1f} MB)")
+
+    # Vínculos depois da identificação: todos os simulados saem do mesmo IP
+    for i, ns in enumerate(lista_ns):
+        servidor.banco.vincular(f"usuario{i % 50}", ns, "127.0.0.1")
+        servidor.registro.vincular(f"usuario{i % 50}", ns)
+    return servidor, simulador, http_servidor, lista_ns
+
+
+def encerrar_servidor(servidor, simulador, http_servidor):
+    http_servidor.shutdown()
+    simulador.parar()
+    servidor.motor.parar()
+
+
+def bench_api(args):
+    print(f"POST /api/comando ({args.relogios} relógios, {args.threads} threads, {args.requisicoes} requisições)")
+    servidor, simulador, http_servidor, lista_ns = subir_servidor(args, args.relogios)
+    porta = http_servidor.server_port
+
+    def requisicao(i):
+        indice = random.randrange(len(lista_ns))
+        corpo = json.dumps({"user_id": f"usuario{indice % 50}", "ns": lista_ns[indice], "comando": "RQ",
+                            "cache": False})
+        conexao = http.client.HTTPConnection('127.0.0.1', porta, timeout=30)
+        conexao.request('POST', '/api/comando', corpo, {'Content-Type': 'application/json'})
+        resposta = conexao.getresponse()
+        dados = json.loads(resposta.read())
+        conexao.close()
+        if resposta.status != 200 or dados.get("status") != "00":
+            raise RuntimeError(f"HTTP {resposta.status}: {dados}")
+
+    resultados = {"comando": resultado("/api/comando RQ", args.requisicoes,
+                                       *disparar(requisicao, args.requisicoes, args.threads))}
+    print(f"  sessões: {servidor.sessoes.estatisticas()}")
+    print(f"  simulador: {simulador.handshakes} handshakes, {simulador.comandos} comandos")
+    encerrar_servidor(servidor, simulador, http_servidor)
+    return resultados
+
+
+def bench_registros(args):
+    # Um download por relógio, todos ao mesmo tempo
+    quantidade = args.registros
+    relogios = min(args.relogios, args.threads)
+    print(f"GET /api/registros ({relogios} relógios, {quantidade} registros cada, página {args.pagina})")
+    servidor, simulador, http_servidor, lista_ns = subir_servidor(args, relogios, registros=quantidade)
+    porta = http_servidor.server_port
+
+    def download(i):
+        conexao = http.client.HTTPConnection('127.0.0.1', porta, timeout=120)
+        conexao.request('GET', f"/api/registros?userId=usuario{i % 50}&ns={lista_ns[i]}"
+                               f"&nsr_inicial=1&pagina={args.pagina}")
+        linhas = conexao.getresponse().read().splitlines()
+        conexao.close()
+        fim = json.loads(linhas[-1])
+        if fim.get("registros") != quantidade:
+            raise RuntimeError(f"download incompleto: {fim}")
+
+    decorrido, latencias, erros = disparar(download, len(lista_ns), len(lista_ns))
+    total = len(lista_ns) * quantidade
+    print(f"  {total / decorrido:>9.0f} registros/s   download p50 {percentil(latencias, 50):>8.1f} ms"
+          f"   p99 {percentil(latencias, 99):>8.1f} ms   erros {erros}   RSS {memoria_mb():.1f} MB")
+    encerrar_servidor(servidor, simulador, http_servidor)
+    return {"registros": {"por_segundo": round(total / decorrido, 1),
+                          "p50_ms": round(percentil(latencias, 50), 3),
+                          "p99_ms": round(percentil(latencias, 99), 3),
+                          "erros": erros, "rss_mb": round(memoria_mb(), 1)}}
+
+
+# Worker HTTP para o benchmark (em produção: gunicorn/uwsgi com wsgi:app)
+WORKER = (
+    "import sys\n"
+    "import logging\n"
+    "from werkzeug.serving import make_server\n"
+    "import wsgi\n"
+    "logging.getLogger('werkzeug').setLevel(logging.WARNING)\n"
+    "make_server('127.0.0.1', int(sys.argv[1]), wsgi.app, threaded=True).serve_forever()\n"
+)
+
+
+def porta_livre():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+# Aguarda condicao() ficar verdadeira (levanta RuntimeError depois de `limite` segundos)
+def aguardar(condicao, limite, descricao):
+    fim = time.monotonic() + limite
+    while not condicao():
+        if time.monotonic() > fim:
+            raise RuntimeError(f"Tempo esgotado aguardando {descricao}.")
+        time.sleep(0.05)
+
+
+def bench_workers(args):
+    print(f"POST /api/comando com gateway + {args.workers} workers ({args.relogios} relógios,"
+          f" {args.threads} threads, {args.requisicoes} requisições)")
+    diretorio = tempfile.mkdtemp(prefix="carga_workers_")
+    caminho_socket = os.path.join(diretorio, "gateway.sock")
+    porta_relogios = porta_livre()
+    processos = [subprocess.Popen(
+        [sys.executable, os.path.join(DIR_SERVIDOR, "servidor-henry.py"), "--gateway", caminho_socket,
+         "--porta-relogios", str(porta_relogios)], cwd=diretorio, env=dict(os.environ, HEXA_LOG_NIVEL="WARNING"))]
+    simulador = None
+    try:
+        aguardar(lambda: os.path.exists(caminho_socket), 30, "o gateway")
+        cliente = ClienteGateway(caminho_socket)
+        simulador = criar_simulador(args)
+        lista_ns = simulador.executar(simulador.conectar('127.0.0.1', porta_relogios, args.relogios))
+        aguardar(lambda: cliente.chamar("quantidade") >= len(lista_ns), 60 + args.relogios / 10,
+                 "a identificação dos relógios")
+        banco = BancoDados(os.path.join(diretorio, "sistema_henry.sqlite"))
+        for i, ns in enumerate(lista_ns):
+            banco.vincular(f"usuario{i % 50}", ns, "127.0.0.1")
+            cliente.chamar("vincular", f"usuario{i % 50}", ns)
+
+        portas = [porta_livre() for _ in range(args.workers)]
+        ambiente = dict(os.environ, HEXA_GATEWAY=caminho_socket, HEXA_LOG_NIVEL="WARNING",
+                        PYTHONPATH=DIR_SERVIDOR + os.pathsep + os.environ.get("PYTHONPATH", ""))
+        for porta in portas:
+            processos.append(subprocess.Popen([sys.executable, "-c", WORKER, str(porta)], cwd=diretorio, env=ambiente))
+
+        def aceitando(porta):
+            try:
+                socket.create_connection(('127.0.0.1', porta), timeout=1).close()
+                return True
+            except OSError:
+                return False
+
+        for porta in portas:
+            aguardar(lambda: aceitando(porta), 30, f"o worker na porta {porta}")
+
+        def requisicao(i):
+            indice = random.randrange(len(lista_ns))
+            corpo = json.dumps({"user_id": f"usuario{indice % 50}", "ns": lista_ns[indice], "comando": "RQ",
+                            "cache": False})
+            conexao = http.client.HTTPConnection('127.0.0.1', portas[i % len(portas)], timeout=30)
+            conexao.request('POST', '/api/comando', corpo, {'Content-Type': 'application/json'})
+            resposta = conexao.getresponse()
+            dados = json.loads(resposta.read())
+            conexao.close()
+            if resposta.status != 200 or dados.get("status") != "00":
+                raise RuntimeError(f"HTTP {resposta.status}: {dados}")
+
+        resultados = {"comando": resultado(f"{args.workers} workers", args.requisicoes,
+                                           *disparar(requisicao, args.requisicoes, args.threads))}
+        print(f"  sessões no gateway: {cliente.chamar('estatisticas_sessoes')}")
+        cliente.fechar()
+        return resultados
+    finally:
+        if simulador is not None:
+            simulador.parar()
+        for processo in processos:
+            processo.terminate()
+            processo.wait()
+
+
+def bench_quedas(args):
+    silenciar = max(1, args.relogios // 10)
+    n = max(1, args.requisicoes // 5)
+    print(f"POST /api/comando com {silenciar} de {args.relogios} relógios silenciados"
+          f" ({args.threads} threads, {n} requisições)")
+    resultados = {}
+    configuracoes = {
+        "sem_deteccao": {"intervalo_heartbeat": None, "inatividade": None, "max_timeouts": 0},
+        "com_deteccao": {"intervalo_heartbeat": args.heartbeat, "inatividade": 3 * args.heartbeat},
+    }
+    for nome, ajustes in configuracoes.items():
+        deteccao = ajustes["inatividade"] is not None
+        servidor, simulador, http_servidor, lista_ns = subir_servidor(args, args.relogios, ajustes, reconectar=True)
+        motor = servidor.motor
+        porta = http_servidor.server_port
+
+        def requisicao(i):
+            indice = random.randrange(len(lista_ns))
+            corpo = json.dumps({"user_id": f"usuario{indice % 50}", "ns": lista_ns[indice], "comando": "RQ",
+                            "cache": False})
+            conexao = http.client.HTTPConnection('127.0.0.1', porta, timeout=60)
+            conexao.request('POST', '/api/comando', corpo, {'Content-Type': 'application/json'})
+            resposta = conexao.getresponse()
+            dados = json.loads(resposta.read())
+            conexao.close()
+            if resposta.status != 200 or dados.get("status") != "00":
+                raise RuntimeError(f"HTTP {resposta.status}: {dados}")
+
+        silenciados = simulador.executar(simulador.silenciar(silenciar))
+        inicio = time.monotonic()
+        resultados[nome] = resultado(nome.replace("_", " "), n, *disparar(requisicao, n, args.threads))
+        if deteccao:
+            try:
+                aguardar(lambda: all(ns in simulador.desconexoes for ns in silenciados),
+                         10 * args.heartbeat + 10, "a detecção das conexões silenciadas")
+            except RuntimeError as e:
+                print(f"  {e}")
+        tempos = sorted(simulador.desconexoes[ns] - inicio for ns in silenciados if ns in simulador.desconexoes)
+        if tempos:
+            print(f"  detectados {len(tempos)}/{len(silenciados)}: mediana {tempos[len(tempos) // 2]:.2f} s,"
+                  f" máximo {tempos[-1]:.2f} s; {motor.heartbeats} heartbeats,"
+                  f" {simulador.reconexoes} reconexões")
+        else:
+            print(f"  detectados 0/{len(silenciados)}")
+        resultados[nome].update({
+            "detectados": len(tempos),
+            "deteccao_max_s": round(tempos[-1], 2) if tempos else None,
+        })
+        encerrar_servidor(servidor, simulador, http_servidor)
+    return resultados
+
+
+def bench_fila(args):
+    from sessoes import FilaCheia, PRIORIDADE_FUNDO, PRIORIDADE_INTERATIVA
+
+    relogios = 4
+    print(f"Fila por relógio ({relogios} relógios, latência {args.latencia * 1000:.1f} ms, {args.threads} threads)")
+    servidor, simulador, http_servidor, lista_ns = subir_servidor(args, relogios)
+    sessoes = servidor.sessoes
+    resultados = {}
+    n = max(1, args.requisicoes // 10)
+
+    # Coleta em segundo plano: páginas RR seguidas em todos os relógios
+    parar = threading.Event()
+
+    def coleta(i):
+        ns = lista_ns[i % relogios]
+        while not parar.is_set():
+            sessoes.executar(ns, 'RR', dados=f"N]{args.pagina}]{random.randint(1, 500)}", prioridade=PRIORIDADE_FUNDO)
+
+    for nome, prioridade in (("mesma_prioridade", PRIORIDADE_FUNDO), ("com_prioridade", PRIORIDADE_INTERATIVA)):
+        parar.clear()
+        coletores = [threading.Thread(target=coleta, args=(i,), daemon=True) for i in range(relogios * 4)]
+        for thread in coletores:
+            thread.start()
+
+        # Dados distintos por requisição: sem agrupamento, cada uma espera a vez na fila
+        def interativo(i):
+            sessoes.executar(lista_ns[i % relogios], 'RQ', dados=str(i), prioridade=prioridade)
+
+        resultados[nome] = resultado(f"RQ {nome.replace('_', ' ')}", n,
+                                     *disparar(interativo, n, min(args.threads, relogios * 4)))
+        parar.set()
+        for thread in coletores:
+            thread.join()
+
+    # Leituras idênticas ao mesmo relógio: uma ida ao relógio atende várias chamadas
+    antes_comandos, antes_agrupados = simulador.comandos, sessoes.agrupados
+    resultados["agrupamento"] = resultado(
+        "RQ idênticos", n, *disparar(lambda i: sessoes.executar(lista_ns[0], 'RQ'), n, args.threads))
+    comandos = simulador.comandos - antes_comandos
+    print(f"  {n} chamadas, {comandos} comandos no relógio, {sessoes.agrupados - antes_agrupados} agrupadas")
+    resultados["agrupamento"]["comandos_relogio"] = comandos
+
+    # Fila cheia: recusa imediata em vez de mais uma thread esperando
+    sessoes.max_fila = 4
+    for sessao in list(sessoes._sessoes.values()):
+        sessao.fila.maximo = 4
+    recusas = []
+
+    def rajada(i):
+        try:
+            sessoes.executar(lista_ns[0], 'RQ', dados=str(i))
+        except FilaCheia:
+            recusas.append(i)
+
+    resultados["fila_cheia"] = resultado("rajada com fila 4", n, *disparar(rajada, n, args.threads))
+    print(f"  {len(recusas)} de {n} recusadas com a fila cheia")
+    resultados["fila_cheia"]["recusadas"] = len(recusas)
+    encerrar_servidor(servidor, simulador, http_servidor)
+    return resultados
+
+
+def bench_cache(args):
+    relogios = min(args.relogios, 20)
+    print(f"POST /api/comando RC/RQ de painéis ({relogios} relógios, {args.threads} threads,"
+          f" {args.requisicoes} requisições por fase)")
+    servidor, simulador, http_servidor, lista_ns = subir_servidor(args, relogios)
+    porta = http_servidor.server_port
+    resultados = {}
+    # sem_cache: toda leitura vai ao relógio; com_cache_frio: começa com o cache vazio
+    # (as respostas guardadas na fase anterior são descartadas); com_cache_quente: mesma
+    # carga logo em seguida, com o cache já preenchido (regime estável, limitado pelo TTL)
+    for nome, usar_cache in (("sem_cache", False), ("com_cache_frio", True), ("com_cache_quente", True)):
+        if nome == "com_cache_frio":
+            servidor.sessoes.cache_respostas.limpar()
+        antes = simulador.comandos
+        acertos = []
+
+        def requisicao(i):
+            indice = random.randrange(len(lista_ns))
+            corpo = json.dumps({"user_id": f"usuario{indice % 50}", "ns": lista_ns[indice],
+                                "comando": random.choice(("RC", "RQ")), "cache": usar_cache})
+            conexao = http.client.HTTPConnection('127.0.0.1', porta, timeout=30)
+            conexao.request('POST', '/api/comando', corpo, {'Content-Type': 'application/json'})
+            resposta = conexao.getresponse()
+            dados = json.loads(resposta.read())
+            if resposta.getheader('X-Cache') == 'HIT':
+                acertos.append(i)
+            conexao.close()
+            if resposta.status != 200 or dados.get("status") != "00":
+                raise RuntimeError(f"HTTP {resposta.status}: {dados}")
+
+        resultados[nome] = resultado(nome.replace("_", " "), args.requisicoes,
+                                     *disparar(requisicao, args.requisicoes, args.threads))
+        comandos = simulador.comandos - antes
+        print(f"  {comandos} comandos no relógio, {len(acertos)} respostas do cache")
+        resultados[nome].update({"comandos_relogio": comandos, "hits": len(acertos)})
+    encerrar_servidor(servidor, simulador, http_servidor)
+    return resultados
+
+
+BENCHMARKS = {
+    'cliente': bench_cliente,
+    'api': bench_api,
+    'registros': bench_registros,
+    'workers': bench_workers,
+    'quedas': bench_quedas,
+    'fila': bench_fila,
+    'cache': bench_cache,
+}
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('benchmarks', nargs='*', help=f"um ou mais de: {', '.join(BENCHMARKS)} (padrão: todos)")
+    parser.add_argument('--relogios', type=int, default=200)
+    parser.add_argument('--threads', type=int, default=32)
+    parser.add_argument('--requisicoes', type=int, default=5000)
+    parser.add_argument('--janela', type=int, default=8, help="comandos em voo no pipeline")
+    parser.add_argument('--registros', type=int, default=5000, help="registros de ponto por relógio")
+    parser.add_argument('--pagina', type=int, default=100, help="registros por comando RR")
+    parser.add_argument('--latencia', type=float, default=0.002, help="segundos por resposta do relógio")
+    parser.add_argument('--jitter', type=float, default=0.001)
+    parser.add_argument('--fragmentar', action='store_true', help="relógios enviam as respostas em pedaços")
+    parser.add_argument('--bits-rsa', type=int, default=2048)
+    parser.add_argument('--workers', type=int, default=4, help="processos HTTP no benchmark workers")
+    parser.add_argument('--heartbeat', type=float, default=1.0,
+                        help="segundos ociosos até o heartbeat no benchmark quedas")
+    parser.add_argument('--json', help="arquivo onde gravar os resultados")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+
+    resultados = {}
+    for nome in args.benchmarks or BENCHMARKS:
+        if nome not in BENCHMARKS:
+            parser.error(f"benchmark desconhecido: {nome}")
+        resultados[nome] = BENCHMARKS[nome](args)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({"argumentos": vars(args), "resultados": resultados}, f, indent=2)
@@ -0,0 +1,96 @@
+# Teste de carga do motor TCP da porta 3000
+# - Sobe um MotorTCP numa porta livre
+# - Conecta N relógios simulados (asyncio) que respondem cada pacote com um eco
+# - Envia um comando para cada relógio em paralelo
+# - Mostra conexões, threads, memória e tempo de ida e volta
+#
+# Uso: python bench/carga_motor.py [--relogios 5000]
+import argparse
+import asyncio
+import os
+import resource
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from hexa_client import HexaProtocolClient  # noqa: E402
+from motor_tcp import MotorTCP  # noqa: E402
+
+
+# Memória residente atual do processo em MB (Linux), ou o pico quando /proc não existe
+def memoria_mb():
+    try:
+        with open('/proc/self/status') as f:
+            for linha in f:
+                if linha.startswith('VmRSS:'):
+                    return int(linha.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+# Relógio simulado: lê pacotes HEXA e devolve o mesmo pacote
+async def relogio_eco(porta, conectados):
+    reader, writer = await asyncio.open_connection('127.0.0.1', porta)
+    conectados.append(writer)
+    try:
+        while True:
+            cabecalho = await reader.readexactly(3)
+            resto = await reader.readexactly(int.from_bytes(cabecalho[1:3], 'little') + 2)
+            writer.write(cabecalho + resto)
+    except (asyncio.IncompleteReadError, ConnectionError):
+        pass
+
+
+async def principal(n_relogios):
+    # Cada relógio usa dois descritores (lado cliente e lado servidor)
+    suave, rigido = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (min(rigido, max(suave, 2 * n_relogios + 256)), rigido))
+
+    memoria_inicial = memoria_mb()
+    motor = MotorTCP(host='127.0.0.1', porta=0, backlog=n_relogios)
+    motor.iniciar()
+
+    conectados = []
+    tarefas = []
+    inicio = time.perf_counter()
+    for _ in range(n_relogios):
+        tarefas.append(asyncio.create_task(relogio_eco(motor.porta, conectados)))
+        if len(tarefas) % 500 == 0:
+            await asyncio.sleep(0)
+    while len(motor.ativas) < n_relogios:
+        await asyncio.sleep(0.05)
+    tempo_conexao = time.perf_counter() - inicio
+
+    # Os simulados conectam todos a partir de 127.0.0.1, então usa o conjunto de conexões ativas
+    conexoes = list(motor.ativas)
+    pacote = HexaProtocolClient('bench')._build_packet("RQ")
+
+    async def disparar():
+        return await asyncio.gather(*(c.send_command(pacote) for c in conexoes))
+
+    inicio = time.perf_counter()
+    respostas = await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(disparar(), motor.loop))
+    tempo_comandos = time.perf_counter() - inicio
+
+    print(f"Relógios conectados:       {len(motor.ativas)}")
+    print(f"Threads no processo:       {threading.active_count()}")
+    print(f"Memória (RSS):             {memoria_mb():.1f} MB (+{memoria_mb() - memoria_inicial:.1f} MB)")
+    print(f"Tempo para conectar todos: {tempo_conexao:.2f} s")
+    print(f"Comandos respondidos:      {sum(1 for r in respostas if r == pacote)}/{len(conexoes)}"
+          f" em {tempo_comandos:.2f} s ({len(conexoes) / tempo_comandos:.0f} cmd/s)")
+
+    for writer in conectados:
+        writer.close()
+    for tarefa in tarefas:
+        tarefa.cancel()
+    motor.parar()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--relogios', type=int, default=5000)
+    args = parser.parse_args()
+    asyncio.run(principal(args.relogios))
@@ -0,0 +1,361 @@
+# Simulador local de relógios HEXA
+# - Fala o protocolo completo: pacotes [0x02][tamanho][payload][checksum][0x03],
+#   handshake RA/EA com uma chave RSA real e sessão AES-CBC com padding de zeros
+# - Comandos: RC (NS e configurações), RQ (quantidades), RR (registros de ponto);
+#   qualquer outro comando é respondido com STATUS_COMANDO_INVALIDO
+# - Latência e jitter configuráveis por resposta, e respostas fragmentadas em
+#   pedaços aleatórios (exercita a remontagem de pacotes do lado do servidor)
+# - Um único event loop atende milhares de relógios virtuais, que podem:
+#   - conectar na porta 3000 do servidor, como os relógios reais (conectar)
+#   - aceitar conexões, para testar o HexaProtocolClient direto (servir)
+# - Falhas: relógios silenciados param de responder sem fechar o socket (conexão
+#   meio-aberta); com reconectar=True, relógios desconectados voltam com backoff
+#   exponencial e jitter, como os equipamentos reais
+#
+# Uso: python bench/simulador.py [--host 127.0.0.1] [--porta 3000] [--relogios 1000]
+#                                 [--latencia 0.005] [--jitter 0.002] [--fragmentar]
+import argparse
+import asyncio
+import base64
+import logging
+import os
+import random
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cryptography.hazmat.primitives.asymmetric import padding as asym_padding, rsa  # noqa: E402
+
+from hexa_client import AesSessionCipher, HexaFramer, HexaProtocolClient, backoff_delay  # noqa: E402
+
+logger = logging.getLogger("simulador")
+
+STATUS_OK = "000"
+STATUS_SESSAO_EXPIRADA = "005"
+STATUS_CREDENCIAIS_INVALIDAS = "011"
+STATUS_COMANDO_INVALIDO = "012"
+
+# Registros de ponto devolvidos no máximo por comando RR
+MAX_REGISTROS_RR = 1000
+
+# Montagem dos pacotes (mesmo enquadramento do cliente)
+_enquadrador = HexaProtocolClient('simulador')
+
+
+# Um relógio virtual numa conexão TCP
+# - ns: número de série devolvido em RC NS
+# - simulador: configuração compartilhada (latência, chave RSA, credenciais...)
+# - destino: (host, porta) a que o relógio se conectou (None se a conexão foi aceita)
+class RelogioSimulado(asyncio.BufferedProtocol):
+    def __init__(self, simulador, ns, destino=None):
+        self.simulador = simulador
+        self.ns = ns
+        self.destino = destino
+        self.silenciado = False       # Lê e descarta tudo sem responder (meio-aberto)
+        self.transport = None
+        self._framer = HexaFramer()
+        self._cifra = None            # AesSessionCipher depois de um EA aceito
+        self._sessao_inicio = None    # Instante (monotonic) do EA aceito
+        self._ultima_saida = 0.0      # Instante previsto da última resposta (mantém a ordem)
+        self.criado_em = time.time()
+
+    def connection_made(self, transport):
+        self.transport = transport
+        self.simulador.conectados.add(self)
+
+    def connection_lost(self, exc):
+        self.simulador.conectados.discard(self)
+        self.simulador._ao_desconectar(self)
+
+    def get_buffer(self, sizehint):
+        return self._framer.get_buffer(sizehint)
+
+    def buffer_updated(self, nbytes):
+        self._framer.commit(nbytes)
+        if self.silenciado:
+            self._framer.clear()
+            return
+        for pacote in self._framer.frames():
+            try:
+                self._tratar(bytes(pacote[3:-2]))
+            except Exception:
+                logger.exception("Relógio simulado %s: pacote inválido", self.ns)
+
+    # Quantidade de registros de ponto gerados até agora
+    def total_registros(self):
+        novos = (time.time() - self.criado_em) * self.simulador.batidas_por_segundo
+        return self.simulador.registros + int(novos)
+
+    def _tratar(self, payload):
+        sim = self.simulador
+        sim.pacotes += 1
+        if payload[2:3] == b'+' and payload[3:6] in (b'RA+', b'EA+'):
+            indice, comando, _, dados = (payload.decode('ascii').split('+', 3) + [''])[:4]
+            if comando == 'RA':
+                self._cifra = None
+                self._responder(indice, 'RA', STATUS_OK, sim.chave_ra, cifrar=False)
+            else:
+                self._autenticar(indice, dados)
+            return
+
+        if self._cifra is None:
+            # Pacote cifrado sem sessão: o relógio real pede nova autenticação
+            self._responder("00", "??", STATUS_SESSAO_EXPIRADA, "", cifrar=False)
+            return
+        texto = self._cifra.decrypt(payload).rstrip(b'\x00').decode('utf-8')
+        indice, comando, _, dados = (texto.split('+', 3) + [''])[:4]
+        if sim.sessao_segundos is not None and time.monotonic() - self._sessao_inicio > sim.sessao_segundos:
+            self._responder(indice, comando, STATUS_SESSAO_EXPIRADA, "", cifrar=False)
+            self._cifra = None
+            return
+        status, resposta = self._executar(comando, dados)
+        sim.comandos += 1
+        self._responder(indice, comando, status, resposta)
+
+    # EA: credenciais "1]usuario]senha]chave_aes_b64" cifradas com a chave pública
+    def _autenticar(self, indice, dados):
+        sim = self.simulador
+        try:
+            claro = sim.chave_privada.decrypt(base64.b64decode(dados), asym_padding.PKCS1v15())
+            _, usuario, senha, chave_b64 = claro.decode('utf-8').split(']', 3)
+            chave_aes = base64.b64decode(chave_b64)
+        except Exception:
+            self._responder(indice, 'EA', STATUS_CREDENCIAIS_INVALIDAS, "chave", cifrar=False)
+            return
+        if (usuario, senha) != sim.credenciais:
+            self._responder(indice, 'EA', STATUS_CREDENCIAIS_INVALIDAS, "usuario", cifrar=False)
+            return
+        sim.handshakes += 1
+        self._cifra = AesSessionCipher(chave_aes)
+        self._sessao_inicio = time.monotonic()
+        self._responder(indice, 'EA', STATUS_OK, "", cifrar=False)
+
+    # Retorna (status, dados) da resposta a um comando autenticado
+    def _executar(self, comando, dados):
+        if comando == 'RC':
+            if dados == 'NS':
+                return STATUS_OK, f"NS[{self.ns}]"
+            return STATUS_OK, f"NS[{self.ns}]MODELO[HEXA SIMULADO]"
+        if comando == 'RQ':
+            return STATUS_OK, f"U[{self.simulador.usuarios}]R[{self.total_registros()}]"
+        if comando == 'RR':
+            return STATUS_OK, self._registros(dados)
+        return STATUS_COMANDO_INVALIDO, comando
+
+    # RR "N]<quantidade>]<nsr inicial>": nsr]tipo]data]hora]pis por registro
+    def _registros(self, dados):
+        try:
+            _, quantidade, inicio = dados.split(']')[:3]
+            quantidade, inicio = min(int(quantidade), MAX_REGISTROS_RR), max(int(inicio), 1)
+        except ValueError:
+            return ""
+        fim = min(inicio + quantidade - 1, self.total_registros())
+        campos = []
+        for nsr in range(inicio, fim + 1):
+            minutos = nsr % 1440
+            campos.append(f"{nsr}]3]{1 + nsr // 1440 % 28:02d}012024]{minutos // 60:02d}{minutos % 60:02d}]{nsr:012d}")
+        return "]".join(campos) + ("]" if campos else "")
+
+    # Monta o pacote de resposta e o envia depois da latência simulada
+    def _responder(self, indice, comando, status, dados, cifrar=True):
+        payload = f"{indice}+{comando}+{status}"
+        if dados:
+            payload += f"+{dados}"
+        payload = payload.encode('utf-8')
+        if cifrar and self._cifra is not None:
+            payload = self._cifra.encrypt(payload)
+        pacote = _enquadrador._frame_payload(payload)
+
+        sim = self.simulador
+        atraso = max(0.0, sim.latencia + random.uniform(-sim.jitter, sim.jitter))
+        loop = asyncio.get_running_loop()
+        # Respostas saem na ordem em que os comandos chegaram, mesmo com jitter
+        saida = max(loop.time() + atraso, self._ultima_saida)
+        self._ultima_saida = saida
+        if sim.fragmentar and len(pacote) > 1:
+            cortes = sorted(random.sample(range(1, len(pacote)), min(3, len(pacote) - 1)))
+            pedacos = [pacote[i:j] for i, j in zip([0] + cortes, cortes + [len(pacote)])]
+            for n, pedaco in enumerate(pedacos):
+                loop.call_at(saida + n * 0.0005, self._escrever, pedaco)
+            self._ultima_saida = saida + len(pedacos) * 0.0005
+        elif atraso or saida > loop.time():
+            loop.call_at(saida, self._escrever, pacote)
+        else:
+            self._escrever(pacote)
+
+    def _escrever(self, dados):
+        if self.transport is not None and not self.transport.is_closing():
+            self.transport.write(dados)
+
+
+# Frota de relógios simulados num event loop próprio
+# Parâmetros:
+# - latencia / jitter: atraso (segundos) de cada resposta, latencia ± jitter
+# - fragmentar: envia cada resposta em até 4 pedaços
+# - registros: registros de ponto existentes ao conectar; batidas_por_segundo: novos por segundo
+# - credenciais: (usuario, senha) aceitos no EA
+# - sessao_segundos: validade da sessão AES (None = não expira); depois dela responde 005
+# - bits_rsa: tamanho da chave RSA (uma chave para toda a frota)
+# - prefixo_ns: NS dos relógios = prefixo + número sequencial
+# - reconectar: relógios conectados com conectar() voltam a se conectar, com o mesmo NS,
+#   quando o servidor fecha a conexão (espera de backoff_delay entre as tentativas)
+class Simulador:
+    def __init__(self, latencia=0.0, jitter=0.0, fragmentar=False, registros=1000, batidas_por_segundo=0.0,
+                 credenciais=("admin", "123"), sessao_segundos=None, bits_rsa=2048, prefixo_ns="SIM",
+                 usuarios=5, reconectar=False):
+        self.latencia = latencia
+        self.jitter = jitter
+        self.fragmentar = fragmentar
+        self.registros = registros
+        self.batidas_por_segundo = batidas_por_segundo
+        self.credenciais = tuple(credenciais)
+        self.sessao_segundos = sessao_segundos
+        self.prefixo_ns = prefixo_ns
+        self.usuarios = usuarios
+        self.reconectar = reconectar
+        self.chave_privada = rsa.generate_private_key(public_exponent=65537, key_size=bits_rsa)
+        numeros = self.chave_privada.public_key().public_numbers()
+        self.chave_ra = "]".join(base64.b64encode(v.to_bytes((v.bit_length() + 7) // 8, 'big')).decode('ascii')
+                                 for v in (numeros.n, numeros.e))
+        self.conectados = set()
+        self.loop = None
+        self._thread = None
+        self._servidores = []
+        self._proximo = 0
+        self._encerrando = False
+
+        # Contadores
+        self.pacotes = 0
+        self.comandos = 0
+        self.handshakes = 0
+        self.reconexoes = 0
+        self.desconexoes = {}  # ns -> instante (monotonic) em que o servidor fechou a conexão
+
+    def proximo_ns(self):
+        self._proximo += 1
+        return f"{self.prefixo_ns}{self._proximo:08d}"
+
+    # Conecta `quantidade` relógios em host:porta (o servidor da porta 3000)
+    # Retorna a lista de NS conectados
+    async def conectar(self, host, porta, quantidade, simultaneas=200):
+        limite = asyncio.Semaphore(simultaneas)
+        loop = asyncio.get_running_loop()
+
+        async def um():
+            ns = self.proximo_ns()
+            async with limite:
+                await loop.create_connection(lambda: RelogioSimulado(self, ns, (host, porta)), host, porta)
+            return ns
+
+        return await asyncio.gather(*(um() for _ in range(quantidade)))
+
+    # Conexão fechada: registra o instante e, se configurado, agenda a reconexão
+    def _ao_desconectar(self, relogio):
+        if self._encerrando:
+            return
+        self.desconexoes[relogio.ns] = time.monotonic()
+        if self.reconectar and relogio.destino is not None:
+            asyncio.get_running_loop().create_task(self._reconectar(relogio.ns, relogio.destino))
+
+    async def _reconectar(self, ns, destino):
+        loop = asyncio.get_running_loop()
+        tentativa = 0
+        while not self._encerrando:
+            await asyncio.sleep(backoff_delay(tentativa, base=0.1, cap=5.0))
+            try:
+                await loop.create_connection(lambda: RelogioSimulado(self, ns, destino), *destino)
+                self.reconexoes += 1
+                return
+            except OSError:
+                tentativa += 1
+
+    # Silencia `quantidade` relógios conectados: param de responder sem fechar o
+    # socket, como um equipamento travado ou um link que caiu sem FIN
+    # Retorna os NS silenciados
+    async def silenciar(self, quantidade):
+        ativos = [r for r in self.conectados if not r.silenciado][:quantidade]
+        for relogio in ativos:
+            relogio.silenciado = True
+        return [r.ns for r in ativos]
+
+    # Aceita conexões em host:porta; cada conexão é um relógio novo
+    # Retorna a porta aberta (útil com porta=0)
+    async def servir(self, host='127.0.0.1', porta=0):
+        servidor = await asyncio.get_running_loop().create_server(
+            lambda: RelogioSimulado(self, self.proximo_ns()), host, porta, backlog=1024)
+        self._servidores.append(servidor)
+        return servidor.sockets[0].getsockname()[1]
+
+    # Fecha as conexões dos relógios (os servidores continuam aceitando)
+    async def desconectar(self):
+        for relogio in list(self.conectados):
+            relogio.transport.close()
+
+    # Inicia o event loop numa thread daemon (uso junto com código síncrono)
+    def iniciar(self):
+        pronto = threading.Event()
+
+        def rodar():
+            self.loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(self.loop)
+            self.loop.call_soon(pronto.set)
+            self.loop.run_forever()
+
+        self._thread = threading.Thread(target=rodar, name="simulador", daemon=True)
+        self._thread.start()
+        pronto.wait()
+
+    # Executa uma corrotina no event loop do simulador e aguarda o resultado
+    def executar(self, corrotina):
+        return asyncio.run_coroutine_threadsafe(corrotina, self.loop).result()
+
+    def parar(self):
+        if self.loop is None:
+            return
+
+        self._encerrando = True
+
+        async def encerrar():
+            for servidor in self._servidores:
+                servidor.close()
+            await self.desconectar()
+
+        self.executar(encerrar())
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join()
+        self.loop = None
+
+
+async def principal(args):
+    simulador = Simulador(args.latencia, args.jitter, args.fragmentar, args.registros, args.batidas,
+                          (args.usuario, args.senha), bits_rsa=args.bits_rsa)
+    await simulador.conectar(args.host, args.porta, args.relogios)
+    logger.info("%d relógios simulados conectados em %s:%s", len(simulador.conectados), args.host, args.porta)
+    while simulador.conectados:
+        await asyncio.sleep(5)
+        logger.info("%d conectados, %d handshakes, %d comandos",
+                    len(simulador.conectados), simulador.handshakes, simulador.comandos)
+    logger.info("Todos os relógios simulados foram desconectados.")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--porta', type=int, default=3000)
+    parser.add_argument('--relogios', type=int, default=100)
+    parser.add_argument('--latencia', type=float, default=0.0, help="segundos por resposta")
+    parser.add_argument('--jitter', type=float, default=0.0, help="variação (segundos) da latência")
+    parser.add_argument('--fragmentar', action='store_true', help="envia cada resposta em pedaços")
+    parser.add_argument('--registros', type=int, default=1000, help="registros de ponto iniciais por relógio")
+    parser.add_argument('--batidas', type=float, default=0.0, help="registros novos por segundo, por relógio")
+    parser.add_argument('--usuario', default='admin')
+    parser.add_argument('--senha', default='123')
+    parser.add_argument('--bits-rsa', type=int, default=2048)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    try:
+        asyncio.run(principal(args))
+    except KeyboardInterrupt:
+        pass
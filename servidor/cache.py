@@ -0,0 +1,80 @@
+# Cache em memória LRU com validade (TTL)
+# - Usado para permissões e credenciais dos relógios, que só mudam via /api/vincular,
+#   e para respostas de comandos de leitura (validade por comando)
+# - Invalidação por chave; uma leitura feita antes de uma invalidação não é guardada
+#   depois dela (contador de gerações), evitando repor um valor antigo
+import threading
+import time
+from collections import OrderedDict
+
+
+# Parâmetros:
+# - maximo: quantidade máxima de entradas (as menos usadas saem primeiro)
+# - ttl: segundos de validade de cada entrada (None = sem expiração)
+class CacheLRU:
+    def __init__(self, maximo=10000, ttl=300.0):
+        self.maximo = maximo
+        self.ttl = ttl
+        self._dados = OrderedDict()  # chave -> (valor, expira_em)
+        self._lock = threading.Lock()
+        self._geracao = 0
+
+        # Contadores expostos em estatisticas()
+        self.hits = 0
+        self.misses = 0
+        self.invalidacoes = 0
+
+    # Retorna (encontrado, valor); entradas vencidas contam como miss
+    def obter(self, chave):
+        with self._lock:
+            item = self._dados.get(chave)
+            if item is not None and (item[1] is None or item[1] > time.monotonic()):
+                self._dados.move_to_end(chave)
+                self.hits += 1
+                return True, item[0]
+            if item is not None:
+                del self._dados[chave]
+            self.misses += 1
+            return False, None
+
+    # Geração atual; passe para guardar() o valor lido antes de consultar a origem
+    def geracao(self):
+        return self._geracao
+
+    # Guarda o valor, a menos que tenha havido invalidação depois de 'geracao'
+    # - ttl: validade desta entrada (padrão: a do cache)
+    def guardar(self, chave, valor, geracao=None, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        expira_em = time.monotonic() + ttl if ttl is not None else None
+        with self._lock:
+            if geracao is not None and geracao != self._geracao:
+                return
+            self._dados[chave] = (valor, expira_em)
+            self._dados.move_to_end(chave)
+            while len(self._dados) > self.maximo:
+                self._dados.popitem(last=False)
+
+    def invalidar(self, chave):
+        with self._lock:
+            self._geracao += 1
+            self.invalidacoes += 1
+            self._dados.pop(chave, None)
+
+    def limpar(self):
+        with self._lock:
+            self._geracao += 1
+            self._dados.clear()
+
+    def __len__(self):
+        return len(self._dados)
+
+    # Retorna os contadores de uso do cache
+    def estatisticas(self):
+        total = self.hits + self.misses
+        return {
+            "entradas": len(self._dados),
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidacoes": self.invalidacoes,
+            "taxa_hit": round(self.hits / total, 4) if total else 0.0,
+        }
@@ -0,0 +1,349 @@
+# Vários gateways de relógios (nós) atendendo a mesma frota
+# - Cada nó tem a própria porta de relógios e o próprio endereço de atendimento
+#   (gateway.py); os relógios são distribuídos entre os nós pela configuração de
+#   IP/porta de cada equipamento ou por um balanceador TCP na frente deles
+# - Cada nó anuncia num diretório compartilhado os NS que tem conectados
+#   (AnuncioNo, numa thread própria: o event loop do motor nunca espera o banco)
+# - Os workers HTTP consultam o diretório para saber qual nó é dono de cada NS
+#   (RoteadorGateways) e falam com esse nó; RegistroCluster e SessoesCluster têm
+#   a mesma interface que RegistroRelogios e GerenciadorSessoes
+# - Um anel de hash consistente indica o nó preferido de cada NS; relógios fora do
+#   nó preferido aparecem como sugestões de rebalanceamento (GET /api/cluster).
+#   Com nós entrando ou saindo, só ~1/N dos relógios muda de nó preferido
+# - O diretório padrão usa as tabelas nos_gateway/relogios_no do SQLite do servidor
+#   (DiretorioSQLite); outro armazenamento só precisa implementar os mesmos métodos
+# - Só numa máquina: o SQLite em WAL não funciona em sistema de arquivos de rede
+#   (NFS, SMB) e o canal TCP do gateway não tem autenticação (gateway.py); nós e
+#   workers ficam no mesmo host, com os gateways em 127.0.0.1 (ou sockets Unix)
+import bisect
+import hashlib
+import logging
+import threading
+import time
+
+from cache import CacheLRU
+from gateway import ClienteGateway, ErroGateway, RegistroRemoto, SessoesRemotas
+from sessoes import PRIORIDADE_INTERATIVA, PRIORIDADE_TRANSFERENCIA
+
+logger = logging.getLogger("cluster")
+
+# Segundos entre anúncios de um nó; um nó sem anunciar por VALIDADE_NO segundos
+# é considerado fora do ar (os relógios dele deixam de ser roteados)
+INTERVALO_ANUNCIO = 2.0
+VALIDADE_NO = 10.0
+
+
+def _hash(texto):
+    return int.from_bytes(hashlib.blake2b(texto.encode('utf-8'), digest_size=8).digest(), 'big')
+
+
+# Anel de hash consistente
+# Parâmetros:
+# - nos: identificadores dos nós
+# - replicas: pontos de cada nó no anel (mais pontos = distribuição mais uniforme)
+class AnelConsistente:
+    def __init__(self, nos, replicas=64):
+        pontos = sorted((_hash(f"{no}#{i}"), no) for no in nos for i in range(replicas))
+        self._posicoes = [p for p, _ in pontos]
+        self._nos = [no for _, no in pontos]
+
+    # Nó preferido para a chave (None se o anel estiver vazio)
+    def no_para(self, chave):
+        if not self._nos:
+            return None
+        i = bisect.bisect(self._posicoes, _hash(chave)) % len(self._nos)
+        return self._nos[i]
+
+
+# Diretório compartilhado no SQLite (mesmo arquivo do servidor, num disco local:
+# o WAL depende de memória compartilhada entre os processos do mesmo host)
+# - nos_gateway: um registro por nó, com o endereço de atendimento e o último anúncio
+# - relogios_no: NS -> nó que tem o relógio conectado
+class DiretorioSQLite:
+    def __init__(self, banco, validade=VALIDADE_NO):
+        self.pool = banco.pool
+        self.validade = validade
+
+    def init_db(self):
+        with self.pool.conexao() as conn, conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS nos_gateway (
+                    no_id TEXT PRIMARY KEY,
+                    endereco TEXT NOT NULL,
+                    anunciado_em REAL NOT NULL
+                )
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS relogios_no (
+                    relogio_ns TEXT PRIMARY KEY,
+                    no_id TEXT NOT NULL,
+                    atualizado_em REAL NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_relogios_no_no ON relogios_no (no_id)")
+
+    # Atualiza o anúncio do nó e aplica as entradas/saídas de NS numa transação
+    # Um NS que mudou de nó fica com o anúncio mais recente; a saída só apaga a
+    # linha se ela ainda for deste nó
+    # - completo: entraram é a lista inteira de NS do nó; as linhas anteriores do nó
+    #   (ex.: de antes de reiniciar com o mesmo ID) são apagadas antes
+    def anunciar(self, no_id, endereco, entraram=(), sairam=(), completo=False):
+        agora = time.time()
+        with self.pool.conexao() as conn, conn:
+            conn.execute("INSERT OR REPLACE INTO nos_gateway (no_id, endereco, anunciado_em) VALUES (?, ?, ?)",
+                         (no_id, endereco, agora))
+            if completo:
+                conn.execute("DELETE FROM relogios_no WHERE no_id = ?", (no_id,))
+            conn.executemany("INSERT OR REPLACE INTO relogios_no (relogio_ns, no_id, atualizado_em) VALUES (?, ?, ?)",
+                             [(ns, no_id, agora) for ns in entraram])
+            conn.executemany("DELETE FROM relogios_no WHERE relogio_ns = ? AND no_id = ?",
+                             [(ns, no_id) for ns in sairam])
+
+    # Retira o nó e todos os NS dele (desligamento normal)
+    def retirar(self, no_id):
+        with self.pool.conexao() as conn, conn:
+            conn.execute("DELETE FROM relogios_no WHERE no_id = ?", (no_id,))
+            conn.execute("DELETE FROM nos_gateway WHERE no_id = ?", (no_id,))
+
+    # Nós no ar: {no_id: endereco}
+    def nos_ativos(self):
+        with self.pool.conexao() as conn:
+            return dict(conn.execute("SELECT no_id, endereco FROM nos_gateway WHERE anunciado_em > ?",
+                                     (time.time() - self.validade,)).fetchall())
+
+    # (no_id, endereco) do nó que tem o relógio conectado, ou None
+    def no_do_relogio(self, ns):
+        with self.pool.conexao() as conn:
+            return conn.execute("""
+                SELECT r.no_id, n.endereco FROM relogios_no r JOIN nos_gateway n ON n.no_id = r.no_id
+                WHERE r.relogio_ns = ? AND n.anunciado_em > ?
+            """, (ns, time.time() - self.validade)).fetchone()
+
+    # {ns: no_id} dos relógios conectados em nós no ar (só entre lista_ns, se informada)
+    def relogios(self, lista_ns=None):
+        limite = time.time() - self.validade
+        with self.pool.conexao() as conn:
+            if lista_ns is None:
+                return dict(conn.execute("""
+                    SELECT r.relogio_ns, r.no_id FROM relogios_no r JOIN nos_gateway n ON n.no_id = r.no_id
+                    WHERE n.anunciado_em > ?
+                """, (limite,)).fetchall())
+            lista_ns = list(lista_ns)
+            encontrados = {}
+            # Lotes abaixo do limite de parâmetros do SQLite
+            for inicio in range(0, len(lista_ns), 500):
+                lote = lista_ns[inicio:inicio + 500]
+                encontrados.update(conn.execute(f"""
+                    SELECT r.relogio_ns, r.no_id FROM relogios_no r JOIN nos_gateway n ON n.no_id = r.no_id
+                    WHERE n.anunciado_em > ? AND r.relogio_ns IN ({",".join("?" * len(lote))})
+                """, (limite, *lote)).fetchall())
+            return encontrados
+
+
+# Mantém o anúncio de um nó gateway no diretório
+# - Anuncia a cada `intervalo` segundos (mantém o nó no ar) e logo depois de uma
+#   mudança no registro (registro.ao_mudar só acorda a thread)
+# - Ao iniciar, substitui todas as linhas do nó (um nó reiniciado com o mesmo ID
+#   não deixa no diretório relógios que não tem mais); depois, só as diferenças
+#   desde o último anúncio são gravadas
+class AnuncioNo:
+    def __init__(self, diretorio, no_id, endereco, registro, intervalo=INTERVALO_ANUNCIO):
+        self.diretorio = diretorio
+        self.no_id = no_id
+        self.endereco = endereco
+        self.registro = registro
+        self.intervalo = intervalo
+        self._anunciados = set()
+        self._mudou = threading.Event()
+        self._parar = threading.Event()
+        self._thread = None
+
+    def iniciar(self):
+        self.registro.ao_mudar = self._mudou.set
+        self._anunciar(completo=True)
+        self._thread = threading.Thread(target=self._laco, name="anuncio-cluster", daemon=True)
+        self._thread.start()
+        logger.info("Nó %s anunciado no cluster (%s)", self.no_id, self.endereco)
+
+    def parar(self):
+        self._parar.set()
+        self._mudou.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.registro.ao_mudar = None
+        self.diretorio.retirar(self.no_id)
+
+    def _laco(self):
+        while not self._parar.is_set():
+            self._mudou.wait(self.intervalo)
+            if self._parar.is_set():
+                break
+            self._mudou.clear()
+            try:
+                self._anunciar()
+            except Exception as e:
+                logger.warning("Falha ao anunciar o nó %s no cluster: %s", self.no_id, e)
+
+    def _anunciar(self, completo=False):
+        atuais = set(self.registro.conectados())
+        if completo:
+            self.diretorio.anunciar(self.no_id, self.endereco, atuais, completo=True)
+        else:
+            entraram, sairam = atuais - self._anunciados, self._anunciados - atuais
+            self.diretorio.anunciar(self.no_id, self.endereco, entraram, sairam)
+        self._anunciados = atuais
+
+
+# Descobre o nó dono de cada NS e mantém um ClienteGateway por nó
+# Parâmetros:
+# - diretorio: DiretorioSQLite (ou outro com a mesma interface)
+# - ttl: segundos em que a localização de um NS fica em cache no worker
+class RoteadorGateways:
+    def __init__(self, diretorio, ttl=2.0):
+        self.diretorio = diretorio
+        self._locais = CacheLRU(100000, ttl)   # ns -> endereço do nó (ou None se offline)
+        self._clientes = {}                    # endereço -> ClienteGateway
+        self._lock = threading.Lock()
+
+    def cliente(self, endereco):
+        with self._lock:
+            cliente = self._clientes.get(endereco)
+            if cliente is None:
+                cliente = self._clientes[endereco] = ClienteGateway(endereco)
+            return cliente
+
+    # Endereço do nó que tem o relógio conectado, ou None
+    def endereco_do(self, ns):
+        achou, endereco = self._locais.obter(ns)
+        if achou:
+            return endereco
+        geracao = self._locais.geracao()
+        linha = self.diretorio.no_do_relogio(ns)
+        endereco = linha[1] if linha else None
+        self._locais.guardar(ns, endereco, geracao)
+        return endereco
+
+    # Esquece a localização do NS (o nó respondeu que o relógio não está mais lá)
+    def esquecer(self, ns):
+        self._locais.invalidar(ns)
+
+    # Chama funcao(cliente) em cada nó no ar; um nó inacessível (ainda dentro da
+    # validade do último anúncio) vai para o log e fica de fora, sem derrubar a consulta
+    # Retorna ({no_id: resultado}, [no_id dos nós que falharam])
+    def em_cada_no(self, funcao):
+        resultados, falhas = {}, []
+        for no, endereco in sorted(self.diretorio.nos_ativos().items()):
+            try:
+                resultados[no] = funcao(self.cliente(endereco))
+            except (ErroGateway, OSError) as e:
+                logger.warning("Nó %s (%s) inacessível: %s", no, endereco, e)
+                falhas.append(no)
+        return resultados, falhas
+
+    # Nós no ar, relógios por nó e os relógios fora do nó preferido pelo anel
+    # - limite: máximo de sugestões de rebalanceamento na resposta
+    def situacao(self, limite=1000):
+        nos = self.diretorio.nos_ativos()
+        relogios = self.diretorio.relogios()
+        anel = AnelConsistente(nos)
+        por_no = {no: 0 for no in nos}
+        sugestoes = []
+        fora = 0
+        for ns, no in relogios.items():
+            por_no[no] = por_no.get(no, 0) + 1
+            preferido = anel.no_para(ns)
+            if preferido != no:
+                fora += 1
+                if len(sugestoes) < limite:
+                    sugestoes.append({"ns": ns, "no_atual": no, "no_sugerido": preferido})
+        return {
+            "nos": [{"no": no, "endereco": endereco, "relogios": por_no.get(no, 0)}
+                    for no, endereco in sorted(nos.items())],
+            "relogios": len(relogios),
+            "fora_do_no_preferido": fora,
+            "rebalanceamento": sugestoes,
+        }
+
+
+# Interface de RegistroRelogios para o cluster
+# Presença de relógios vem do diretório; índice por usuário e listagens vêm dos nós
+class RegistroCluster:
+    def __init__(self, roteador):
+        self.roteador = roteador
+
+    def online(self, ns):
+        return self.roteador.endereco_do(ns) is not None
+
+    def online_entre(self, lista_ns):
+        return set(self.roteador.diretorio.relogios(lista_ns))
+
+    def conectados(self):
+        return list(self.roteador.diretorio.relogios())
+
+    def __len__(self):
+        return len(self.roteador.diretorio.relogios())
+
+    # Relógios dos nós que responderam (um nó inacessível fica de fora da lista)
+    def listar(self):
+        listas, _ = self.roteador.em_cada_no(lambda cliente: RegistroRemoto(cliente).listar())
+        return [relogio for lista in listas.values() for relogio in lista]
+
+    # Todos os nós carregam os vínculos do mesmo banco: basta o primeiro que responder
+    def por_usuario(self, user_id):
+        for endereco in self.roteador.diretorio.nos_ativos().values():
+            try:
+                return RegistroRemoto(self.roteador.cliente(endereco)).por_usuario(user_id)
+            except (ErroGateway, OSError) as e:
+                logger.warning("Nó %s inacessível: %s", endereco, e)
+        return set()
+
+    # Um nó inacessível recarrega os vínculos do banco ao reiniciar
+    def vincular(self, user_id, ns):
+        self.roteador.em_cada_no(lambda cliente: RegistroRemoto(cliente).vincular(user_id, ns))
+
+
+# Interface de GerenciadorSessoes para o cluster: cada comando vai ao nó dono do NS
+# Se o nó responder que o relógio não está lá (mudou de nó), a localização é
+# consultada de novo e o comando é enviado uma vez ao novo dono
+class SessoesCluster:
+    def __init__(self, roteador):
+        self.roteador = roteador
+
+    def _no(self, ns):
+        endereco = self.roteador.endereco_do(ns)
+        if endereco is None:
+            raise ConnectionError(f"Relógio NS {ns} não está conectado em nenhum gateway.")
+        return SessoesRemotas(self.roteador.cliente(endereco))
+
+    def _rotear(self, ns, chamada):
+        try:
+            return chamada(self._no(ns))
+        except KeyError:
+            self.roteador.esquecer(ns)
+            return chamada(self._no(ns))
+        except (ConnectionError, ErroGateway):
+            # Nó fora do ar: a próxima chamada consulta o diretório de novo
+            self.roteador.esquecer(ns)
+            raise
+
+    def executar(self, ns, comando, status="00", dados="", credenciais=None, prioridade=PRIORIDADE_INTERATIVA):
+        return self._rotear(ns, lambda no: no.executar(ns, comando, status, dados, credenciais, prioridade))
+
+    def executar_com_cache(self, ns, comando, status="00", dados="", credenciais=None, usar_cache=True):
+        return self._rotear(ns, lambda no: no.executar_com_cache(ns, comando, status, dados, credenciais, usar_cache))
+
+    def executar_lote(self, ns, comandos, janela=8, timeout=None, credenciais=None,
+                      prioridade=PRIORIDADE_TRANSFERENCIA):
+        return self._rotear(ns, lambda no: no.executar_lote(ns, comandos, janela, timeout, credenciais, prioridade))
+
+    # Contadores somados dos nós que responderam
+    def estatisticas(self):
+        total = {}
+        por_no, _ = self.roteador.em_cada_no(lambda cliente: SessoesRemotas(cliente).estatisticas())
+        for estatisticas in por_no.values():
+            for chave, valor in estatisticas.items():
+                if chave != "taxa_hit":
+                    total[chave] = total.get(chave, 0) + valor
+        consultas = total.get("hits", 0) + total.get("misses", 0)
+        total["taxa_hit"] = round(total.get("hits", 0) / consultas, 4) if consultas else 0.0
+        return total
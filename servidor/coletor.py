@@ -0,0 +1,169 @@
+# Coletor de registros de ponto em segundo plano
+# - Percorre periodicamente os relógios conectados e lê só os registros novos
+#   (a partir do último NSR coletado, guardado em cursores_registros)
+# - Grava em lotes (executemany numa transação, banco em WAL), junto com o cursor
+# - Cada relógio tem seu próprio intervalo: relógios com muitas batidas são lidos
+#   com mais frequência, relógios parados vão espaçando as leituras até o máximo
+# - Jitter no agendamento evita que todos os relógios sejam lidos no mesmo instante
+import logging
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from hexa_client import CommandRejected, iter_punch_records
+from sessoes import PRIORIDADE_FUNDO
+
+logger = logging.getLogger("coletor")
+
+# Nome do consumidor do cursor de registros usado pelo coletor
+CONSUMIDOR_COLETOR = "coletor"
+
+
+# Parâmetros:
+# - banco: BancoDados (cursores e tabela registros_ponto)
+# - registro: RegistroRelogios (relógios conectados)
+# - sessoes: GerenciadorSessoes (comandos RR pela sessão autenticada de cada relógio)
+# - intervalo_min / intervalo_max: limites (segundos) entre duas coletas do mesmo relógio
+# - alvo_por_coleta: registros esperados por coleta; define o intervalo a partir da taxa de batidas
+# - jitter: fração aleatória aplicada a cada intervalo (0.2 = ±20%)
+# - max_workers: relógios coletados ao mesmo tempo
+# - tamanho_lote: registros por transação; pagina: registros por comando RR
+class ColetorRegistros:
+    # Frequência (segundos) com que o agendador verifica relógios novos e coletas vencidas
+    TICK = 1.0
+
+    def __init__(self, banco, registro, sessoes, intervalo_min=30.0, intervalo_max=900.0,
+                 alvo_por_coleta=20, jitter=0.2, max_workers=4, tamanho_lote=500, pagina=100):
+        self.banco = banco
+        self.registro = registro
+        self.sessoes = sessoes
+        self.intervalo_min = intervalo_min
+        self.intervalo_max = intervalo_max
+        self.alvo_por_coleta = alvo_por_coleta
+        self.jitter = jitter
+        self.tamanho_lote = tamanho_lote
+        self.pagina = pagina
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="coletor")
+        self._lock = threading.Lock()
+        self._proxima = {}          # ns -> instante (monotonic) da próxima coleta
+        self._intervalo = {}        # ns -> intervalo atual (segundos)
+        self._ultima = {}           # ns -> instante da última coleta concluída
+        self._em_andamento = set()  # NS com coleta rodando
+        self._parar = threading.Event()
+        self._thread = None
+
+        # Contadores expostos em estatisticas()
+        self.coletas = 0
+        self.registros = 0
+        self.erros = 0
+
+    def iniciar(self):
+        self._parar.clear()
+        self._thread = threading.Thread(target=self._laco, name="coletor-agendador", daemon=True)
+        self._thread.start()
+
+    def parar(self):
+        self._parar.set()
+        if self._thread is not None:
+            self._thread.join()
+        self._executor.shutdown(wait=True)
+
+    def _laco(self):
+        while not self._parar.wait(self.TICK):
+            try:
+                self._agendar()
+            except Exception:
+                logger.exception("Erro no agendamento do coletor")
+
+    # Inclui relógios recém-conectados (primeira coleta espalhada no intervalo mínimo),
+    # esquece os desconectados e dispara as coletas vencidas
+    def _agendar(self):
+        agora = time.monotonic()
+        online = set(self.registro.conectados())
+        with self._lock:
+            for ns in online.difference(self._proxima):
+                self._proxima[ns] = agora + random.uniform(0, self.intervalo_min)
+                self._intervalo.setdefault(ns, self.intervalo_min)
+            for ns in set(self._proxima).difference(online):
+                del self._proxima[ns]
+            vencidos = [ns for ns, quando in self._proxima.items()
+                        if quando <= agora and ns not in self._em_andamento]
+            self._em_andamento.update(vencidos)
+        for ns in vencidos:
+            self._executor.submit(self._coletar_e_reagendar, ns)
+
+    def _coletar_e_reagendar(self, ns):
+        inicio = time.monotonic()
+        novos = None
+        try:
+            novos = self.coletar(ns)
+        except CommandRejected as e:
+            logger.info("Relógio NS %s recusou a leitura de registros: %s", ns, e)
+        except Exception as e:
+            logger.warning("Falha ao coletar registros do relógio NS %s: %s", ns, e)
+        finally:
+            with self._lock:
+                if novos is None:
+                    self.erros += 1
+                intervalo = self._novo_intervalo(ns, novos, inicio)
+                self._ultima[ns] = inicio
+                self._em_andamento.discard(ns)
+                if ns in self._proxima:
+                    fator = random.uniform(1 - self.jitter, 1 + self.jitter)
+                    self._proxima[ns] = time.monotonic() + intervalo * fator
+
+    # Intervalo até a próxima coleta (chamado com o lock)
+    # - Com registros novos: intervalo em que o relógio gera ~alvo_por_coleta batidas
+    # - Sem registros novos ou com erro: dobra o intervalo
+    def _novo_intervalo(self, ns, novos, inicio):
+        atual = self._intervalo.get(ns, self.intervalo_min)
+        ultima = self._ultima.get(ns)
+        if novos and ultima is not None:
+            taxa = novos / max(inicio - ultima, 1e-3)
+            intervalo = self.alvo_por_coleta / taxa
+        elif novos:
+            intervalo = atual
+        else:
+            intervalo = atual * 2
+        intervalo = min(max(intervalo, self.intervalo_min), self.intervalo_max)
+        self._intervalo[ns] = intervalo
+        return intervalo
+
+    # Lê do relógio os registros posteriores ao cursor do coletor e grava em lotes
+    # Os comandos RR entram na fila do relógio atrás dos comandos da interface
+    # Retorna a quantidade de registros novos
+    def coletar(self, ns):
+        def enviar(comando, status, dados):
+            return self.sessoes.executar(ns, comando, status, dados, prioridade=PRIORIDADE_FUNDO)
+
+        inicio_nsr = self.banco.obter_cursor(ns, CONSUMIDOR_COLETOR) or 1
+        lote = []
+        total = 0
+        for registro_ponto in iter_punch_records(enviar, inicio_nsr, page_size=self.pagina):
+            lote.append(registro_ponto)
+            if len(lote) >= self.tamanho_lote:
+                self.banco.salvar_registros(ns, lote, CONSUMIDOR_COLETOR)
+                total += len(lote)
+                lote = []
+        if lote:
+            self.banco.salvar_registros(ns, lote, CONSUMIDOR_COLETOR)
+            total += len(lote)
+
+        with self._lock:
+            self.coletas += 1
+            self.registros += total
+        if total:
+            logger.debug("Relógio NS %s: %d registros novos", ns, total)
+        return total
+
+    # Contadores e agenda do coletor
+    def estatisticas(self):
+        with self._lock:
+            return {
+                "relogios_agendados": len(self._proxima),
+                "coletas_em_andamento": len(self._em_andamento),
+                "coletas": self.coletas,
+                "registros": self.registros,
+                "erros": self.erros,
+            }
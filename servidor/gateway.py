@@ -0,0 +1,319 @@
+# Gateway dos relógios para o modo com vários workers HTTP
+# - Um único processo (gateway) é dono da porta 3000: sockets dos relógios, registro
+#   por NS, sessões autenticadas e coletor de registros
+# - Os workers HTTP (gunicorn, uwsgi...) não abrem sockets de relógio: falam com o
+#   gateway por um socket Unix local, uma linha JSON por requisição e por resposta
+# - Do lado do worker, RegistroRemoto e SessoesRemotas têm a mesma interface que
+#   RegistroRelogios e GerenciadorSessoes, então as rotas não mudam entre os modos
+# - Cada thread do worker usa uma conexão própria do pool (sem multiplexação);
+#   no gateway, cada conexão é atendida por uma thread
+# - Endereço: caminho de socket Unix ou "host:porta" (TCP, ex.: vários nós do cluster)
+# - O canal não tem autenticação nem criptografia e leva as credenciais dos relógios:
+#   use só na mesma máquina (socket Unix com permissão 0660 ou TCP em 127.0.0.1)
+import ipaddress
+import json
+import logging
+import os
+import queue
+import socket
+import socketserver
+import threading
+
+from banco import PoolEsgotado
+from hexa_client import CommandRejected, HexaResponse
+from sessoes import ErroAutenticacao, FilaCheia, FilaEsgotada, PRIORIDADE_INTERATIVA, PRIORIDADE_TRANSFERENCIA
+
+logger = logging.getLogger("gateway")
+
+# Socket Unix padrão do gateway
+SOCKET_PADRAO = "/tmp/hexa-gateway.sock"
+
+
+# Separa o endereço do gateway: ("unix", caminho) ou ("tcp", (host, porta))
+def separar_endereco(endereco):
+    if not endereco.startswith(("/", ".")) and ":" in endereco:
+        host, porta = endereco.rsplit(":", 1)
+        return "tcp", (host, int(porta))
+    return "unix", endereco
+
+
+# Indica se o host é de loopback (o canal TCP só deve ser usado na mesma máquina)
+def _local(host):
+    if host == "localhost":
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+
+# Exceções que atravessam o socket com o mesmo tipo; as demais chegam como ErroGateway
+_EXCECOES = {cls.__name__: cls for cls in (
+    ErroAutenticacao, FilaCheia, FilaEsgotada, PoolEsgotado, TimeoutError, ConnectionError, KeyError, ValueError)}
+
+
+# Erro do gateway sem tipo correspondente no worker (ou gateway inacessível)
+class ErroGateway(RuntimeError):
+    pass
+
+
+def _resposta_para_json(resposta):
+    return resposta.as_dict()
+
+
+def _resposta_de_json(dados):
+    return HexaResponse(dados["index"], dados["command"], dados["status"], dados["data"].encode('utf-8'))
+
+
+def _erro_para_json(erro):
+    if isinstance(erro, CommandRejected):
+        return {"erro": "CommandRejected", "comando": erro.command, "status": erro.status, "mensagem": str(erro)}
+    return {"erro": type(erro).__name__, "mensagem": str(erro)}
+
+
+def _erro_de_json(dados):
+    if dados["erro"] == "CommandRejected":
+        erro = CommandRejected(dados["comando"], dados["status"])
+        erro.args = (dados["mensagem"],)
+        return erro
+    return _EXCECOES.get(dados["erro"], ErroGateway)(dados["mensagem"])
+
+
+# --- Lado do gateway ---
+
+class _AtendimentoWorker(socketserver.StreamRequestHandler):
+    def handle(self):
+        gateway = self.server.gateway
+        for linha in self.rfile:
+            try:
+                pedido = json.loads(linha)
+                resposta = {"ok": gateway.despachar(pedido["op"], pedido.get("args", ()))}
+            except Exception as e:
+                if not isinstance(e, (ErroAutenticacao, FilaCheia, FilaEsgotada, PoolEsgotado, TimeoutError,
+                                      ConnectionError, KeyError, CommandRejected)):
+                    logger.exception("Erro atendendo o pedido de um worker")
+                resposta = _erro_para_json(e)
+            self.wfile.write(json.dumps(resposta, ensure_ascii=False).encode('utf-8') + b"\n")
+            self.wfile.flush()
+
+
+class _ServidorUnix(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+    request_queue_size = 1024  # Vários workers abrindo conexões ao mesmo tempo
+
+
+class _ServidorTCP(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+    request_queue_size = 1024
+
+
+# Atende os workers HTTP no socket Unix (ou TCP)
+# Parâmetros:
+# - caminho: arquivo do socket Unix (recriado ao iniciar) ou "host:porta"
+# - registro: RegistroRelogios do processo
+# - sessoes: GerenciadorSessoes do processo
+# - metricas: Metricas do processo (exportadas pelos workers em /metrics)
+class ServidorGateway:
+    def __init__(self, caminho, registro, sessoes, metricas=None):
+        self.caminho = caminho
+        self.registro = registro
+        self.sessoes = sessoes
+        self.metricas = metricas
+        self._servidor = None
+        self._thread = None
+        self._operacoes = {
+            "executar": self._executar,
+            "executar_lote": self._executar_lote,
+            "executar_com_cache": self._executar_com_cache,
+            "online": registro.online,
+            "online_entre": lambda lista_ns: sorted(registro.online_entre(lista_ns)),
+            "conectados": registro.conectados,
+            "quantidade": lambda: len(registro),
+            "listar": registro.listar,
+            "por_usuario": lambda user_id: sorted(registro.por_usuario(user_id)),
+            "vincular": registro.vincular,
+            "estatisticas_sessoes": sessoes.estatisticas,
+            "metricas": lambda: metricas.renderizar() if metricas is not None else "",
+        }
+
+    def despachar(self, operacao, args):
+        try:
+            funcao = self._operacoes[operacao]
+        except KeyError:
+            raise ValueError(f"Operação desconhecida: {operacao}") from None
+        return funcao(*args)
+
+    def _executar(self, ns, comando, status="00", dados="", credenciais=None, prioridade=PRIORIDADE_INTERATIVA):
+        return _resposta_para_json(self.sessoes.executar(ns, comando, status, dados, credenciais, prioridade))
+
+    def _executar_com_cache(self, ns, comando, status="00", dados="", credenciais=None, usar_cache=True):
+        resposta, situacao, idade = self.sessoes.executar_com_cache(ns, comando, status, dados, credenciais, usar_cache)
+        return [_resposta_para_json(resposta), situacao, idade]
+
+    def _executar_lote(self, ns, comandos, janela=8, timeout=None, credenciais=None,
+                       prioridade=PRIORIDADE_TRANSFERENCIA):
+        respostas = self.sessoes.executar_lote(ns, [tuple(c) if isinstance(c, list) else c for c in comandos],
+                                               janela, timeout, credenciais, prioridade)
+        return [_resposta_para_json(r) if isinstance(r, HexaResponse) else _erro_para_json(r) for r in respostas]
+
+    # Abre o socket e atende numa thread daemon
+    def iniciar(self):
+        familia, endereco = separar_endereco(self.caminho)
+        if familia == "tcp":
+            if not _local(endereco[0]):
+                logger.warning("Gateway em %s aceita conexões de outras máquinas sem autenticação; "
+                               "use 127.0.0.1 ou um socket Unix", self.caminho)
+            self._servidor = _ServidorTCP(endereco, _AtendimentoWorker)
+        else:
+            if os.path.exists(endereco):
+                os.unlink(endereco)
+            self._servidor = _ServidorUnix(endereco, _AtendimentoWorker)
+            os.chmod(endereco, 0o660)
+        self._servidor.gateway = self
+        self._thread = threading.Thread(target=self._servidor.serve_forever, name="gateway", daemon=True)
+        self._thread.start()
+        logger.info("Gateway aguardando workers em %s", self.caminho)
+
+    def parar(self):
+        if self._servidor is None:
+            return
+        self._servidor.shutdown()
+        self._servidor.server_close()
+        self._thread.join()
+        self._servidor = None
+        familia, endereco = separar_endereco(self.caminho)
+        if familia == "unix" and os.path.exists(endereco):
+            os.unlink(endereco)
+
+
+# --- Lado do worker ---
+
+# Conexão de um worker com o gateway
+class _ConexaoGateway:
+    def __init__(self, caminho, timeout):
+        familia, endereco = separar_endereco(caminho)
+        if familia == "tcp":
+            self.socket = socket.create_connection(endereco, timeout=timeout)
+            self.socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        else:
+            self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.socket.connect(endereco)  # Bloqueante: com timeout, a fila cheia daria EAGAIN
+            self.socket.settimeout(timeout)
+        self.leitor = self.socket.makefile('rb')
+
+    def fechar(self):
+        self.leitor.close()
+        self.socket.close()
+
+
+# Pool de conexões com o gateway, compartilhado pelas threads do worker
+# Parâmetros:
+# - caminho: socket Unix do gateway ou "host:porta"
+# - tamanho: conexões livres guardadas no pool (as extras são fechadas ao devolver)
+# - timeout: segundos aguardando a resposta do gateway (cobre comandos em lote e páginas de RR)
+class ClienteGateway:
+    def __init__(self, caminho=SOCKET_PADRAO, tamanho=32, timeout=300.0):
+        self.caminho = caminho
+        self.tamanho = tamanho
+        self.timeout = timeout
+        self._livres = queue.LifoQueue()
+
+    # Envia uma operação ao gateway e retorna o resultado (ou levanta o erro devolvido)
+    # Uma conexão do pool que já tinha caído é refeita uma vez; depois que o pedido
+    # foi entregue não há nova tentativa, pois o comando pode ter chegado ao relógio
+    def chamar(self, operacao, *args):
+        pedido = json.dumps({"op": operacao, "args": args}, ensure_ascii=False).encode('utf-8') + b"\n"
+        conexao = self._emprestar()
+        try:
+            try:
+                conexao.socket.sendall(pedido)
+            except OSError:
+                conexao.fechar()
+                conexao = self._nova_conexao()
+                conexao.socket.sendall(pedido)
+            linha = conexao.leitor.readline()
+            if not linha:
+                raise ConnectionError("O gateway encerrou a conexão.")
+            resposta = json.loads(linha)
+        except BaseException:
+            conexao.fechar()
+            raise
+        self._devolver(conexao)
+        if "erro" in resposta:
+            raise _erro_de_json(resposta)
+        return resposta["ok"]
+
+    def _nova_conexao(self):
+        try:
+            return _ConexaoGateway(self.caminho, self.timeout)
+        except OSError as e:
+            raise ErroGateway(f"Gateway dos relógios inacessível em {self.caminho}: {e}") from e
+
+    def _emprestar(self):
+        try:
+            return self._livres.get_nowait()
+        except queue.Empty:
+            return self._nova_conexao()
+
+    def _devolver(self, conexao):
+        if self._livres.qsize() < self.tamanho:
+            self._livres.put(conexao)
+        else:
+            conexao.fechar()
+
+    def fechar(self):
+        while True:
+            try:
+                self._livres.get_nowait().fechar()
+            except queue.Empty:
+                break
+
+
+# Interface de RegistroRelogios atendida pelo gateway
+class RegistroRemoto:
+    def __init__(self, cliente):
+        self.cliente = cliente
+
+    def online(self, ns):
+        return self.cliente.chamar("online", ns)
+
+    def online_entre(self, lista_ns):
+        return set(self.cliente.chamar("online_entre", list(lista_ns)))
+
+    def conectados(self):
+        return self.cliente.chamar("conectados")
+
+    def __len__(self):
+        return self.cliente.chamar("quantidade")
+
+    def listar(self):
+        return self.cliente.chamar("listar")
+
+    def por_usuario(self, user_id):
+        return set(self.cliente.chamar("por_usuario", user_id))
+
+    def vincular(self, user_id, ns):
+        self.cliente.chamar("vincular", user_id, ns)
+
+
+# Interface de GerenciadorSessoes atendida pelo gateway
+class SessoesRemotas:
+    def __init__(self, cliente):
+        self.cliente = cliente
+
+    def executar(self, ns, comando, status="00", dados="", credenciais=None, prioridade=PRIORIDADE_INTERATIVA):
+        return _resposta_de_json(self.cliente.chamar("executar", ns, comando, status, dados, credenciais, prioridade))
+
+    def executar_com_cache(self, ns, comando, status="00", dados="", credenciais=None, usar_cache=True):
+        resposta, situacao, idade = self.cliente.chamar("executar_com_cache", ns, comando, status, dados,
+                                                        credenciais, usar_cache)
+        return _resposta_de_json(resposta), situacao, idade
+
+    def executar_lote(self, ns, comandos, janela=8, timeout=None, credenciais=None,
+                      prioridade=PRIORIDADE_TRANSFERENCIA):
+        respostas = self.cliente.chamar("executar_lote", ns, comandos, janela, timeout, credenciais, prioridade)
+        return [_erro_de_json(r) if "erro" in r else _resposta_de_json(r) for r in respostas]
+
+    def estatisticas(self):
+        return self.cliente.chamar("estatisticas_sessoes")
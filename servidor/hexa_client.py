@@ -8,15 +8,425 @@ import base64
 # - os: Para geração de números aleatórios seguros
 import os
 
+# - time: Para os prazos dos comandos em pipeline
+import time
+
+# - logging: Para os logs do cliente (formatação só acontece se o nível estiver habilitado)
+import logging
+
+# - random: Para o jitter da espera entre tentativas de conexão
+import random
+
 # - threading: Para sincronização de acesso ao socket
 from threading import Lock
 
+# - collections: Para o registro de ponto (namedtuple)
+from collections import namedtuple
+
 # - cryptography: Para operações criptográficas (AES e RSA)
 from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
 from cryptography.hazmat.primitives import padding as sym_padding
 from cryptography.hazmat.primitives.asymmetric import rsa, padding as asym_padding
 from cryptography.hazmat.primitives import serialization, hashes
 
+# Logger do cliente HEXA (conexão, autenticação, avisos de protocolo)
+logger = logging.getLogger("hexa.client")
+
+# Logger dos dumps de pacotes (payloads decodificados podem conter dados sensíveis)
+# Fica desligado mesmo com o log em DEBUG, até ser habilitado explicitamente:
+#   logging.getLogger("hexa.packets").setLevel(logging.DEBUG)
+packet_logger = logging.getLogger("hexa.packets")
+if packet_logger.level == logging.NOTSET:
+    packet_logger.setLevel(logging.WARNING)
+
+
+# Keepalive TCP padrão: (ocioso, intervalo, tentativas) em segundos
+# Sem tráfego por 30s o kernel envia sondas a cada 10s; após 3 sem resposta a
+# conexão é dada como morta (~60s), em vez de ficar meio-aberta indefinidamente
+DEFAULT_KEEPALIVE = (30, 10, 3)
+
+
+# Liga o keepalive TCP no socket
+# - keepalive: (ocioso, intervalo, tentativas) em segundos, ou None para não alterar
+# - Também define TCP_USER_TIMEOUT (Linux) com o mesmo prazo total, para que dados
+#   enviados e nunca confirmados derrubem a conexão no mesmo tempo
+def set_keepalive(sock, keepalive=DEFAULT_KEEPALIVE):
+    if keepalive is None:
+        return
+    idle, interval, count = keepalive
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+    if hasattr(socket, "TCP_KEEPIDLE"):
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, idle)
+    elif hasattr(socket, "TCP_KEEPALIVE"):  # macOS
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPALIVE, idle)
+    if hasattr(socket, "TCP_KEEPINTVL"):
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPINTVL, interval)
+    if hasattr(socket, "TCP_KEEPCNT"):
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPCNT, count)
+    if hasattr(socket, "TCP_USER_TIMEOUT"):
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_USER_TIMEOUT, (idle + interval * count) * 1000)
+
+
+# Espera (segundos) antes da tentativa `attempt` de reconexão (0 = primeira nova tentativa)
+# Backoff exponencial com jitter completo: sorteio entre 0 e min(cap, base * 2^attempt),
+# para que relógios que caíram juntos não reconectem todos no mesmo instante
+def backoff_delay(attempt, base=0.5, cap=30.0):
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+# Adiciona a identificação do relógio (IP ou NS) no início de cada mensagem
+# A mensagem só é montada se o nível estiver habilitado (LoggerAdapter.log verifica antes)
+class ClockLogAdapter(logging.LoggerAdapter):
+    def process(self, msg, kwargs):
+        return f"[{self.extra['clock']}] {msg}", kwargs
+
+
+# Calcula o XOR de todos os bytes (checksum do protocolo HEXA)
+# - Pacotes pequenos: laço simples, mais barato que criar um inteiro grande
+# - Pacotes grandes: converte o buffer num inteiro e dobra a metade alta sobre a baixa
+#   até restar um byte, deixando o trabalho para as operações de inteiro do CPython
+# Aceita bytes, bytearray ou memoryview e retorna um int de 0 a 255
+def xor_checksum(data):
+    size = len(data)
+    if size <= 32:
+        checksum = 0
+        for byte in data:
+            checksum ^= byte
+        return checksum
+    value = int.from_bytes(data, 'little')
+    bits = (1 << (size - 1).bit_length()) * 8
+    while bits > 8:
+        bits >>= 1
+        value = (value >> bits) ^ (value & ((1 << bits) - 1))
+    return value
+
+
+# Separador incremental de pacotes HEXA sobre um fluxo TCP
+# - Usa um bytearray pré-alocado e um memoryview: os dados entram via recv_into
+#   (ou feed/get_buffer+commit) sem criar bytes intermediários
+# - Entrega pacotes completos [START_BYTE][SIZE][PAYLOAD][CHECKSUM][END_BYTE] como
+#   memoryviews sobre o próprio buffer, válidos até a próxima escrita no framer
+# - Vários pacotes numa mesma leitura são entregues em sequência
+# - Bytes inválidos antes de um START_BYTE são descartados (ressincronização)
+class HexaFramer:
+    START = 0x02
+    END = 0x03
+    # Maior pacote possível: 1 (START) + 2 (SIZE) + 65535 (PAYLOAD) + 1 (CHECKSUM) + 1 (END)
+    MAX_FRAME = 65540
+
+    # Parâmetros:
+    # - capacity: tamanho inicial do buffer; cresce (até dois pacotes máximos) apenas
+    #   quando um pacote não cabe, para não reservar 128 KB por relógio conectado
+    def __init__(self, capacity=4096):
+        self._buffer = bytearray(capacity)
+        self._view = memoryview(self._buffer)
+        self._start = 0            # Início dos dados ainda não consumidos
+        self._end = 0              # Fim dos dados recebidos
+        self.discarded = 0         # Bytes descartados durante ressincronizações
+
+    # Quantidade de bytes recebidos e ainda não consumidos
+    def __len__(self):
+        return self._end - self._start
+
+    # Descarta tudo que estiver no buffer
+    def clear(self):
+        self._start = self._end = 0
+
+    # Retorna a área livre do buffer para escrita direta (recv_into / BufferedProtocol)
+    # - Move o pacote parcial para o início do buffer quando o espaço no fim acaba
+    # - Dobra o buffer quando um único pacote parcial já o ocupa inteiro
+    def get_buffer(self, sizehint=-1):
+        if self._start == self._end:
+            self._start = self._end = 0
+        elif self._end == len(self._buffer) or len(self._buffer) - self._end < sizehint:
+            pending = self._end - self._start
+            if pending == len(self._buffer):
+                if pending >= 2 * self.MAX_FRAME:
+                    raise BufferError("HexaFramer cheio: consuma os pacotes com next_frame() antes de ler mais.")
+                # Novo buffer; memoryviews já entregues continuam apontando para o antigo
+                buffer = bytearray(min(2 * len(self._buffer), 2 * self.MAX_FRAME))
+                buffer[:pending] = self._view[self._start:self._end]
+                self._buffer, self._view = buffer, memoryview(buffer)
+            else:
+                self._view[:pending] = self._view[self._start:self._end]
+            self._start, self._end = 0, pending
+        return self._view[self._end:]
+
+    # Confirma que nbytes foram escritos na área retornada por get_buffer
+    def commit(self, nbytes):
+        self._end += nbytes
+
+    # Copia bytes recebidos por outra via para o buffer
+    def feed(self, data):
+        data = memoryview(data)
+        while data:
+            area = self.get_buffer(len(data))
+            n = min(len(area), len(data))
+            area[:n] = data[:n]
+            self.commit(n)
+            data = data[n:]
+
+    # Lê do socket diretamente para o buffer
+    # Retorna o número de bytes lidos (0 indica conexão encerrada)
+    def recv_into(self, sock):
+        n = sock.recv_into(self.get_buffer())
+        self.commit(n)
+        return n
+
+    # Retorna o próximo pacote completo (memoryview) ou None se ainda faltam bytes
+    def next_frame(self):
+        buffer = self._buffer
+        while self._end - self._start >= 1:
+            start = self._start
+            if buffer[start] != self.START:
+                found = buffer.find(self.START, start, self._end)
+                skip_to = found if found >= 0 else self._end
+                self.discarded += skip_to - start
+                self._start = skip_to
+                continue
+            if self._end - start < 3:
+                return None
+            total = (buffer[start + 1] | (buffer[start + 2] << 8)) + 5
+            if self._end - start < total:
+                return None
+            if buffer[start + total - 1] != self.END:
+                # Tamanho inconsistente: o START_BYTE era lixo, procura o próximo
+                self.discarded += 1
+                self._start += 1
+                continue
+            self._start += total
+            return self._view[start:start + total]
+        return None
+
+    # Itera sobre todos os pacotes completos disponíveis no buffer
+    def frames(self):
+        frame = self.next_frame()
+        while frame is not None:
+            yield frame
+            frame = self.next_frame()
+
+
+# Contexto AES-CBC de uma sessão com o equipamento
+# - Cria o AES (e o escalonamento da chave) uma única vez por chave de sessão
+# - A criptografia usa o CBC nativo da biblioteca, com um contexto novo por payload
+#   sobre o AES já criado (nada mutável é compartilhado entre threads)
+# - A descriptografia CBC de payloads curtos é feita com um único update ECB seguido
+#   de um XOR com os blocos anteriores (IV + texto cifrado), como inteiros grandes;
+#   o contexto ECB é compartilhado e protegido por um lock
+# - encrypt_many/decrypt_many processam N payloads numa só chamada
+# O padding é o do protocolo: 1 a 16 bytes zero até o múltiplo de 16
+class AesSessionCipher:
+    BLOCK = 16
+    # Acima deste número de blocos o CBC nativo da biblioteca é mais rápido que o
+    # XOR de inteiros grandes ao decifrar
+    XOR_MAX_BLOCKS = 32
+    # Quantidade de payloads curtos decifrados por update ECB em decrypt_many
+    BATCH_GROUP = 64
+
+    def __init__(self, key):
+        self.key = key
+        self._algorithm = algorithms.AES(key)
+        self._ecb_decryptor = Cipher(self._algorithm, modes.ECB()).decryptor()
+        self._ecb_lock = Lock()
+
+    # Tamanho do payload depois do padding de zeros
+    def padded_size(self, size):
+        return size + self.BLOCK - (size % self.BLOCK)
+
+    # Cifra um payload e retorna IV + texto cifrado
+    # - iv: vetor de inicialização (gerado aleatoriamente se não informado)
+    def encrypt(self, payload, iv=None):
+        if iv is None:
+            iv = os.urandom(self.BLOCK)
+        encryptor = Cipher(self._algorithm, modes.CBC(iv)).encryptor()
+        return iv + encryptor.update(payload.ljust(self.padded_size(len(payload)), b'\x00')) + encryptor.finalize()
+
+    # Cifra vários payloads com um único sorteio de IVs
+    def encrypt_many(self, payloads):
+        ivs = os.urandom(self.BLOCK * len(payloads))
+        return [self.encrypt(payload, ivs[i * self.BLOCK:(i + 1) * self.BLOCK])
+                for i, payload in enumerate(payloads)]
+
+    # Valida IV + texto cifrado; ValueError indica chave dessincronizada ou pacote truncado
+    def _check(self, data):
+        if len(data) < self.BLOCK or len(data) % self.BLOCK:
+            raise ValueError(f"Payload cifrado com tamanho inválido ({len(data)} bytes).")
+
+    # Decifra IV + texto cifrado e retorna o payload (ainda com o padding de zeros)
+    def decrypt(self, data):
+        self._check(data)
+        if len(data) // self.BLOCK - 1 > self.XOR_MAX_BLOCKS:
+            decryptor = Cipher(self._algorithm, modes.CBC(data[:self.BLOCK])).decryptor()
+            return decryptor.update(data[self.BLOCK:]) + decryptor.finalize()
+        data = memoryview(data)
+        with self._ecb_lock:
+            plain = self._ecb_decryptor.update(data[self.BLOCK:])
+        chained = int.from_bytes(plain, 'big') ^ int.from_bytes(data[:-self.BLOCK], 'big')
+        return chained.to_bytes(len(plain), 'big')
+
+    # Decifra vários payloads (IV + texto cifrado)
+    # Os payloads curtos são agrupados: um único update ECB e um único XOR por grupo
+    def decrypt_many(self, items):
+        results = [None] * len(items)
+        group = []
+        for position, item in enumerate(items):
+            self._check(item)
+            if len(item) // self.BLOCK - 1 > self.XOR_MAX_BLOCKS:
+                results[position] = self.decrypt(item)
+                continue
+            group.append((position, memoryview(item)))
+            if len(group) == self.BATCH_GROUP:
+                self._decrypt_group(group, results)
+                group = []
+        if group:
+            self._decrypt_group(group, results)
+        return results
+
+    def _decrypt_group(self, group, results):
+        blocks = b''.join(item[self.BLOCK:] for _, item in group)
+        with self._ecb_lock:
+            plain = self._ecb_decryptor.update(blocks)
+        previous = b''.join(item[:-self.BLOCK] for _, item in group)
+        chained = (int.from_bytes(plain, 'big') ^ int.from_bytes(previous, 'big')).to_bytes(len(plain), 'big')
+        offset = 0
+        for position, item in group:
+            size = len(item) - self.BLOCK
+            results[position] = chained[offset:offset + size]
+            offset += size
+
+
+# Resposta do equipamento já separada em index, command e status
+# - O campo data fica em bytes e só é decodificado no primeiro acesso a `data`
+# - fields()/records() entregam os campos separados por ']' sob demanda, sem montar
+#   dicionários nem juntar/dividir o payload de novo
+# - Aceita acesso como dicionário (response['status'], response.get('data')) e
+#   as_dict() para serializar em JSON
+class HexaResponse:
+    __slots__ = ('index', 'command', 'status', 'raw_data', '_data')
+    KEYS = ('index', 'command', 'status', 'data')
+
+    def __init__(self, index, command, status, raw_data=b''):
+        self.index = index
+        self.command = command
+        self.status = status
+        self.raw_data = raw_data  # bytes do campo data (pode conter '+')
+        self._data = None
+
+    @property
+    def data(self):
+        if self._data is None:
+            self._data = self.raw_data.decode('utf-8', errors='ignore')
+        return self._data
+
+    # Iterador sobre os campos de data separados por `sep` (separador final ignorado)
+    # O payload tem no máximo 64 KB, então o split em C sai bem mais barato que
+    # procurar cada separador num gerador em Python
+    def fields(self, sep=']'):
+        parts = self.data.split(sep)
+        if parts[-1] == '':
+            parts.pop()
+        return iter(parts)
+
+    # Agrupa os campos de data em tuplas de `size` campos, uma de cada vez
+    # (grupo incompleto no fim é ignorado)
+    def records(self, size, sep=']'):
+        return zip(*[self.fields(sep)] * size)
+
+    def __getitem__(self, key):
+        if key not in self.KEYS:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def get(self, key, default=None):
+        return getattr(self, key) if key in self.KEYS else default
+
+    def as_dict(self):
+        return {"index": self.index, "command": self.command, "status": self.status, "data": self.data}
+
+    def __repr__(self):
+        return (f"HexaResponse(index={self.index!r}, command={self.command!r}, "
+                f"status={self.status!r}, data={len(self.raw_data)} bytes)")
+
+
+# --- Registros de ponto (AFD) ---
+# Comando de leitura dos registros: dados "N]<quantidade>]<nsr inicial>"
+# A resposta traz os registros em sequência, com os campos separados por ']':
+#   nsr]tipo]data (DDMMAAAA)]hora (HHMM)]pis]nsr]tipo]...
+PUNCH_RECORDS_COMMAND = "RR"
+PUNCH_RECORD_FIELDS = 5
+
+# Registro de ponto; nsr é o Número Sequencial do Registro (int)
+PunchRecord = namedtuple("PunchRecord", "nsr type date time pis")
+
+
+# Erro levantado quando o equipamento responde um comando com status de falha
+class CommandRejected(Exception):
+    def __init__(self, command, status, data=""):
+        super().__init__(f"Comando {command} recusado pelo equipamento (status {status}) {data}".rstrip())
+        self.command = command
+        self.status = status
+
+
+# Monta os dados do comando RR para ler `count` registros a partir do NSR `start_nsr`
+def punch_records_request(start_nsr, count):
+    return f"N]{count}]{start_nsr}"
+
+
+# Separa os registros de uma resposta RR (HexaResponse), um de cada vez
+# Grupos incompletos no fim e grupos com NSR não numérico são ignorados
+def parse_punch_records(response):
+    for nsr, kind, date, hour, pis in response.records(PUNCH_RECORD_FIELDS):
+        nsr = nsr.strip()
+        if nsr.isdigit():
+            yield PunchRecord(int(nsr), kind, date, hour, pis)
+
+
+# Percorre os registros de ponto página a página, entregando um registro por vez
+# Só uma página fica em memória; a próxima é pedida quando a atual termina
+# Parâmetros:
+# - send: função (command, status, data) -> resposta do equipamento (ex.: send_command)
+# - start_nsr / end_nsr: faixa de NSR (end_nsr None = até o último registro)
+# - page_size: registros pedidos por comando
+# Levanta CommandRejected se o equipamento recusar o comando
+def iter_punch_records(send, start_nsr=1, end_nsr=None, page_size=100):
+    nsr = start_nsr
+    while end_nsr is None or nsr <= end_nsr:
+        count = page_size if end_nsr is None else min(page_size, end_nsr - nsr + 1)
+        response = send(PUNCH_RECORDS_COMMAND, "00", punch_records_request(nsr, count))
+        if response.status not in ("00", "000"):
+            raise CommandRejected(PUNCH_RECORDS_COMMAND, response.status, response.data)
+        last = None
+        for record in parse_punch_records(response):
+            if record.nsr < nsr:
+                continue  # Registro repetido de uma página anterior
+            if end_nsr is not None and record.nsr > end_nsr:
+                return
+            last = record.nsr
+            yield record
+        if last is None:
+            return  # Página vazia: não há mais registros
+        nsr = last + 1
+
+
+# --- Chave pública RSA do equipamento ---
+# A resposta RA traz o módulo e o expoente em base64 (big-endian): "modulo]expoente"
+# A chave de um relógio muda raramente, então pode ser guardada e reaproveitada
+# (HexaProtocolClient.public_key) para autenticar só com o EA
+
+# Reconstrói a chave pública RSA a partir do módulo e do expoente em base64
+def load_public_key(modulus_b64, exponent_b64):
+    modulus_val = int.from_bytes(base64.b64decode(modulus_b64), 'big')
+    exponent_val = int.from_bytes(base64.b64decode(exponent_b64), 'big')
+    return rsa.RSAPublicNumbers(exponent_val, modulus_val).public_key()
+
+
+# Operação inversa de load_public_key: retorna (modulo_b64, expoente_b64)
+def dump_public_key(public_key):
+    numbers = public_key.public_numbers()
+    modulus = numbers.n.to_bytes((numbers.n.bit_length() + 7) // 8, 'big')
+    exponent = numbers.e.to_bytes((numbers.e.bit_length() + 7) // 8, 'big')
+    return base64.b64encode(modulus).decode('ascii'), base64.b64encode(exponent).decode('ascii')
+
 
 # Classe principal que implementa o cliente do protocolo HEXA
 # Responsável por estabelecer conexão, autenticar e enviar comandos para o equipamento
@@ -24,51 +434,95 @@ class HexaProtocolClient:
     # Bytes de controle do protocolo
     START_BYTE = b'\x02'  # Marca o início do pacote
     END_BYTE = b'\x03'    # Marca o fim do pacote
+    # Máximo de comandos em voo em send_commands (o índice do pacote tem só 100 valores)
+    MAX_PIPELINE_WINDOW = 50
+    # Observador opcional de eventos do protocolo (ex.: métricas), compartilhado por todos
+    # os clientes. Deve implementar:
+    # - command_done(clock, command, seconds): resposta recebida para um comando
+    # - handshake_done(clock, seconds, ok, cached_key): fim de uma autenticação RA/EA
+    #   (cached_key=True quando a chave pública guardada dispensou o RA)
+    # - protocol_error(clock, kind): "checksum", "decrypt" ou "timeout"
+    observer = None
+    # Prazo (segundos) de resposta por comando; comandos fora do dicionário usam
+    # self.timeout (ex.: {"RQ": 3.0, "RR": 30.0})
+    command_timeouts = {}
 
     # Inicializa o cliente HEXA
     # Parâmetros:
     # - host: Endereço IP do equipamento
     # - port: Porta de conexão (padrão: 3000)
     def __init__(self, host, port=3000):
-        # Exibe o host recebido para debug
-        print(f"--- LÓGICA --- \nHost recebido no __init__: {repr(host)}\n---")
-        
         # Armazena o endereço e porta do equipamento
         self.host = host
         self.port = port
         
         # Inicializa variáveis de estado
         self.socket = None              # Socket para comunicação TCP
+        self.transport = None           # Transporte alternativo ao socket (ex.: conexão do motor TCP)
         self.aes_key = None             # Chave de criptografia da sessão
+        self._cipher = None             # AesSessionCipher da chave atual
         self.is_authenticated = False   # Estado de autenticação
+        self.public_key = None          # Chave pública RSA do relógio (do último RA ou informada por quem criou o cliente)
+        self.used_cached_key = False    # Última autenticação dispensou o RA usando public_key
         self.index_counter = 1          # Contador para índice dos pacotes
+        self.timeout = 10.0             # Tempo máximo (segundos) aguardando cada resposta
+        self.connect_timeout = 5.0      # Tempo máximo (segundos) de cada tentativa de conexão
+        self.connect_attempts = 3       # Tentativas de conexão em connect() (com backoff entre elas)
+        self.keepalive = DEFAULT_KEEPALIVE  # Keepalive TCP do socket (ver set_keepalive)
         self.socket_lock = Lock()       # Lock para sincronização de threads
+        self.framer = HexaFramer()      # Buffer de recepção dos pacotes do socket
+        self.log = ClockLogAdapter(logger, {"clock": host})              # Logs com o relógio no contexto
+        self.packet_log = ClockLogAdapter(packet_logger, {"clock": host})  # Dumps de pacotes (desligados)
+        self.log.debug("Cliente criado para o host %r", host)
+
+    # Troca a identificação do relógio usada nos logs e métricas (ex.: NS descoberto após conectar)
+    def set_log_context(self, clock):
+        self.log.extra["clock"] = clock
+        self.packet_log.extra["clock"] = clock
+
+    # Identificação atual do relógio (IP ou NS)
+    @property
+    def clock(self):
+        return self.log.extra["clock"]
 
     # Estabelece a conexão TCP com o equipamento
+    # - Até `attempts` tentativas (padrão: self.connect_attempts), com espera
+    #   exponencial e jitter entre elas (backoff_delay)
+    # - Cada tentativa espera no máximo self.connect_timeout segundos
     # Retorna:
     # - True: se a conexão foi estabelecida com sucesso
-    # - False: se houve falha na conexão
-    def connect(self):
-        # Log da tentativa de conexão
-        print(f"--- LÓGICA --- \nTentando conectar com o host: {repr(self.host)} na porta {self.port}\n---")
-        try:
-            # Cria um novo socket TCP/IP
-            self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            # Define timeout de 10 segundos para operações
-            self.socket.settimeout(10.0)
-            # Tenta estabelecer a conexão
-            self.socket.connect((self.host, self.port))
-            # Log de sucesso
-            print(f"Conectado com sucesso a {self.host}:{self.port}")
-            return True
-        
-        except socket.error as e:
-            # Log detalhado do erro em caso de falha
-            print(f"--- ERRO DETALHADO --- \nOcorreu o erro: {e} \nAo tentar usar o host: {repr(self.host)}\n---")
-            print(f"Falha na conexão: {e}")
-            # Limpa o socket em caso de erro
-            self.socket = None
-            return False
+    # - False: se todas as tentativas falharam
+    def connect(self, attempts=None):
+        attempts = self.connect_attempts if attempts is None else attempts
+        for attempt in range(attempts):
+            if attempt:
+                delay = backoff_delay(attempt - 1)
+                self.log.debug("Nova tentativa de conexão em %.2fs", delay)
+                time.sleep(delay)
+            # Log da tentativa de conexão
+            self.log.debug("Conectando na porta %s (tentativa %d)", self.port, attempt + 1)
+            try:
+                # Cria um novo socket TCP/IP, com keepalive para detectar conexões mortas
+                self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+                set_keepalive(self.socket, self.keepalive)
+                # Tenta estabelecer a conexão
+                self.socket.settimeout(self.connect_timeout)
+                self.socket.connect((self.host, self.port))
+                # Define o timeout das operações (padrão: 10 segundos)
+                self.socket.settimeout(self.timeout)
+                # Log de sucesso
+                self.log.info("Conectado a %s:%s", self.host, self.port)
+                return True
+
+            except socket.error as e:
+                # Log detalhado do erro em caso de falha
+                self.log.warning("Falha na conexão com o host %r: %s", self.host, e)
+                # Limpa o socket em caso de erro
+                if self.socket is not None:
+                    self.socket.close()
+                    self.socket = None
+        self.log.error("Não foi possível conectar ao host %r após %d tentativa(s)", self.host, attempts)
+        return False
 
     # Encerra a conexão com o equipamento
     # - Fecha o socket
@@ -79,7 +533,13 @@ class HexaProtocolClient:
             self.socket.close()
             self.socket = None
             self.is_authenticated = False
-            print("Conexão encerrada.")
+            self.log.info("Conexão encerrada.")
+
+    # Retorna o contexto AES da chave de sessão atual, recriando-o se a chave mudou
+    def _session_cipher(self):
+        if self._cipher is None or self._cipher.key is not self.aes_key:
+            self._cipher = AesSessionCipher(self.aes_key)
+        return self._cipher
 
     # Calcula o checksum dos dados do pacote
     # O checksum é calculado usando XOR de todos os bytes
@@ -88,10 +548,7 @@ class HexaProtocolClient:
     # Retorna:
     # - Um byte contendo o valor do checksum
     def _calculate_checksum(self, data_bytes):
-        checksum = 0
-        for byte in data_bytes:
-            checksum ^= byte
-        return checksum.to_bytes(1, 'big')
+        return xor_checksum(data_bytes).to_bytes(1, 'big')
 
     # Constrói um pacote do protocolo HEXA
     # Estrutura do pacote:
@@ -105,38 +562,29 @@ class HexaProtocolClient:
     # - index: índice do pacote para controle
     # - use_aes: indica se deve criptografar o payload com AES
     def _build_packet(self, command, status="00", data="", index="01", use_aes=False):
-        # Constrói a string do payload com formato: index+command+status+data
-        payload_str = f"{index}+{command}+{status}"
-        if data:
-            payload_str += f"+{data}"
-        
-        # Converte o payload para bytes
-        payload_bytes = payload_str.encode('utf-8')
+        payload_bytes = self._build_payload(command, status, data, index)
 
         # Se necessário, criptografa o payload usando AES
+        # (IV aleatório + AES-CBC com padding de zeros até múltiplo de 16 bytes)
         if use_aes and self.is_authenticated and self.aes_key:
-            # Gera um IV (Vetor de Inicialização) aleatório
-            iv = os.urandom(16) 
-            # Cria o cipher AES no modo CBC
-            cipher = Cipher(algorithms.AES(self.aes_key), modes.CBC(iv))
-            encryptor = cipher.encryptor()
-            
-            # Adiciona padding para garantir tamanho múltiplo de 16 bytes
-            padding_size = 16 - (len(payload_bytes) % 16)
-            if padding_size == 0:
-                padding_size = 16
-            padded_data = payload_bytes + (b'\x00' * padding_size)
-            
-            # Criptografa os dados e concatena com o IV
-            encrypted_payload = encryptor.update(padded_data) + encryptor.finalize()
-            payload_bytes = iv + encrypted_payload
+            payload_bytes = self._session_cipher().encrypt(payload_bytes)
+
+        return self._frame_payload(payload_bytes)
+
+    # Constrói o payload em bytes com formato: index+command+status+data
+    def _build_payload(self, command, status="00", data="", index="01"):
+        payload_str = f"{index}+{command}+{status}"
+        if data:
+            payload_str += f"+{data}"
+        return payload_str.encode('utf-8')
 
-        # Monta o pacote final:
-        # [START_BYTE][SIZE][PAYLOAD][CHECKSUM][END_BYTE]
+    # Monta o pacote final a partir do payload (já criptografado, se for o caso):
+    # [START_BYTE][SIZE][PAYLOAD][CHECKSUM][END_BYTE]
+    def _frame_payload(self, payload_bytes):
         size = len(payload_bytes)
         size_bytes = size.to_bytes(2, 'little')
-        checksum_data = size_bytes + payload_bytes
-        checksum_byte = self._calculate_checksum(checksum_data)
+        # XOR de (SIZE + PAYLOAD) sem concatenar: os bytes do tamanho entram à parte
+        checksum_byte = (xor_checksum(payload_bytes) ^ size_bytes[0] ^ size_bytes[1]).to_bytes(1, 'big')
         packet = self.START_BYTE + size_bytes + payload_bytes + checksum_byte + self.END_BYTE
         return packet
 
@@ -144,10 +592,13 @@ class HexaProtocolClient:
     # - Verifica a integridade do pacote (END_BYTE e checksum)
     # - Extrai o tamanho e payload
     # - Descriptografa o payload se necessário
-    # - Decompõe o payload em suas partes (index, command, status, data)
+    # - Decompõe o payload em suas partes (index, command, status, data) com uma única
+    #   divisão, sem decodificar nem dividir o campo data
     # 
-    # Retorna um dicionário com as partes do payload
+    # Aceita bytes ou memoryview (pacotes do HexaFramer) sem copiar o pacote
+    # Retorna um HexaResponse
     def _parse_response(self, full_response):
+        full_response = memoryview(full_response)
         # Verifica se o pacote termina com o byte correto
         if full_response[-1] != self.END_BYTE[0]:
             raise ValueError("Pacote inválido (End Byte incorreto).")
@@ -162,109 +613,139 @@ class HexaProtocolClient:
 
         # Verifica o checksum do pacote
         received_checksum = full_response[-2]
-        checksum_data_to_verify = full_response[1:-2]
-        calculated_checksum_val = 0
-        for byte in checksum_data_to_verify:
-            calculated_checksum_val ^= byte
+        calculated_checksum_val = xor_checksum(full_response[1:-2])
         # Avisa se o checksum não corresponde, mas continua o processamento
         if received_checksum != calculated_checksum_val:
-            print(f"AVISO: Checksum inválido. Recebido: {received_checksum}, Calculado: {calculated_checksum_val}. Prosseguindo...")
-        # Tenta decodificar o payload para identificar o comando
-        try:
-            # Tenta converter os bytes para string UTF-8
-            temp_payload_str = payload_bytes.decode('utf-8')
-            # Extrai o comando da resposta (segundo campo após divisão por '+')
-            command_in_response = temp_payload_str.split('+')[1]
-        except (UnicodeDecodeError, IndexError):
-            # Se não conseguir decodificar ou não encontrar o comando, define como None
-            command_in_response = None
+            self.log.warning("Checksum inválido. Recebido: %s, Calculado: %s. Prosseguindo...",
+                             received_checksum, calculated_checksum_val)
+            if self.observer is not None:
+                self.observer.protocol_error(self.clock, "checksum")
 
         # Verifica se é necessário descriptografar o payload
         # - Deve estar autenticado
-        # - Não deve ser resposta dos comandos EA ou RA (que não são criptografados)
-        if self.is_authenticated and command_in_response not in ['EA', 'RA']:
-            print("DEBUG: Tentando descriptografar a resposta...")
+        # - O payload não pode ser texto legível: respostas de EA/RA e erros de sessão
+        #   (ex.: status 005) chegam sem criptografia e já trazem index+command+status
+        if self.is_authenticated and not self._is_plaintext(payload_bytes):
             try:
-                # Processo de descriptografia AES-CBC:
-                # 1. Extrai o IV (16 bytes iniciais)
-                iv = payload_bytes[:16]
-                # 2. Separa o payload criptografado (restante dos bytes)
-                encrypted_payload = payload_bytes[16:]
-                # 3. Configura o objeto de descriptografia AES com a chave da sessão
-                cipher = Cipher(algorithms.AES(self.aes_key), modes.CBC(iv))
-                decryptor = cipher.decryptor()
-                # 4. Descriptografa o payload
-                payload_bytes = decryptor.update(encrypted_payload) + decryptor.finalize()
-                print("DEBUG: Descriptografia bem-sucedida.")
+                # Descriptografia AES-CBC: 16 bytes iniciais de IV + payload criptografado
+                raw = self._session_cipher().decrypt(payload_bytes)
             except ValueError as e:
                 # Erro na descriptografia pode indicar problema com a chave AES
+                if self.observer is not None:
+                    self.observer.protocol_error(self.clock, "decrypt")
                 raise ValueError(f"Erro de descriptografia irrecuperável: {e}. A chave AES está dessincronizada.")
-                
-        payload_str = payload_bytes.rstrip(b'\x00').decode('utf-8', errors='ignore')
-        
-        print(f"DEBUG: Payload final para parsing: {repr(payload_str)}")
-        parts = payload_str.split('+')
-        
-        response_dict = {"index": "??", "command": "??", "status": "??", "data": ""}
-        if len(parts) >= 3:
-            response_dict["index"] = parts[0]; response_dict["command"] = parts[1]; response_dict["status"] = parts[2]
-            if len(parts) > 3:
-                response_dict["data"] = "+".join(parts[3:])
         else:
-            print(f"AVISO: Payload mal formatado recebido: {parts}")
-            if len(parts) > 0: response_dict["index"] = parts[0]
-            if len(parts) > 1: response_dict["command"] = parts[1]
-            if len(parts) > 2: response_dict["status"] = parts[2]
+            raw = bytes(payload_bytes)
+
+        # Remove o padding de zeros do AES
+        raw = raw.rstrip(b'\x00')
+        if self.packet_log.isEnabledFor(logging.DEBUG):
+            self.packet_log.debug("Payload recebido: %r", raw)
 
-        return response_dict
+        # Uma única divisão em até 4 partes: o campo data (4ª parte) continua em bytes,
+        # com eventuais '+' internos, sem ser dividido e juntado de novo
+        parts = raw.split(b'+', 3)
+        if len(parts) < 3:
+            self.log.warning("Payload mal formatado recebido (%d campos).", len(parts))
+            parts += [b'??'] * (3 - len(parts))
+        return HexaResponse(parts[0].decode('utf-8', errors='ignore'),
+                            parts[1].decode('utf-8', errors='ignore'),
+                            parts[2].decode('utf-8', errors='ignore'),
+                            parts[3] if len(parts) > 3 else b'')
+
+    # Indica se o payload é texto legível ("<index>+<command>..."), olhando só o início
+    # O índice tem sempre dois dígitos: num payload criptografado o terceiro byte quase
+    # nunca é '+', então na prática a verificação para aí (e nada é copiado)
+    @staticmethod
+    def _is_plaintext(payload):
+        if len(payload) < 4 or payload[2] != 0x2B:  # '+'
+            return False
+        head = bytes(payload[:16])
+        if not head[:2].isdigit():
+            return False
+        second = head.find(b'+', 3)
+        if second < 0:
+            if len(payload) > len(head):
+                return False
+            second = len(head)
+        return head[3:second].isalnum()
         
     # Envia um pacote e recebe a resposta do equipamento
     # - Usa um lock para garantir acesso exclusivo ao socket
     # - Limpa o buffer de recebimento antes de enviar
     # - Envia o pacote e aguarda a resposta
-    # - Lê o cabeçalho e o payload da resposta
     # - Processa a resposta usando _parse_response
-    def _send_and_receive(self, packet):
+    # - command: nome do comando, informado ao observer junto com o tempo de resposta
+    #   e usado para o prazo de resposta (command_timeouts)
+    # - timeout: prazo desta chamada, acima do prazo configurado para o comando
+    # - index: índice do pacote enviado; respostas com outro índice (atrasadas, de um
+    #   comando que já expirou) são descartadas, como em send_commands
+    def _send_and_receive(self, packet, command=None, timeout=None, index=None):
+        if timeout is None:
+            timeout = self.command_timeouts.get(command, self.timeout)
         with self.socket_lock:  # Garante acesso exclusivo ao socket
-            # Verifica se há conexão ativa
-            if not self.socket:
-                raise ConnectionError("Não conectado. Chame connect() primeiro.")
-            
-            # Limpa o buffer de recebimento
-            self.socket.setblocking(False)
-            try:
-                while self.socket.recv(4096): pass
-            except BlockingIOError:
-                pass
-            self.socket.setblocking(True)
+            self._prepare_channel()
+            start = time.monotonic()
+            deadline = start + timeout
+            self._write(packet)
+            while True:
+                try:
+                    frame = self._read_frame(max(deadline - time.monotonic(), 0.001))
+                except TimeoutError:
+                    if self.observer is not None:
+                        self.observer.protocol_error(self.clock, "timeout")
+                    raise
+                response = self._parse_response(frame)
+                if index is None or response.index == index:
+                    break
+                self.log.debug("Resposta atrasada descartada (índice %s, esperado %s).", response.index, index)
+            if self.observer is not None and command is not None:
+                self.observer.command_done(self.clock, command, time.monotonic() - start)
+            return response
 
-            # Envia o pacote
+    # Verifica se há conexão ativa e limpa o buffer de recebimento do socket
+    # (respostas atrasadas de comandos anteriores). Deve ser chamado com socket_lock
+    def _prepare_channel(self):
+        if self.transport is not None:
+            self.transport.discard_pending()
+            return
+        if not self.socket:
+            raise ConnectionError("Não conectado. Chame connect() primeiro.")
+        self.framer.clear()
+        self.socket.setblocking(False)
+        try:
+            while self.socket.recv(4096): pass
+        except BlockingIOError:
+            pass
+        self.socket.setblocking(True)
+
+    # Envia um pacote pelo transporte injetado ou pelo socket
+    def _write(self, packet):
+        if self.transport is not None:
+            self.transport.write(packet)
+        else:
             self.socket.sendall(packet)
 
-            # Recebe o cabeçalho (3 bytes: START_BYTE + 2 bytes de tamanho)
-            header = self.socket.recv(3)
-            if not header or header[0] != self.START_BYTE[0]:
-                raise ConnectionError("Resposta inválida ou conexão perdida (cabeçalho incorreto).")
-            
-            # Extrai o tamanho do payload e calcula bytes totais a receber
-            payload_size = int.from_bytes(header[1:3], 'little')
-            bytes_to_read = payload_size + 2  # +2 para checksum e END_BYTE
-            
-            # Recebe o resto do pacote em chunks
-            response_data = b''
-            while len(response_data) < bytes_to_read:
-                chunk = self.socket.recv(bytes_to_read - len(response_data))
-                if not chunk:
-                    raise ConnectionError("Conexão perdida durante o recebimento da resposta.")
-                response_data += chunk
-                
-            full_response = header + response_data
-            
-            return self._parse_response(full_response)
-            
+    # Retorna o próximo pacote recebido, aguardando até timeout segundos
+    # Levanta TimeoutError se nada chegar no prazo
+    # Com socket, o pacote é um memoryview válido até a próxima leitura
+    def _read_frame(self, timeout):
+        if self.transport is not None:
+            return self.transport.read_frame(timeout)
+        # Lê do socket direto para o buffer do framer até ter um pacote completo
+        frame = self.framer.next_frame()
+        while frame is None:
+            self.socket.settimeout(timeout)
+            if self.framer.recv_into(self.socket) == 0:
+                raise ConnectionError("Conexão perdida durante o recebimento da resposta.")
+            frame = self.framer.next_frame()
+        return frame
+
     # Realiza o processo de autenticação com o equipamento
     # Processo:
     # 1. Envia comando RA para receber a chave pública RSA
+    #    (pulado se public_key já estiver preenchida; se o EA falhar com ela,
+    #    a chave é descartada e o processo recomeça pelo RA)
     # 2. Gera uma chave AES aleatória para a sessão
     # 3. Criptografa as credenciais e a chave AES com RSA
     # 4. Envia comando EA com as credenciais criptografadas
@@ -274,77 +755,103 @@ class HexaProtocolClient:
     # - password: senha do usuário
     # - _retry_count: contador interno de tentativas
     def authenticate(self, user, password, _retry_count=0):
+        if _retry_count > 0 or self.observer is None:
+            return self._authenticate(user, password, _retry_count)
+        # Mede a autenticação completa, incluindo as novas tentativas
+        start = time.monotonic()
+        ok = self._authenticate(user, password)
+        self.observer.handshake_done(self.clock, time.monotonic() - start, ok, self.used_cached_key)
+        return ok
+
+    # Etapas RA/EA de authenticate (sem a medição de tempo)
+    def _authenticate(self, user, password, _retry_count=0):
+        self.used_cached_key = False
         # Limita o número de tentativas de autenticação
         if _retry_count > 2:
-            print("Falha na autenticação após múltiplas tentativas.")
+            self.log.warning("Falha na autenticação após múltiplas tentativas.")
             return False
 
+        # Chave pública já conhecida: tenta direto o EA (uma ida e volta)
+        if self.public_key is not None and _retry_count == 0:
+            try:
+                if self._send_credentials(user, password, self.public_key, fallback=True):
+                    self.used_cached_key = True
+                    return True
+            except Exception as e:
+                self.log.info("EA com a chave pública guardada falhou (%s). Refazendo RA...", e)
+            self.public_key = None
+            self.aes_key = None
+
         try:
             # Etapa 1: Requisição da chave pública RSA
-            print(f"Enviando comando RA (Tentativa {_retry_count + 1})...")
-            packet_ra = self._build_packet("RA", use_aes=False)
-            response_ra = self._send_and_receive(packet_ra)
+            self.log.debug("Enviando comando RA (Tentativa %d)...", _retry_count + 1)
+            index = self._next_index()
+            packet_ra = self._build_packet("RA", index=index, use_aes=False)
+            response_ra = self._send_and_receive(packet_ra, "RA", index=index)
             
             # Se a sessão anterior expirou, tenta novamente
-            if response_ra['status'] == "005":
-                print("Sessão de autenticação anterior expirou. Reiniciando o processo...")
+            if response_ra.status == "005":
+                self.log.info("Sessão de autenticação anterior expirou. Reiniciando o processo...")
                 return self.authenticate(user, password, _retry_count + 1)
 
             # Verifica se a resposta RA foi bem sucedida
-            if response_ra['status'] in ["00", "000"]:
+            if response_ra.status in ["00", "000"]:
                 pass
             else:
-                print(f"Falha na etapa RA. Status: {response_ra['status']}")
+                self.log.warning("Falha na etapa RA. Status: %s", response_ra.status)
                 return False
 
             # Processa a resposta RA para extrair a chave pública
-            data_str = response_ra['data'].strip()
+            data_str = response_ra.data.strip()
             rsa_parts = data_str.split(']')
             if len(rsa_parts) < 2:
-                print(f"Resposta RA OK, mas payload da chave está mal formatado: {data_str}")
+                self.log.warning("Resposta RA OK, mas payload da chave está mal formatado.")
+                self.packet_log.debug("Payload da chave RA: %r", data_str)
                 return False 
             
-            # Extrai o módulo e expoente da chave RSA
-            modulus_b64, exponent_b64 = rsa_parts[0], rsa_parts[1]
-
-            # Gera uma nova chave AES aleatória para a sessão
-            self.aes_key = os.urandom(16)
-            aes_key_b64 = base64.b64encode(self.aes_key).decode('utf-8')
-            # Monta a string de credenciais: versão + usuário + senha + chave AES
-            credentials_str = f"1]{user}]{password}]{aes_key_b64}"
-            
-            # Reconstrói a chave pública RSA a partir dos dados recebidos
-            modulus_val = int.from_bytes(base64.b64decode(modulus_b64), 'big')
-            exponent_val = int.from_bytes(base64.b64decode(exponent_b64), 'big')
-            public_key = rsa.RSAPublicNumbers(exponent_val, modulus_val).public_key()
-            
-            encrypted_credentials = public_key.encrypt(
-                credentials_str.encode('utf-8'),
-                asym_padding.PKCS1v15()
-            )
-            encrypted_credentials_b64 = base64.b64encode(encrypted_credentials).decode('utf-8')
-
-            print("Enviando comando EA...")
-            packet_ea = self._build_packet("EA", data=encrypted_credentials_b64, use_aes=False)
-            response_ea = self._send_and_receive(packet_ea)
-            
-            if response_ea['status'] in ["07", "000"]:
-                self.is_authenticated = True
-                print("Autenticação bem-sucedida! Chave de sessão estabelecida.")
-                return True
-            else:
-                self.aes_key = None
-                error_details = response_ea.get('data', '')
-                print(f"Falha na autenticação (etapa EA). Status: {response_ea['status']} - Detalhes: {error_details}")
-                return False
+            # Reconstrói a chave pública RSA a partir do módulo e expoente recebidos
+            self.public_key = load_public_key(rsa_parts[0], rsa_parts[1])
+            return self._send_credentials(user, password, self.public_key)
                 
         except Exception as e:
-            print(f"Ocorreu um erro crítico durante a autenticação: {e}")
-            import traceback
-            traceback.print_exc()
+            self.log.error("Ocorreu um erro crítico durante a autenticação: %s", e, exc_info=True)
             self.is_authenticated = False
             self.aes_key = None
             return False
+
+    # Etapas 2 a 4 da autenticação: nova chave AES e credenciais criptografadas no EA
+    # Parâmetros:
+    # - public_key: chave pública RSA do equipamento
+    # - fallback: True quando a chave veio de cache (falha é registrada só em debug)
+    # Retorna True se o equipamento aceitou as credenciais
+    def _send_credentials(self, user, password, public_key, fallback=False):
+        # Gera uma nova chave AES aleatória para a sessão
+        self.aes_key = os.urandom(16)
+        aes_key_b64 = base64.b64encode(self.aes_key).decode('utf-8')
+        # Monta a string de credenciais: versão + usuário + senha + chave AES
+        credentials_str = f"1]{user}]{password}]{aes_key_b64}"
+
+        encrypted_credentials = public_key.encrypt(
+            credentials_str.encode('utf-8'),
+            asym_padding.PKCS1v15()
+        )
+        encrypted_credentials_b64 = base64.b64encode(encrypted_credentials).decode('utf-8')
+
+        self.log.debug("Enviando comando EA%s...", " (chave pública guardada)" if fallback else "")
+        index = self._next_index()
+        packet_ea = self._build_packet("EA", data=encrypted_credentials_b64, index=index, use_aes=False)
+        response_ea = self._send_and_receive(packet_ea, "EA", index=index)
+
+        if response_ea.status in ["07", "000"]:
+            self.is_authenticated = True
+            self.log.info("Autenticação bem-sucedida! Chave de sessão estabelecida.")
+            return True
+
+        self.aes_key = None
+        log = self.log.debug if fallback else self.log.warning
+        log("Falha na autenticação (etapa EA). Status: %s - Detalhes: %s",
+            response_ea.status, response_ea.data)
+        return False
             
     # Envia um comando para o equipamento
     # - Verifica se está autenticado (exceto para comandos RA e EA)
@@ -356,19 +863,101 @@ class HexaProtocolClient:
     # - command: comando a ser enviado
     # - status: código de status (padrão "00")
     # - data: dados adicionais do comando
-    def send_command(self, command, status="00", data=""):
+    # - timeout: prazo de resposta (padrão: command_timeouts[command] ou self.timeout)
+    def send_command(self, command, status="00", data="", timeout=None):
         # Verifica se é necessária autenticação para o comando
         if not self.is_authenticated:
             if command not in ["RA", "EA"]:  # Comandos RA e EA são permitidos sem autenticação
                 raise PermissionError("Autenticação necessária para enviar este comando.")
         
-        # Gera o índice do pacote (circular de 01 a 99)
+        # Constrói e envia o pacote, usando AES se autenticado
+        index = self._next_index()
+        packet = self._build_packet(command, status, data, index=index, use_aes=self.is_authenticated)
+        return self._send_and_receive(packet, command, timeout, index)
+
+    # Lê os registros de ponto (AFD) por faixa de NSR, página a página (ver iter_punch_records)
+    # Retorna um gerador de PunchRecord
+    def iter_punch_records(self, start_nsr=1, end_nsr=None, page_size=100):
+        return iter_punch_records(self.send_command, start_nsr, end_nsr, page_size)
+
+    # Gera o índice do próximo pacote (circular de 00 a 99)
+    def _next_index(self):
         index_str = str(self.index_counter % 100).zfill(2)
         self.index_counter += 1
+        return index_str
 
-        # Constrói e envia o pacote, usando AES se autenticado
-        packet = self._build_packet(command, status, data, index=index_str, use_aes=self.is_authenticated)
-        return self._send_and_receive(packet)
+    # Envia vários comandos em pipeline, sem esperar cada resposta para enviar o próximo
+    # - Mantém até `window` comandos em voo; cada resposta é associada ao seu comando
+    #   pelo índice do pacote, então o equipamento pode responder fora de ordem
+    # - Cada comando tem seu próprio prazo de `timeout` segundos a partir do envio
+    # - Os payloads são criptografados em lote (AesSessionCipher.encrypt_many)
+    #
+    # Parâmetros:
+    # - commands: lista de comandos; cada item é o nome do comando ou uma tupla
+    #   (command, status, data)
+    # - window: máximo de comandos aguardando resposta ao mesmo tempo (1 a MAX_PIPELINE_WINDOW)
+    # - timeout: prazo por comando (padrão: self.timeout)
+    # - return_exceptions: se True, comandos que expiram recebem um TimeoutError na
+    #   posição correspondente; se False, o primeiro timeout é levantado
+    # Retorna a lista de respostas na mesma ordem dos comandos
+    def send_commands(self, commands, window=8, timeout=None, return_exceptions=False):
+        if not self.is_authenticated:
+            raise PermissionError("Autenticação necessária para enviar comandos em pipeline.")
+        timeout = self.timeout if timeout is None else timeout
+        # Índices são circulares (100 valores): a janela não pode reutilizar um índice em voo
+        window = max(1, min(window, self.MAX_PIPELINE_WINDOW))
+
+        specs = []
+        for item in commands:
+            if isinstance(item, str):
+                item = (item,)
+            specs.append((item[0], item[1] if len(item) > 1 else "00", item[2] if len(item) > 2 else ""))
+        results = [None] * len(specs)
+
+        with self.socket_lock:
+            self._prepare_channel()
+            indexes = [self._next_index() for _ in specs]
+            payloads = [self._build_payload(c, st, d, i) for (c, st, d), i in zip(specs, indexes)]
+            packets = [self._frame_payload(p) for p in self._session_cipher().encrypt_many(payloads)]
+
+            in_flight = {}  # índice -> (posição do comando, prazo)
+            sent = 0
+            pending = len(specs)
+            while pending:
+                # Completa a janela de comandos em voo
+                while sent < len(packets) and len(in_flight) < window:
+                    self._write(packets[sent])
+                    in_flight[indexes[sent]] = (sent, time.monotonic() + timeout)
+                    sent += 1
+
+                deadline = min(d for _, d in in_flight.values())
+                try:
+                    frame = self._read_frame(max(deadline - time.monotonic(), 0.001))
+                except TimeoutError:
+                    now = time.monotonic()
+                    for index, (position, d) in list(in_flight.items()):
+                        if d <= now:
+                            if self.observer is not None:
+                                self.observer.protocol_error(self.clock, "timeout")
+                            error = TimeoutError(f"Sem resposta para o comando {specs[position][0]} (índice {index}) em {timeout}s.")
+                            if not return_exceptions:
+                                raise error
+                            results[position] = error
+                            del in_flight[index]
+                            pending -= 1
+                    continue
+
+                response = self._parse_response(frame)
+                entry = in_flight.pop(response.index, None)
+                if entry is None:
+                    continue  # Resposta atrasada de um comando que já expirou
+                results[entry[0]] = response
+                pending -= 1
+                if self.observer is not None:
+                    # Prazo = envio + timeout, então o envio é recuperado do prazo
+                    self.observer.command_done(self.clock, specs[entry[0]][0], time.monotonic() - (entry[1] - timeout))
+
+        return results
 
 
 # Código de exemplo e teste da classe
@@ -383,6 +972,9 @@ if __name__ == "__main__":
     USER = "admin"
     PASSWORD = "123"
     
+    # Exibe os logs do cliente no terminal
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s %(name)s: %(message)s")
+
     # Cria uma instância do cliente
     client = HexaProtocolClient(EQUIPMENT_IP)
 
@@ -0,0 +1,79 @@
+# Configuração dos logs do servidor
+# - As threads do Flask e o event loop do motor só colocam o registro numa fila
+#   (QueueHandler); uma thread própria (QueueListener) escreve no destino, então
+#   nenhuma requisição espera por I/O de log
+# - A thread não sobrevive a um fork (gunicorn --preload): cada processo filho inicia
+#   a sua, senão os registros do worker ficariam presos numa fila sem consumidor
+# - Nível geral por HEXA_LOG_NIVEL (padrão INFO)
+# - Dumps de pacotes (logger "hexa.packets") só com HEXA_DEBUG_PACOTES=1 ou debug_pacotes=True
+import atexit
+import logging
+import logging.handlers
+import os
+import queue
+
+FORMATO = "%(asctime)s %(levelname)s %(threadName)s %(name)s: %(message)s"
+LOGGER_PACOTES = "hexa.packets"
+
+# Ouvinte instalado pela última chamada de configurar_logs (reiniciado nos filhos de um fork)
+_ouvinte = None
+
+
+# O ouvinte pode ter sido parado por quem o recebeu de configurar_logs
+def _ativo():
+    return _ouvinte is not None and _ouvinte._thread is not None
+
+
+# Para o ouvinte, esvaziando a fila (também antes de um fork, para o filho não
+# herdar registros pendentes e escrevê-los de novo); sem efeito se já estiver parado
+def _parar():
+    if _ativo():
+        _ouvinte.stop()
+
+
+def _antes_do_fork():
+    global _retomar
+    _retomar = _ativo()
+    _parar()
+
+
+def _depois_do_fork():
+    if _retomar:
+        _ouvinte.start()
+
+
+_retomar = False
+os.register_at_fork(before=_antes_do_fork, after_in_parent=_depois_do_fork, after_in_child=_depois_do_fork)
+atexit.register(_parar)
+
+
+# Instala o QueueHandler no logger raiz e inicia a thread que escreve os registros
+# Parâmetros:
+# - nivel: nível do logger raiz (nome ou número); padrão HEXA_LOG_NIVEL ou INFO
+# - debug_pacotes: habilita os dumps de payload; padrão HEXA_DEBUG_PACOTES=1
+# - destino: handler final (padrão: StreamHandler no stderr)
+# Retorna o QueueListener (já iniciado, reiniciado após fork e parado automaticamente ao sair)
+def configurar_logs(nivel=None, debug_pacotes=None, destino=None):
+    global _ouvinte
+    if nivel is None:
+        nivel = os.environ.get("HEXA_LOG_NIVEL", "INFO").upper()
+    if debug_pacotes is None:
+        debug_pacotes = os.environ.get("HEXA_DEBUG_PACOTES") == "1"
+    if destino is None:
+        destino = logging.StreamHandler()
+        destino.setFormatter(logging.Formatter(FORMATO))
+
+    fila = queue.SimpleQueue()
+    ouvinte = logging.handlers.QueueListener(fila, destino, respect_handler_level=True)
+
+    raiz = logging.getLogger()
+    for handler in list(raiz.handlers):
+        raiz.removeHandler(handler)
+    raiz.addHandler(logging.handlers.QueueHandler(fila))
+    raiz.setLevel(nivel)
+    logging.getLogger(LOGGER_PACOTES).setLevel(logging.DEBUG if debug_pacotes else logging.WARNING)
+
+    _parar()
+    _ouvinte = ouvinte
+    ouvinte.start()
+    return ouvinte
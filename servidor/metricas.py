@@ -0,0 +1,207 @@
+# Métricas no formato de texto do Prometheus (GET /metrics), sem dependências externas
+# - Contadores e histogramas são atualizados no caminho do comando com um lock curto
+#   e poucas operações (bisect no histograma); nada é formatado até a coleta
+# - Valores que já existem em outros objetos (conexões ativas, filas, bytes do motor)
+#   são lidos só na coleta, por funções registradas em medidor()
+import bisect
+import threading
+
+# Limites dos histogramas de tempo (segundos)
+BUCKETS_RTT = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+BUCKETS_HANDSHAKE = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Comandos HEXA com série própria em hexa_comando_rtt_segundos; o nome do comando vem
+# do corpo de /api/comando, então qualquer outro valor cai em "outro" (sem isso cada
+# nome inventado por um cliente criaria uma série nova)
+COMANDOS_CONHECIDOS = frozenset({"RA", "EA", "RC", "RQ", "RR", "RH", "EH", "EC", "RU", "EU", "RE", "EE", "RD", "ED"})
+COMANDO_OUTRO = "outro"
+
+
+def _escapar(valor):
+    return str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _rotulos(nomes, valores, extra=None):
+    pares = [f'{n}="{_escapar(v)}"' for n, v in zip(nomes, valores)]
+    if extra is not None:
+        pares.append(f'{extra[0]}="{extra[1]}"')
+    return "{" + ",".join(pares) + "}" if pares else ""
+
+
+def _numero(valor):
+    if valor == float('inf'):
+        return "+Inf"
+    return repr(float(valor)) if isinstance(valor, float) else str(valor)
+
+
+# Contador que só cresce, com rótulos opcionais
+class Contador:
+    tipo = "counter"
+
+    def __init__(self, nome, ajuda, rotulos=()):
+        self.nome = nome
+        self.ajuda = ajuda
+        self.rotulos = tuple(rotulos)
+        self._valores = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *valores_rotulos, valor=1):
+        with self._lock:
+            self._valores[valores_rotulos] = self._valores.get(valores_rotulos, 0) + valor
+
+    def amostras(self):
+        with self._lock:
+            itens = list(self._valores.items())
+        return [f"{self.nome}{_rotulos(self.rotulos, r)} {_numero(v)}" for r, v in itens]
+
+
+# Histograma com limites fixos (acumulados só na coleta)
+class Histograma:
+    tipo = "histogram"
+
+    def __init__(self, nome, ajuda, rotulos=(), buckets=BUCKETS_RTT):
+        self.nome = nome
+        self.ajuda = ajuda
+        self.rotulos = tuple(rotulos)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}  # rótulos -> [contagens por faixa (+ uma para +Inf), soma]
+        self._lock = threading.Lock()
+
+    def observar(self, valor, *valores_rotulos):
+        faixa = bisect.bisect_left(self.buckets, valor)
+        with self._lock:
+            serie = self._series.get(valores_rotulos)
+            if serie is None:
+                serie = self._series[valores_rotulos] = [[0] * (len(self.buckets) + 1), 0.0]
+            serie[0][faixa] += 1
+            serie[1] += valor
+
+    def amostras(self):
+        with self._lock:
+            series = [(r, list(s[0]), s[1]) for r, s in self._series.items()]
+        linhas = []
+        for rotulos, contagens, soma in series:
+            acumulado = 0
+            for limite, contagem in zip(self.buckets + (float('inf'),), contagens):
+                acumulado += contagem
+                linhas.append(f"{self.nome}_bucket{_rotulos(self.rotulos, rotulos, ('le', _numero(limite)))} {acumulado}")
+            linhas.append(f"{self.nome}_sum{_rotulos(self.rotulos, rotulos)} {_numero(soma)}")
+            linhas.append(f"{self.nome}_count{_rotulos(self.rotulos, rotulos)} {acumulado}")
+        return linhas
+
+
+# Valor lido na hora da coleta
+# - funcao: retorna um número, ou um dicionário {tupla de rótulos: número}
+class Medidor:
+    def __init__(self, nome, ajuda, funcao, rotulos=(), tipo="gauge"):
+        self.nome = nome
+        self.ajuda = ajuda
+        self.funcao = funcao
+        self.rotulos = tuple(rotulos)
+        self.tipo = tipo
+
+    def amostras(self):
+        valor = self.funcao()
+        if not isinstance(valor, dict):
+            return [f"{self.nome} {_numero(valor)}"]
+        return [f"{self.nome}{_rotulos(self.rotulos, r)} {_numero(v)}" for r, v in valor.items()]
+
+
+# Conjunto de métricas exposto em /metrics
+class Metricas:
+    def __init__(self):
+        self._metricas = []
+
+    def _adicionar(self, metrica):
+        self._metricas.append(metrica)
+        return metrica
+
+    def contador(self, nome, ajuda, rotulos=()):
+        return self._adicionar(Contador(nome, ajuda, rotulos))
+
+    def histograma(self, nome, ajuda, rotulos=(), buckets=BUCKETS_RTT):
+        return self._adicionar(Histograma(nome, ajuda, rotulos, buckets))
+
+    def medidor(self, nome, ajuda, funcao, rotulos=(), tipo="gauge"):
+        return self._adicionar(Medidor(nome, ajuda, funcao, rotulos, tipo))
+
+    # Retira uma métrica (ex.: métricas que, num processo gateway, pertencem aos workers)
+    def remover(self, nome):
+        self._metricas = [m for m in self._metricas if m.nome != nome]
+
+    # Texto no formato de exposição do Prometheus (text/plain; version=0.0.4)
+    def renderizar(self):
+        linhas = []
+        for metrica in self._metricas:
+            linhas.append(f"# HELP {metrica.nome} {metrica.ajuda}")
+            linhas.append(f"# TYPE {metrica.nome} {metrica.tipo}")
+            linhas.extend(metrica.amostras())
+        return "\n".join(linhas) + "\n"
+
+
+# Junta as exposições de vários nós gateway numa só, com o rótulo no="<id>"
+# em cada amostra (cada família aparece uma vez, com as amostras de todos os nós)
+# Parâmetros:
+# - textos: {no_id: texto retornado por Metricas.renderizar() no nó}
+def juntar_exposicoes(textos):
+    familias = {}  # nome -> [cabeçalho, amostras]
+    for no, texto in textos.items():
+        rotulo = f'no="{_escapar(no)}"'
+        atual = None
+        for linha in texto.splitlines():
+            if linha.startswith("# HELP "):
+                nome = linha.split(" ", 3)[2]
+                atual = familias.setdefault(nome, [[], []])
+                if not atual[0]:
+                    atual[0].append(linha)
+            elif linha.startswith("# TYPE "):
+                if len(atual[0]) == 1:
+                    atual[0].append(linha)
+            elif linha and atual is not None:
+                serie, valor = linha.rsplit(" ", 1)
+                if serie.endswith("}"):
+                    serie = f"{serie[:-1]},{rotulo}}}"
+                else:
+                    serie = f"{serie}{{{rotulo}}}"
+                atual[1].append(f"{serie} {valor}")
+    linhas = []
+    for cabecalho, amostras in familias.values():
+        linhas.extend(cabecalho)
+        linhas.extend(amostras)
+    return "\n".join(linhas) + "\n" if linhas else ""
+
+
+# Família hexa_no_up com um gauge por nó do cluster: 1 se respondeu à coleta, 0 se não
+# Parâmetros:
+# - responderam / falharam: ids dos nós
+def exposicao_nos(responderam, falharam):
+    linhas = ["# HELP hexa_no_up Nó do cluster respondeu à coleta de métricas (1) ou não (0).",
+              "# TYPE hexa_no_up gauge"]
+    situacao = {**{no: 0 for no in falharam}, **{no: 1 for no in responderam}}
+    linhas.extend(f'hexa_no_up{{no="{_escapar(no)}"}} {valor}' for no, valor in sorted(situacao.items()))
+    return "\n".join(linhas) + "\n"
+
+
+# Observador ligado ao HexaProtocolClient (HexaProtocolClient.observer)
+# Recebe os eventos do protocolo e atualiza as métricas correspondentes
+class ObservadorHexa:
+    def __init__(self, metricas):
+        self.rtt_comando = metricas.histograma(
+            "hexa_comando_rtt_segundos", "Tempo de ida e volta dos comandos, por comando.", ("comando",))
+        self.rtt_relogio = metricas.histograma(
+            "hexa_relogio_rtt_segundos", "Tempo de ida e volta dos comandos, por relógio.", ("relogio",))
+        self.handshake = metricas.histograma(
+            "hexa_handshake_segundos", "Duração da autenticação RA/EA (chave=cache quando só o EA foi enviado).",
+            ("resultado", "chave"), BUCKETS_HANDSHAKE)
+        self.erros = metricas.contador(
+            "hexa_erros_total", "Erros de protocolo, por tipo (checksum, decrypt, timeout).", ("tipo",))
+
+    def command_done(self, clock, command, seconds):
+        self.rtt_comando.observar(seconds, command if command in COMANDOS_CONHECIDOS else COMANDO_OUTRO)
+        self.rtt_relogio.observar(seconds, clock)
+
+    def handshake_done(self, clock, seconds, ok, cached_key=False):
+        self.handshake.observar(seconds, "sucesso" if ok else "falha", "cache" if cached_key else "ra")
+
+    def protocol_error(self, clock, kind):
+        self.erros.inc(kind)
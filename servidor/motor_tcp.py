@@ -0,0 +1,329 @@
+# Motor TCP da porta 3000 baseado em asyncio
+# - Um único event loop (numa thread dedicada) é dono de todos os sockets dos relógios
+# - Cada conexão separa o fluxo em pacotes HEXA e entrega cada resposta ao chamador
+#   que está aguardando, através de futures (sem threads por relógio e sem leitores concorrentes)
+# - Expõe send_command assíncrono e um invólucro síncrono para as threads do Flask
+# - Conexões mortas ou meio-abertas são detectadas por três caminhos: keepalive TCP
+#   (kernel), heartbeat de aplicação em relógios ociosos (ao_ocioso) e comandos
+#   seguidos sem resposta; a conexão é então abortada e sai do registro na hora,
+#   falhando os comandos pendentes em vez de deixá-los esperar o prazo inteiro
+import asyncio
+import collections
+import logging
+import threading
+import time
+
+from hexa_client import DEFAULT_KEEPALIVE, HexaFramer, set_keepalive
+
+logger = logging.getLogger("motor_tcp")
+
+# Tempo máximo (segundos) aguardando a resposta de um comando
+TIMEOUT_PADRAO = 10.0
+
+# Peso da amostra mais recente na média móvel do RTT
+PESO_RTT = 0.2
+
+# Segundos sem receber nada até o heartbeat (ao_ocioso) e até a conexão ser abortada
+INTERVALO_HEARTBEAT = 30.0
+INATIVIDADE_MAXIMA = 90.0
+
+# Comandos seguidos sem resposta no prazo que derrubam a conexão
+MAX_TIMEOUTS_SEGUIDOS = 2
+
+
+# Protocolo asyncio de uma conexão de relógio
+# - O asyncio escreve os bytes recebidos direto no buffer do HexaFramer (BufferedProtocol)
+# - Cada pacote completo é entregue ao leitor mais antigo que o aguarda (future)
+# - Pacotes que chegam sem leitor aguardando ficam numa fila curta até a próxima
+#   leitura, o que permite enviar vários comandos antes de ler as respostas (pipeline)
+class ConexaoRelogio(asyncio.BufferedProtocol):
+    # Máximo de pacotes guardados sem leitor (respostas em pipeline ainda não lidas)
+    MAX_NAO_LIDOS = 256
+
+    def __init__(self, motor):
+        self.motor = motor
+        self.transport = None
+        self.ip = None
+        self.porta = None
+        self._framer = HexaFramer()
+        self._leitores = collections.deque()  # Futures aguardando o próximo pacote, em ordem
+        self._nao_lidos = collections.deque(maxlen=self.MAX_NAO_LIDOS)  # Pacotes sem leitor
+        self._enviado_em = None       # Instante do envio mais antigo ainda sem resposta
+        self.ultimo_contato = None    # time.time() do último pacote recebido
+        self.rtt = None               # Média móvel do tempo de ida e volta (segundos)
+        self._contato = time.monotonic()  # Último pacote recebido (ou abertura), para o vigia
+        self._pulso_em = None         # Último heartbeat disparado sem resposta desde então
+        self._timeouts = 0            # Comandos seguidos sem resposta no prazo
+
+    def connection_made(self, transport):
+        self.transport = transport
+        self.ip, self.porta = transport.get_extra_info('peername')[:2]
+        try:
+            set_keepalive(transport.get_extra_info('socket'), self.motor.keepalive)
+        except OSError as e:
+            logger.debug("Keepalive não configurado para %s: %s", self.ip, e)
+        self.motor._registrar(self)
+
+    def get_buffer(self, sizehint):
+        return self._framer.get_buffer(sizehint)
+
+    def buffer_updated(self, nbytes):
+        self.motor.bytes_recebidos += nbytes
+        self._framer.commit(nbytes)
+        for pacote in self._framer.frames():
+            self._medir_rtt()
+            self._entregar(pacote)
+
+    # Atualiza último contato e RTT (aproximado em pipeline: mede do envio mais antigo)
+    def _medir_rtt(self):
+        self.ultimo_contato = time.time()
+        self._contato = time.monotonic()
+        self._pulso_em = None
+        self._timeouts = 0
+        if self._enviado_em is not None:
+            amostra = time.monotonic() - self._enviado_em
+            self.rtt = amostra if self.rtt is None else (1 - PESO_RTT) * self.rtt + PESO_RTT * amostra
+            self._enviado_em = None
+
+    def connection_lost(self, exc):
+        logger.info("Relógio desconectado: %s:%s (%s)", self.ip, self.porta, exc or "encerrada")
+        erro = ConnectionError(f"Conexão com o relógio {self.ip} encerrada.")
+        while self._leitores:
+            futuro = self._leitores.popleft()
+            if not futuro.done():
+                futuro.set_exception(erro)
+        self.motor._remover(self)
+
+    # Entrega o pacote ao leitor mais antigo que ainda o aguarda
+    # Leitores que já desistiram (timeout) são ignorados; sem leitor, o pacote vai para a fila
+    # O pacote é copiado aqui porque a memória do framer é reutilizada na próxima leitura
+    def _entregar(self, pacote):
+        while self._leitores:
+            futuro = self._leitores.popleft()
+            if not futuro.done():
+                futuro.set_result(bytes(pacote))
+                return
+        self._nao_lidos.append(bytes(pacote))
+
+    # Envia um pacote ao relógio (dentro do event loop)
+    def _enviar(self, packet):
+        if self.transport is None or self.transport.is_closing():
+            raise ConnectionError(f"Relógio {self.ip} não está conectado.")
+        if self._enviado_em is None:
+            self._enviado_em = time.monotonic()
+        self.motor.bytes_enviados += len(packet)
+        self.transport.write(packet)
+
+    # Registra um leitor para o próximo pacote que chegar
+    def _novo_leitor(self):
+        futuro = asyncio.get_running_loop().create_future()
+        self._leitores.append(futuro)
+        return futuro
+
+    # Aguarda a future de um leitor; se o prazo acabar ela é cancelada
+    # Vários prazos seguidos sem nenhum pacote recebido derrubam a conexão
+    async def _aguardar(self, futuro, timeout):
+        try:
+            return await asyncio.wait_for(futuro, timeout)
+        except asyncio.TimeoutError:
+            self._timeouts += 1
+            if self.motor.max_timeouts and self._timeouts >= self.motor.max_timeouts:
+                self.motor._expirar(self, f"{self._timeouts} comandos seguidos sem resposta")
+            raise TimeoutError(f"Relógio {self.ip} não respondeu em {timeout}s.")
+
+    # Retorna o próximo pacote recebido (da fila ou o próximo a chegar)
+    async def _ler(self, timeout):
+        if self._nao_lidos:
+            return self._nao_lidos.popleft()
+        return await self._aguardar(self._novo_leitor(), timeout)
+
+    # Envia um pacote e aguarda o pacote de resposta do relógio
+    # - Pacotes antigos sem leitor são descartados antes do envio
+    # - Chamadas concorrentes recebem as respostas na ordem de envio
+    # Retorna os bytes completos da resposta (para HexaProtocolClient._parse_response)
+    async def send_command(self, packet, timeout=TIMEOUT_PADRAO):
+        self._nao_lidos.clear()
+        self._enviar(packet)
+        return await self._aguardar(self._novo_leitor(), timeout)
+
+    async def _enviar_async(self, packet):
+        self._enviar(packet)
+
+    # Interface de transporte usada pelo HexaProtocolClient (threads fora do event loop)
+    # O cliente garante um único usuário por vez (socket_lock)
+    # - discard_pending: descarta respostas atrasadas ainda não lidas
+    # - write: envia um pacote sem esperar a resposta (permite pipeline)
+    # - read_frame: retorna o próximo pacote recebido
+    # - request: write + read_frame
+    def discard_pending(self):
+        self.motor.loop.call_soon_threadsafe(self._nao_lidos.clear)
+
+    def write(self, packet):
+        self.motor.executar(self._enviar_async(packet))
+
+    def read_frame(self, timeout=TIMEOUT_PADRAO):
+        return self.motor.executar(self._ler(timeout))
+
+    def request(self, packet, timeout=TIMEOUT_PADRAO):
+        self.write(packet)
+        return self.read_frame(timeout)
+
+    def fechar(self):
+        if self.transport is not None:
+            self.motor.loop.call_soon_threadsafe(self.transport.close)
+
+
+# Servidor TCP que aceita os relógios na porta 3000
+# Parâmetros:
+# - host/porta: endereço de escuta (porta 0 escolhe uma porta livre)
+# - backlog: fila de conexões pendentes do listen()
+# - registro: RegistroRelogios que localiza a conexão pelo NS (send_command) e é
+#   avisado quando uma conexão fecha
+# - ao_conectar: função chamada (no event loop) com cada nova ConexaoRelogio; deve
+#   apenas agendar trabalho bloqueante, como a identificação do NS, em outra thread
+# - ao_desconectar: função (ns, conexao) chamada (no event loop) quando uma conexão
+#   identificada fecha, ex.: para descartar a sessão do relógio
+# - keepalive: (ocioso, intervalo, tentativas) do keepalive TCP, ou None
+# - intervalo_heartbeat: segundos sem receber nada até chamar ao_ocioso(conexao)
+#   (no event loop; deve só agendar um comando leve ao relógio em outra thread)
+# - inatividade: segundos sem receber nada até abortar a conexão (None = nunca)
+# - max_timeouts: comandos seguidos sem resposta que abortam a conexão (0 = nunca)
+class MotorTCP:
+    def __init__(self, host='0.0.0.0', porta=3000, backlog=1024, registro=None, ao_conectar=None,
+                 ao_desconectar=None, keepalive=DEFAULT_KEEPALIVE, intervalo_heartbeat=INTERVALO_HEARTBEAT,
+                 ao_ocioso=None, inatividade=INATIVIDADE_MAXIMA, max_timeouts=MAX_TIMEOUTS_SEGUIDOS):
+        self.host = host
+        self.porta = porta
+        self.backlog = backlog
+        self.registro = registro
+        self.ao_conectar = ao_conectar
+        self.ao_desconectar = ao_desconectar
+        self.keepalive = keepalive
+        self.intervalo_heartbeat = intervalo_heartbeat
+        self.ao_ocioso = ao_ocioso
+        self.inatividade = inatividade
+        self.max_timeouts = max_timeouts
+        self.ativas = set()  # Todas as conexões abertas, identificadas ou não
+        self.loop = None
+
+        # Totais lidos pelas métricas (atualizados apenas no event loop)
+        self.conexoes_aceitas = 0
+        self.conexoes_expiradas = 0
+        self.heartbeats = 0
+        self.bytes_recebidos = 0
+        self.bytes_enviados = 0
+        self._servidor = None
+        self._thread = None
+        self._vigia = None
+
+    def _registrar(self, conexao):
+        self.ativas.add(conexao)
+        self.conexoes_aceitas += 1
+        logger.info("Relógio conectado via IP: %s", conexao.ip)
+        if self.ao_conectar is not None:
+            self.ao_conectar(conexao)
+
+    def _remover(self, conexao):
+        self.ativas.discard(conexao)
+        if self.registro is not None:
+            ns = self.registro.remover_conexao(conexao)
+            if ns is not None and self.ao_desconectar is not None:
+                self.ao_desconectar(ns, conexao)
+
+    # Aborta uma conexão considerada morta (sem FIN do outro lado não há o que esperar)
+    def _expirar(self, conexao, motivo):
+        if conexao.transport is None or conexao.transport.is_closing():
+            return
+        logger.warning("Relógio %s:%s sem resposta (%s): conexão encerrada.", conexao.ip, conexao.porta, motivo)
+        self.conexoes_expiradas += 1
+        conexao.transport.abort()
+
+    # Percorre as conexões periodicamente: heartbeat nas ociosas, aborta as inativas
+    # (os limites são relidos a cada volta e podem ser alterados com o motor rodando)
+    async def _vigiar(self):
+        while True:
+            limites = [t for t in (self.intervalo_heartbeat, self.inatividade) if t]
+            await asyncio.sleep(max(0.05, min(5.0, min(limites) / 4)) if limites else 5.0)
+            agora = time.monotonic()
+            for conexao in list(self.ativas):
+                silencio = agora - conexao._contato
+                # Com heartbeat, só expira depois de um heartbeat sem resposta
+                if self.inatividade and silencio > self.inatividade \
+                        and (self.ao_ocioso is None or conexao._pulso_em is not None):
+                    self._expirar(conexao, f"{silencio:.0f}s sem contato")
+                elif self.ao_ocioso is not None and self.intervalo_heartbeat and silencio > self.intervalo_heartbeat \
+                        and (conexao._pulso_em is None or agora - conexao._pulso_em > self.intervalo_heartbeat):
+                    conexao._pulso_em = agora
+                    self.heartbeats += 1
+                    try:
+                        self.ao_ocioso(conexao)
+                    except Exception:
+                        logger.exception("Erro ao agendar o heartbeat de %s", conexao.ip)
+
+    # Inicia o event loop numa thread daemon e aguarda a porta estar aberta
+    def iniciar(self):
+        pronto = threading.Event()
+        erros = []
+
+        def rodar():
+            self.loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(self.loop)
+            try:
+                self._servidor = self.loop.run_until_complete(self.loop.create_server(
+                    lambda: ConexaoRelogio(self), self.host, self.porta, backlog=self.backlog))
+            except OSError as e:
+                erros.append(e)
+                pronto.set()
+                return
+            self.porta = self._servidor.sockets[0].getsockname()[1]
+            self._vigia = self.loop.create_task(self._vigiar())
+            logger.info("Porta %s aberta: Aguardando relógios...", self.porta)
+            pronto.set()
+            self.loop.run_forever()
+
+        self._thread = threading.Thread(target=rodar, name="motor-tcp", daemon=True)
+        self._thread.start()
+        pronto.wait()
+        if erros:
+            raise erros[0]
+
+    # Encerra o servidor e todas as conexões
+    def parar(self):
+        if self.loop is None:
+            return
+
+        async def encerrar():
+            self._vigia.cancel()
+            self._servidor.close()
+            for conexao in list(self.ativas):
+                conexao.transport.close()
+            await self._servidor.wait_closed()
+
+        self.executar(encerrar())
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join()
+
+    # Soma das filas de todas as conexões: respostas não lidas e leitores aguardando
+    # (calculada no event loop, dono do conjunto de conexões)
+    def profundidade_filas(self):
+        async def somar():
+            return {
+                "nao_lidos": sum(len(c._nao_lidos) for c in self.ativas),
+                "leitores": sum(len(c._leitores) for c in self.ativas),
+            }
+
+        if self.loop is None:
+            return {"nao_lidos": 0, "leitores": 0}
+        return self.executar(somar())
+
+    # Executa uma corrotina no event loop do motor e aguarda o resultado (uso síncrono)
+    def executar(self, corrotina):
+        return asyncio.run_coroutine_threadsafe(corrotina, self.loop).result()
+
+    # Envia um pacote para o relógio identificado pelo NS e aguarda a resposta
+    async def send_command(self, ns, packet, timeout=TIMEOUT_PADRAO):
+        try:
+            conexao = self.registro.obter(ns)
+        except KeyError:
+            raise ConnectionError(f"Relógio NS {ns} não está conectado na porta {self.porta}.")
+        return await conexao.send_command(packet, timeout)
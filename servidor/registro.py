@@ -0,0 +1,163 @@
+# Registro das conexões de relógios, identificadas pelo NS (número de série)
+# - Índices O(1) por NS, por IP (vários relógios atrás do mesmo NAT) e por usuário dono
+# - Seguro para uso simultâneo pelo event loop do motor TCP e pelas threads do Flask
+# - Último contato e RTT ficam na própria conexão (ConexaoRelogio) e são expostos em listar()
+import re
+import threading
+import time
+
+from hexa_client import HexaProtocolClient
+
+# Comando usado para perguntar o número de série ao relógio logo após a conexão
+# A resposta traz o valor entre colchetes (ex.: "NS[00014003750006771]")
+COMANDO_NS = "RC"
+CAMPO_NS = "NS"
+
+_VALOR_ENTRE_COLCHETES = re.compile(r'\[([^\]]*)\]')
+
+
+# Relógio conectado e identificado
+class EntradaRelogio:
+    __slots__ = ('ns', 'conexao', 'conectado_em')
+
+    def __init__(self, ns, conexao):
+        self.ns = ns
+        self.conexao = conexao
+        self.conectado_em = time.time()
+
+
+class RegistroRelogios:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._por_ns = {}           # ns -> EntradaRelogio
+        self._por_ip = {}           # ip -> set(ns) conectados a partir desse IP
+        self._ns_da_conexao = {}    # conexao -> ns
+        self._por_usuario = {}      # user_id -> set(ns) vinculados (online ou não)
+        # Função sem argumentos chamada quando um NS entra ou sai (ex.: anúncio no
+        # cluster); roda no event loop do motor, então deve ser rápida
+        self.ao_mudar = None
+
+    # Associa a conexão ao NS; uma conexão anterior do mesmo NS é fechada
+    def registrar(self, ns, conexao):
+        with self._lock:
+            anterior = self._por_ns.get(ns)
+            self._remover_ns(ns)
+            if conexao in self._ns_da_conexao:
+                self._remover_ns(self._ns_da_conexao[conexao])
+            self._por_ns[ns] = EntradaRelogio(ns, conexao)
+            self._por_ip.setdefault(conexao.ip, set()).add(ns)
+            self._ns_da_conexao[conexao] = ns
+        if anterior is not None and anterior.conexao is not conexao:
+            anterior.conexao.fechar()
+        if self.ao_mudar is not None:
+            self.ao_mudar()
+
+    # Remove a conexão (chamado quando o socket fecha)
+    # Retorna o NS que estava registrado nessa conexão (None se nenhum)
+    def remover_conexao(self, conexao):
+        with self._lock:
+            ns = self._ns_da_conexao.pop(conexao, None)
+            entrada = self._por_ns.get(ns)
+            removido = entrada is not None and entrada.conexao is conexao
+            if removido:
+                self._remover_ns(ns)
+        if removido and self.ao_mudar is not None:
+            self.ao_mudar()
+        return ns if removido else None
+
+    # Remove o NS dos índices de conexão (chamado com o lock)
+    def _remover_ns(self, ns):
+        entrada = self._por_ns.pop(ns, None)
+        if entrada is None:
+            return
+        self._ns_da_conexao.pop(entrada.conexao, None)
+        conectados = self._por_ip.get(entrada.conexao.ip)
+        if conectados is not None:
+            conectados.discard(ns)
+            if not conectados:
+                del self._por_ip[entrada.conexao.ip]
+
+    # Retorna a conexão do NS (KeyError se o relógio não estiver conectado)
+    def obter(self, ns):
+        return self._por_ns[ns].conexao
+
+    def online(self, ns):
+        return ns in self._por_ns
+
+    # NS registrado na conexão (None se ainda não identificada)
+    def ns_da_conexao(self, conexao):
+        return self._ns_da_conexao.get(conexao)
+
+    # Subconjunto dos NS informados que está conectado (uma consulta para uma lista inteira)
+    def online_entre(self, lista_ns):
+        with self._lock:
+            return {ns for ns in lista_ns if ns in self._por_ns}
+
+    def __len__(self):
+        return len(self._por_ns)
+
+    # NS de todos os relógios conectados e identificados
+    def conectados(self):
+        with self._lock:
+            return list(self._por_ns)
+
+    # NS conectados a partir de um IP
+    def por_ip(self, ip):
+        with self._lock:
+            return set(self._por_ip.get(ip, ()))
+
+    # --- Índice por usuário (espelho da tabela vinculos) ---
+
+    def carregar_vinculos(self, vinculos):
+        with self._lock:
+            self._por_usuario = {}
+            for user_id, ns in vinculos:
+                self._por_usuario.setdefault(user_id, set()).add(ns)
+
+    def vincular(self, user_id, ns):
+        with self._lock:
+            self._por_usuario.setdefault(user_id, set()).add(ns)
+
+    # NS vinculados ao usuário
+    def por_usuario(self, user_id):
+        with self._lock:
+            return set(self._por_usuario.get(user_id, ()))
+
+    # Situação de todos os relógios conectados (NS, IP, último contato, RTT)
+    def listar(self):
+        with self._lock:
+            entradas = list(self._por_ns.values())
+        return [{
+            "ns": e.ns,
+            "ip": e.conexao.ip,
+            "conectado_em": e.conectado_em,
+            "ultimo_contato": e.conexao.ultimo_contato,
+            "rtt_ms": round(e.conexao.rtt * 1000, 1) if e.conexao.rtt is not None else None,
+        } for e in entradas]
+
+
+# Descobre o NS de uma conexão recém-aberta perguntando ao próprio relógio
+# - credenciais: lista de (usuario, senha) a tentar, em ordem
+# - chave_publica: chave RSA guardada de um relógio vinculado a esse IP (dispensa o RA;
+#   se for de outro relógio, o EA falha e o cliente refaz o RA)
+# Retorna (ns, cliente autenticado) ou (None, None) se não foi possível identificar
+# O cliente mantém em public_key a chave usada, reaproveitada entre as credenciais
+def identificar(conexao, credenciais, chave_publica=None):
+    cliente = HexaProtocolClient(conexao.ip)
+    cliente.transport = conexao
+    cliente.public_key = chave_publica
+    for usuario, senha in credenciais:
+        if cliente.authenticate(usuario, senha):
+            break
+    else:
+        return None, None
+
+    resposta = cliente.send_command(COMANDO_NS, data=CAMPO_NS)
+    if resposta.status not in ("00", "000"):
+        return None, None
+    encontrado = _VALOR_ENTRE_COLCHETES.search(resposta.data)
+    ns = (encontrado.group(1) if encontrado else resposta.data).strip()
+    if not ns:
+        return None, None
+    cliente.set_log_context(f"NS {ns}")
+    return ns, cliente
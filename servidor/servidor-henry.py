@@ -1,69 +1,233 @@
-import socket
-import threading
-import sqlite3
+import argparse
 import logging
-from flask import Flask, request, jsonify
+import os
+import threading
+import traceback
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from flask import Flask, Response, request, jsonify, g
 from flask_cors import CORS
-from hexa_client import HexaProtocolClient # O seu ficheiro enviado
+from banco import BancoDados, CREDENCIAIS_PADRAO, PoolEsgotado
+from cluster import AnuncioNo, DiretorioSQLite, RegistroCluster, RoteadorGateways, SessoesCluster
+from coletor import ColetorRegistros
+from gateway import ClienteGateway, RegistroRemoto, ServidorGateway, SessoesRemotas, SOCKET_PADRAO
+from hexa_client import CommandRejected, HexaProtocolClient, HexaResponse, iter_punch_records
+from logs import configurar_logs
+from metricas import Metricas, ObservadorHexa, exposicao_nos, juntar_exposicoes
+from motor_tcp import MotorTCP
+from registro import RegistroRelogios, identificar
+from sessoes import FilaCheia, FilaEsgotada, GerenciadorSessoes, ErroAutenticacao, PRIORIDADE_TRANSFERENCIA
 
 app = Flask(__name__)
 CORS(app)
 DB_NAME = 'sistema_henry.sqlite'
 
-# Dicionário de conexões ativas na porta 3000
-# Chave: IP do relógio | Valor: Objeto socket
-relogios_ativos = {}
+# Conexões SQLite reaproveitadas entre as requisições (pool + WAL), com cache de
+# permissões e credenciais invalidado em /api/vincular
+banco = BancoDados(DB_NAME)
+
+# Socket Unix do gateway dos relógios (modo com vários workers HTTP, ver gateway.py e wsgi.py)
+# - Definido: este processo é só um worker HTTP; porta 3000, sessões e coletor ficam
+#   no processo iniciado com --gateway
+# - Vazio: tudo no mesmo processo
+GATEWAY = os.environ.get("HEXA_GATEWAY")
+
+# Vários gateways (nós) anunciados no diretório do SQLite (ver cluster.py)
+# - Definido: este processo é só um worker HTTP e cada comando vai ao nó dono do relógio
+CLUSTER = bool(os.environ.get("HEXA_CLUSTER"))
+WORKER = bool(GATEWAY) or CLUSTER
+
+# Pool de threads compartilhado pelos comandos em lote (limita relógios atendidos em paralelo)
+LOTE_MAX_WORKERS = 32
+executor_lote = ThreadPoolExecutor(max_workers=LOTE_MAX_WORKERS, thread_name_prefix="lote")
+
+# Prazo de resposta (segundos) por comando; os demais usam o prazo padrão do cliente (10s)
+# Comandos curtos falham rápido num relógio que parou de responder
+PRAZOS_COMANDO = {"RC": 5.0, "RQ": 5.0}
+HexaProtocolClient.command_timeouts = PRAZOS_COMANDO
+
+# Validade (segundos) das respostas de leitura reaproveitadas em /api/comando
+# Configurações (RC) mudam raramente; quantidades (RQ) mudam a cada batida
+# Qualquer outro comando enviado ao relógio descarta as respostas guardadas dele
+CACHE_RESPOSTAS = {"RC": 300.0, "RQ": 5.0}
+
+# Registros de ponto pedidos ao relógio por comando no download do AFD (padrão e máximo)
+REGISTROS_POR_PAGINA = 100
+REGISTROS_POR_PAGINA_MAX = 1000
 
 # --- BANCO DE DADOS ---
 def init_db():
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
-    # Tabela que vincula o Usuário do Site ao Relógio Físico
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS vinculos (
-            user_id TEXT,
-            relogio_ns TEXT,
-            relogio_ip TEXT,
-            PRIMARY KEY (user_id, relogio_ns)
-        )
-    """)
-    conn.commit()
-    conn.close()
-
-# --- MOTOR TCP (SOCKET) ---
-def servidor_socket():
-    server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    server.bind(('0.0.0.0', 3000))
-    server.listen(100)
-    print("Porta 3000 aberta: Aguardando relógios...")
-    
-    while True:
-        conn, addr = server.accept()
-        ip_relogio = addr[0]
-        relogios_ativos[ip_relogio] = conn
-        print(f"Relógio conectado via IP: {ip_relogio}")
-        # Mantém a thread viva para não fechar o socket
-        threading.Thread(target=manter_conexao, args=(conn, ip_relogio), daemon=True).start()
-
-def manter_conexao(conn, ip):
+    banco.init_db()
+    diretorio.init_db()
+    if not WORKER:
+        registro.carregar_vinculos(banco.todos_vinculos())
+
+# --- IDENTIFICAÇÃO DOS RELÓGIOS ---
+# Pergunta o NS ao relógio recém-conectado e o registra por NS (não pelo IP,
+# que se repete quando vários relógios saem pelo mesmo NAT)
+def identificar_relogio(conexao):
+    candidatos = banco.ns_por_ip(conexao.ip)
+
+    # O par ainda não é conhecido: tenta as credenciais de um único relógio vinculado a
+    # esse IP (o que tem chave pública guardada, se houver) e, por último, as padrão;
+    # as credenciais dos demais relógios do IP não são enviadas a quem não se identificou
+    chaves = {ns: banco.chave_publica(ns) for ns in candidatos}
+    provavel = next((ns for ns in candidatos if chaves[ns] is not None), candidatos[0] if candidatos else None)
+    chave = chaves.get(provavel)  # Chave pública já conhecida: autentica sem o RA
+    credenciais = list(dict.fromkeys(([credenciais_relogio(provavel)] if provavel else []) + [CREDENCIAIS_PADRAO]))
     try:
-        while True:
-            if not conn.recv(1024): break
-    except:
-        pass
-    finally:
-        relogios_ativos.pop(ip, None)
-        conn.close()
+        ns, cliente = identificar(conexao, credenciais, chave)
+    except Exception:
+        logging.error("Erro ao identificar relógio %s: %s", conexao.ip, traceback.format_exc())
+        ns, cliente = None, None
+
+    if ns is not None:
+        # Sessão antes do registro: um /api/comando que encontre o NS já acha o cliente autenticado
+        sessoes.adotar(ns, conexao, cliente)
+        registro.registrar(ns, conexao)
+        if cliente.public_key is not None and cliente.public_key is not banco.chave_publica(ns):
+            banco.salvar_chave_publica(ns, cliente.public_key)
+    elif len(candidatos) == 1 and not registro.online(candidatos[0]):
+        # Sem resposta de NS: se só um relógio está vinculado a esse IP, assume que é ele,
+        # mas nunca no lugar de uma conexão já identificada com esse NS
+        ns = candidatos[0]
+        registro.registrar(ns, conexao)
+    else:
+        logging.warning("Não foi possível identificar o NS do relógio conectado via %s.", conexao.ip)
+        return
+    logging.info("Relógio NS %s identificado via IP: %s", ns, conexao.ip)
+
+# Heartbeat de um relógio ocioso (MotorTCP.ao_ocioso); conexões ainda sem NS
+# não têm sessão e só saem por inatividade
+def pulsar_relogio(conexao):
+    ns = registro.ns_da_conexao(conexao)
+    if ns is not None:
+        sessoes.pulsar(ns)
 
 # --- LÓGICA DE VALIDAÇÃO ---
 def usuario_tem_permissao(user_id, ns_relogio):
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
     # Agora validamos pelo NS (Número de Série) vinculado ao usuário
-    cursor.execute("SELECT 1 FROM vinculos WHERE user_id = ? AND relogio_ns = ?", (user_id, ns_relogio))
-    permitido = cursor.fetchone() is not None
-    conn.close()
-    return permitido
+    return banco.usuario_tem_permissao(user_id, ns_relogio)
+
+# Busca as credenciais do relógio que foram salvas no banco no momento do vínculo
+def credenciais_relogio(ns_relogio):
+    return banco.credenciais_relogio(ns_relogio)
+
+# Permissão do usuário e credenciais do relógio numa única consulta
+# Retorna (permitido, (usuario_relogio, senha_relogio))
+def permissao_e_credenciais(user_id, ns_relogio):
+    return banco.permissao_e_credenciais(user_id, ns_relogio)
+
+# Diretório compartilhado dos nós gateway e dos relógios conectados em cada um
+diretorio = DiretorioSQLite(banco)
+
+if CLUSTER:
+    # Registro e sessões espalhados pelos nós; cada NS é atendido pelo nó que o tem conectado
+    roteador = RoteadorGateways(diretorio)
+    registro = RegistroCluster(roteador)
+    sessoes = SessoesCluster(roteador)
+    motor = coletor = executor_identificacao = executor_heartbeat = None
+elif GATEWAY:
+    # Registro e sessões vivem no gateway; mesma interface, atendida pelo socket Unix
+    cliente_gateway = ClienteGateway(GATEWAY)
+    registro = RegistroRemoto(cliente_gateway)
+    sessoes = SessoesRemotas(cliente_gateway)
+    motor = coletor = executor_identificacao = executor_heartbeat = None
+else:
+    # Relógios conectados na porta 3000, indexados por NS, IP e usuário dono
+    registro = RegistroRelogios()
+
+    # Threads que identificam o NS de cada relógio recém-conectado (handshake bloqueante)
+    executor_identificacao = ThreadPoolExecutor(max_workers=8, thread_name_prefix="identificacao")
+
+    # Heartbeats aos relógios ociosos (um relógio morto prende a thread até o prazo do comando)
+    executor_heartbeat = ThreadPoolExecutor(max_workers=16, thread_name_prefix="heartbeat")
+
+    # Motor asyncio que é dono de todos os sockets dos relógios na porta 3000
+    # Keepalive TCP, heartbeat após 30s ociosos e conexão abortada após 90s sem contato
+    # (padrões do motor_tcp); a sessão de uma conexão fechada é descartada na hora
+    motor = MotorTCP(porta=3000, registro=registro,
+                     ao_conectar=lambda conexao: executor_identificacao.submit(identificar_relogio, conexao),
+                     ao_desconectar=lambda ns, conexao: sessoes.descartar_conexao(ns, conexao),
+                     ao_ocioso=lambda conexao: executor_heartbeat.submit(pulsar_relogio, conexao))
+
+    # Sessões autenticadas reaproveitadas entre requisições (uma por NS), cada uma com
+    # fila de comandos por prioridade (até 32 aguardando, 30s de espera; ver sessoes.py)
+    # A chave pública RSA de cada relógio fica guardada no banco: reconexões autenticam só com o EA
+    sessoes = GerenciadorSessoes(registro.obter, credenciais_relogio,
+                                 banco.chave_publica, banco.salvar_chave_publica,
+                                 ttl_respostas=CACHE_RESPOSTAS)
+
+    # Coleta periódica dos registros de ponto de todos os relógios conectados para o SQLite
+    coletor = ColetorRegistros(banco, registro, sessoes)
+
+# --- MÉTRICAS (GET /metrics) ---
+# RTT por comando e por relógio, handshake e erros de protocolo vêm do HexaProtocolClient;
+# o resto é lido dos objetos do servidor apenas quando o Prometheus coleta
+# Num worker (HEXA_GATEWAY), /metrics junta as métricas HTTP do worker às do gateway;
+# com HEXA_CLUSTER, às de todos os nós, com o rótulo no
+metricas = Metricas()
+duracao_api = metricas.histograma("api_requisicao_segundos", "Duração das requisições HTTP, por rota.", ("rota",))
+if not WORKER:
+    HexaProtocolClient.observer = ObservadorHexa(metricas)
+    metricas.medidor("relogios_conexoes_ativas", "Conexões abertas na porta 3000 (identificadas ou não).",
+                     lambda: len(motor.ativas))
+    metricas.medidor("relogios_identificados", "Relógios conectados com NS identificado.", lambda: len(registro))
+    metricas.medidor("motor_conexoes_aceitas_total", "Conexões aceitas na porta 3000.",
+                     lambda: motor.conexoes_aceitas, tipo="counter")
+    metricas.medidor("motor_conexoes_expiradas_total", "Conexões abortadas por falta de resposta (heartbeat, inatividade).",
+                     lambda: motor.conexoes_expiradas, tipo="counter")
+    metricas.medidor("motor_heartbeats_total", "Heartbeats disparados para relógios ociosos.",
+                     lambda: motor.heartbeats, tipo="counter")
+    metricas.medidor("motor_bytes_recebidos_total", "Bytes recebidos dos relógios.",
+                     lambda: motor.bytes_recebidos, tipo="counter")
+    metricas.medidor("motor_bytes_enviados_total", "Bytes enviados aos relógios.",
+                     lambda: motor.bytes_enviados, tipo="counter")
+    metricas.medidor("motor_fila_profundidade", "Pacotes sem leitor e leitores aguardando, somados por fila.",
+                     lambda: {(fila,): n for fila, n in motor.profundidade_filas().items()}, ("fila",))
+    metricas.medidor("executor_fila_profundidade", "Tarefas aguardando thread nos executores.",
+                     lambda: {("identificacao",): executor_identificacao._work_queue.qsize(),
+                              ("heartbeat",): executor_heartbeat._work_queue.qsize(),
+                              ("lote",): executor_lote._work_queue.qsize()}, ("executor",))
+    metricas.medidor("sessoes_ativas", "Sessões autenticadas em cache.", lambda: sessoes.estatisticas()["sessoes_ativas"])
+    metricas.medidor("sessoes_eventos_total", "Uso do pool de sessões (hit, miss, reautenticação).",
+                     lambda: {("hit",): sessoes.hits, ("miss",): sessoes.misses,
+                              ("reautenticacao",): sessoes.reautenticacoes,
+                              ("chave_reutilizada",): sessoes.chaves_reutilizadas,
+                              ("agrupado",): sessoes.agrupados, ("fila_cheia",): sessoes.filas_cheias,
+                              ("fila_esgotada",): sessoes.filas_esgotadas}, ("evento",), tipo="counter")
+    metricas.medidor("respostas_cache_eventos_total", "Respostas de leitura reaproveitadas em /api/comando.",
+                     lambda: {("hit",): sessoes.cache_respostas.hits, ("miss",): sessoes.cache_respostas.misses,
+                              ("invalidacao",): sessoes.respostas_invalidadas}, ("evento",), tipo="counter")
+    metricas.medidor("respostas_cache_entradas", "Respostas de leitura guardadas.",
+                     lambda: len(sessoes.cache_respostas))
+    metricas.medidor("sessoes_fila_aguardando", "Comandos aguardando a vez nas filas dos relógios.",
+                     lambda: sessoes.estatisticas()["aguardando"])
+    metricas.medidor("coletor_registros_total", "Registros de ponto gravados pelo coletor.",
+                     lambda: coletor.registros, tipo="counter")
+    metricas.medidor("coletor_coletas_total", "Coletas concluídas (com sucesso ou erro).",
+                     lambda: {("sucesso",): coletor.coletas, ("erro",): coletor.erros}, ("resultado",), tipo="counter")
+    metricas.medidor("coletor_relogios_agendados", "Relógios na agenda do coletor.",
+                     lambda: coletor.estatisticas()["relogios_agendados"])
+
+@app.before_request
+def iniciar_cronometro():
+    g.inicio_requisicao = time.perf_counter()
+
+@app.after_request
+def medir_requisicao(resposta):
+    # Respostas em streaming (NDJSON do lote) são medidas até o início do envio
+    inicio = g.get('inicio_requisicao')
+    if inicio is not None and request.url_rule is not None:
+        duracao_api.observar(time.perf_counter() - inicio, request.url_rule.rule)
+    return resposta
+
+# Todas as conexões do banco ocupadas: o cliente tenta de novo em instantes
+@app.errorhandler(PoolEsgotado)
+def banco_ocupado(e):
+    logging.warning("%s", e)
+    return jsonify({"status": "99", "resposta": "Servidor ocupado, tente novamente."}), 503, {"Retry-After": "1"}
 
 # --- ROTAS API ---
 
@@ -75,69 +239,274 @@ def enviar_comando():
     cmd = dados.get('comando')
 
     # 1. Validação de Segurança (Validando se o NS pertence ao User)
-    if not usuario_tem_permissao(user_id, ns_alvo):
+    # A mesma consulta já traz as credenciais, usadas se a sessão precisar autenticar
+    permitido, credenciais = permissao_e_credenciais(user_id, ns_alvo)
+    if not permitido:
         return jsonify({"status": "99", "resposta": "Acesso negado: Este NS não está vinculado à sua conta."}), 403
 
     # 2. Verificação de Status Online (Procurando o socket pelo NS)
-    if ns_alvo not in relogios_ativos:
+    if not registro.online(ns_alvo):
         return jsonify({"status": "99", "resposta": f"Relógio NS {ns_alvo} não está conectado na porta 3000."})
 
-    # 3. Execução do Comando
+    # 3. Execução do Comando (reaproveitando a sessão autenticada do relógio)
+    # Leituras em CACHE_RESPOSTAS podem vir de uma resposta recente (X-Cache: HIT e Age);
+    # "cache": false no corpo ou Cache-Control: no-cache força a ida ao relógio
+    # Fila do relógio cheia: 429 na hora; sem vez dentro do prazo: 503
+    usar_cache = dados.get('cache', True) is not False and 'no-cache' not in request.headers.get('Cache-Control', '')
     try:
-        conn = relogios_ativos[ns_alvo]
-        
-        # Criamos o cliente passando o NS (o host aqui vira o NS para controle interno)
-        client = HexaProtocolClient(ns_alvo)
-        client.socket = conn # Importante: injetamos a conexão que já está aberta
-        
-        # Buscamos as credenciais do relógio que foram salvas no banco no momento do vínculo
-        conn_db = sqlite3.connect(DB_NAME)
-        cursor = conn_db.cursor()
-        cursor.execute("SELECT user_relogio, pass_relogio FROM vinculos WHERE relogio_ns = ?", (ns_alvo,))
-        credenciais = cursor.fetchone()
-        conn_db.close()
-
-        user_rep = credenciais[0] if credenciais else "admin"
-        pass_rep = credenciais[1] if credenciais else "123"
-
-        # Autentica usando os dados que o usuário cadastrou no React
-        if client.authenticate(user_rep, pass_rep):
-            res = client.send_command(cmd)
-            # Retornamos a resposta do seu hexa_client.py
-            return jsonify({"status": "00", "resposta": res})
-        else:
-            return jsonify({"status": "99", "resposta": "Falha de autenticação interna com o Relógio."})
-            
+        res, situacao, idade = sessoes.executar_com_cache(ns_alvo, cmd, credenciais=credenciais, usar_cache=usar_cache)
+        cabecalhos = {"X-Cache": situacao}
+        if idade is not None:
+            cabecalhos["Age"] = str(int(idade))
+        return jsonify({"status": "00", "resposta": res.as_dict()}), 200, cabecalhos
+    except FilaCheia as e:
+        return jsonify({"status": "99", "resposta": f"Relógio ocupado: {e}"}), 429, {"Retry-After": "1"}
+    except FilaEsgotada as e:
+        return jsonify({"status": "99", "resposta": f"Relógio ocupado: {e}"}), 503, {"Retry-After": "5"}
+    except PoolEsgotado as e:
+        return banco_ocupado(e)
+    except ErroAutenticacao:
+        return jsonify({"status": "99", "resposta": "Falha de autenticação interna com o Relógio."})
     except Exception as e:
-        logging.error(f"Erro ao processar comando: {traceback.format_exc()}")
+        logging.error("Erro ao processar comando no relógio %s: %s", ns_alvo, traceback.format_exc())
         return jsonify({"status": "99", "resposta": str(e)})
 
+# Executa a lista de comandos num relógio (em pipeline) e monta a linha de resultado do lote
+def executar_lote_relogio(ns, comandos, janela, credenciais=None):
+    if not registro.online(ns):
+        return {"ns": ns, "status": "99", "resposta": f"Relógio NS {ns} não está conectado na porta 3000."}
+    try:
+        respostas = sessoes.executar_lote(ns, comandos, janela, credenciais=credenciais)
+    except ErroAutenticacao:
+        return {"ns": ns, "status": "99", "resposta": "Falha de autenticação interna com o Relógio."}
+    except (FilaCheia, FilaEsgotada) as e:
+        return {"ns": ns, "status": "99", "resposta": f"Relógio ocupado: {e}"}
+    except Exception as e:
+        logging.error("Erro ao processar lote no relógio %s: %s", ns, traceback.format_exc())
+        return {"ns": ns, "status": "99", "resposta": str(e)}
+    respostas = [r.as_dict() if isinstance(r, HexaResponse) else {"status": "99", "resposta": str(r)} for r in respostas]
+    return {"ns": ns, "status": "00", "respostas": respostas}
+
+@app.route('/api/comando/lote', methods=['POST'])
+def enviar_comando_lote():
+    # Corpo: {"user_id", "ns": [...] ou "todos": true, "comandos": ["RQ", {"comando": "EH", "dados": "..."}], "janela": 8}
+    # Resposta: NDJSON, uma linha por relógio na ordem em que cada um termina
+    dados = request.get_json(silent=True)
+    if not isinstance(dados, dict):
+        return jsonify({"status": "99", "resposta": "Corpo JSON inválido."}), 400
+    user_id = dados.get('user_id')
+    janela = dados.get('janela', 8)
+    if isinstance(janela, bool) or not isinstance(janela, int) or not 1 <= janela <= HexaProtocolClient.MAX_PIPELINE_WINDOW:
+        return jsonify({"status": "99", "resposta": f"janela deve ser um inteiro de 1 a "
+                                                    f"{HexaProtocolClient.MAX_PIPELINE_WINDOW}."}), 400
+
+    comandos = []
+    for item in dados.get('comandos') or []:
+        if isinstance(item, str):
+            comandos.append((item, "00", ""))
+        elif isinstance(item, dict) and isinstance(item.get('comando'), str):
+            comandos.append((item['comando'], str(item.get('status', "00")), str(item.get('dados', ""))))
+        else:
+            return jsonify({"status": "99", "resposta": f"Comando inválido: {item!r} (informe \"comando\")."}), 400
+    if not comandos:
+        return jsonify({"status": "99", "resposta": "Nenhum comando informado."}), 400
+
+    if dados.get('todos'):
+        lista_ns = sorted(registro.por_usuario(user_id))
+    elif isinstance(dados.get('ns'), list):
+        lista_ns = [str(ns) for ns in dados['ns']]
+    else:
+        return jsonify({"status": "99", "resposta": "ns deve ser uma lista de NS (ou use \"todos\": true)."}), 400
+    lista_ns = list(dict.fromkeys(lista_ns))  # Remove NS repetidos mantendo a ordem
+
+    negados = []
+    futuros = []
+    for ns in lista_ns:
+        permitido, credenciais = permissao_e_credenciais(user_id, ns)
+        if permitido:
+            futuros.append(executor_lote.submit(executar_lote_relogio, ns, comandos, janela, credenciais))
+        else:
+            negados.append(ns)
+
+    def gerar():
+        for ns in negados:
+            linha = {"ns": ns, "status": "99", "resposta": "Acesso negado: Este NS não está vinculado à sua conta."}
+            yield json.dumps(linha, ensure_ascii=False) + "\n"
+        for futuro in as_completed(futuros):
+            yield json.dumps(futuro.result(), ensure_ascii=False) + "\n"
+
+    return Response(gerar(), mimetype='application/x-ndjson')
+
+# Gera as linhas NDJSON do download de registros de ponto
+# - Lê página a página pela sessão do relógio (só uma página em memória); cada página
+#   entra na fila do relógio atrás dos comandos interativos
+# - Salva o cursor do consumidor a cada página e ao terminar, inclusive quando o
+#   navegador desconecta no meio: o próximo download continua do último registro enviado
+def gerar_registros(ns, credenciais, consumidor, nsr_inicial, nsr_final, pagina):
+    def enviar(comando, status, dados):
+        return sessoes.executar(ns, comando, status, dados, credenciais=credenciais,
+                                prioridade=PRIORIDADE_TRANSFERENCIA)
+
+    proximo_nsr = nsr_inicial
+    lidos = 0
+    try:
+        for registro_ponto in iter_punch_records(enviar, nsr_inicial, nsr_final, pagina):
+            yield json.dumps({"nsr": registro_ponto.nsr, "tipo": registro_ponto.type, "data": registro_ponto.date,
+                              "hora": registro_ponto.time, "pis": registro_ponto.pis}) + "\n"
+            proximo_nsr = registro_ponto.nsr + 1
+            lidos += 1
+            if lidos % pagina == 0:
+                banco.salvar_cursor(ns, consumidor, proximo_nsr)
+        yield json.dumps({"fim": True, "registros": lidos, "proximo_nsr": proximo_nsr}) + "\n"
+    except ErroAutenticacao:
+        yield json.dumps({"status": "99", "resposta": "Falha de autenticação interna com o Relógio.",
+                          "proximo_nsr": proximo_nsr}, ensure_ascii=False) + "\n"
+    except Exception as e:
+        if not isinstance(e, (CommandRejected, FilaCheia, FilaEsgotada)):
+            logging.error("Erro ao ler registros do relógio %s: %s", ns, traceback.format_exc())
+        yield json.dumps({"status": "99", "resposta": str(e), "proximo_nsr": proximo_nsr}, ensure_ascii=False) + "\n"
+    finally:
+        banco.salvar_cursor(ns, consumidor, proximo_nsr)
+
+@app.route('/api/registros', methods=['GET'])
+def baixar_registros():
+    # Parâmetros: userId, ns, nsr_inicial (padrão: onde o último download desse usuário parou),
+    # nsr_final (padrão: até o último registro) e pagina (registros por comando RR)
+    # Resposta: NDJSON, um registro por linha; a última linha traz "proximo_nsr" para retomar
+    user_id = request.args.get('userId')
+    ns_alvo = str(request.args.get('ns'))
+
+    permitido, credenciais = permissao_e_credenciais(user_id, ns_alvo)
+    if not permitido:
+        return jsonify({"status": "99", "resposta": "Acesso negado: Este NS não está vinculado à sua conta."}), 403
+    if not registro.online(ns_alvo):
+        return jsonify({"status": "99", "resposta": f"Relógio NS {ns_alvo} não está conectado na porta 3000."})
+
+    consumidor = f"download:{user_id}"
+    nsr_inicial = request.args.get('nsr_inicial', type=int)
+    if nsr_inicial is None:
+        nsr_inicial = banco.obter_cursor(ns_alvo, consumidor) or 1
+    nsr_final = request.args.get('nsr_final', type=int)
+    pagina = max(1, min(request.args.get('pagina', REGISTROS_POR_PAGINA, type=int), REGISTROS_POR_PAGINA_MAX))
+
+    return Response(gerar_registros(ns_alvo, credenciais, consumidor, nsr_inicial, nsr_final, pagina),
+                    mimetype='application/x-ndjson')
+
+@app.route('/api/registros/locais', methods=['GET'])
+def registros_locais():
+    # Registros já coletados pelo coletor (consulta local, sem ir ao relógio)
+    # Parâmetros: userId, ns, desde_nsr (padrão 1), limite (padrão e máximo 1000)
+    user_id = request.args.get('userId')
+    ns_alvo = str(request.args.get('ns'))
+    if not usuario_tem_permissao(user_id, ns_alvo):
+        return jsonify({"status": "99", "resposta": "Acesso negado: Este NS não está vinculado à sua conta."}), 403
+    desde_nsr = request.args.get('desde_nsr', 1, type=int)
+    limite = max(1, min(request.args.get('limite', 1000, type=int), 1000))
+    linhas = banco.consultar_registros(ns_alvo, desde_nsr, limite)
+    registros = [{"nsr": r[0], "tipo": r[1], "data": r[2], "hora": r[3], "pis": r[4]} for r in linhas]
+    proximo_nsr = registros[-1]["nsr"] + 1 if registros else desde_nsr
+    return jsonify({"status": "00", "registros": registros, "proximo_nsr": proximo_nsr})
+
+@app.route('/metrics', methods=['GET'])
+def exportar_metricas():
+    texto = metricas.renderizar()
+    if CLUSTER:
+        # Um nó inacessível não derruba a coleta: aparece com hexa_no_up 0
+        textos, falhas = roteador.em_cada_no(lambda cliente: cliente.chamar("metricas"))
+        texto += juntar_exposicoes(textos) + exposicao_nos(textos, falhas)
+    elif GATEWAY:
+        texto += cliente_gateway.chamar("metricas")
+    return Response(texto, mimetype='text/plain; version=0.0.4')
+
+@app.route('/api/sessoes', methods=['GET'])
+def estatisticas_sessoes():
+    # Contadores de hit/miss/reautenticação do pool de sessões
+    return jsonify(sessoes.estatisticas())
+
+@app.route('/api/cache', methods=['GET'])
+def estatisticas_cache():
+    # Contadores de hit/miss/invalidação dos caches de permissão e credenciais
+    return jsonify(banco.estatisticas_cache())
+
 @app.route('/api/vincular', methods=['POST'])
 def vincular():
     dados = request.json
     # Salva a relação no banco para o React usar depois
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
-    cursor.execute("INSERT OR REPLACE INTO vinculos VALUES (?, ?, ?)", 
-                   (dados['user_id'], dados['ns'], dados['ip']))
-    conn.commit()
-    conn.close()
+    # user_relogio/pass_relogio são opcionais (sem eles, o relógio usa as credenciais padrão)
+    ns = str(dados['ns'])
+    banco.vincular(dados['user_id'], ns, dados['ip'],
+                   dados.get('user_relogio'), dados.get('pass_relogio'))
+    registro.vincular(dados['user_id'], ns)
     return jsonify({"status": "00"})
 
 @app.route('/api/meus-relogios', methods=['GET'])
 def listar():
     user_id = request.args.get('userId')
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
-    cursor.execute("SELECT relogio_ns, relogio_ip FROM vinculos WHERE user_id = ?", (user_id,))
-    rows = cursor.fetchall()
-    conn.close()
-    
-    # Cruza dados do banco com relógios que estão com socket aberto agora
-    lista = [{"ns": r[0], "ip": r[1], "online": r[1] in relogios_ativos} for r in rows]
+    rows = banco.relogios_do_usuario(user_id)
+
+    # Cruza dados do banco com relógios que estão com socket aberto agora (pelo NS)
+    online = registro.online_entre([r[0] for r in rows])
+    lista = [{"ns": r[0], "ip": r[1], "online": r[0] in online} for r in rows]
     return jsonify(lista)
 
+@app.route('/api/relogios-conectados', methods=['GET'])
+def relogios_conectados():
+    # NS, IP, último contato e RTT de cada relógio conectado do usuário
+    meus = registro.por_usuario(request.args.get('userId'))
+    return jsonify([r for r in registro.listar() if r["ns"] in meus])
+
+@app.route('/api/cluster', methods=['GET'])
+def situacao_cluster():
+    # Nós no ar, relógios por nó e sugestões de rebalanceamento pelo hash consistente
+    if not CLUSTER:
+        return jsonify({"status": "ER", "erro": "Servidor fora do modo cluster (HEXA_CLUSTER)."}), 404
+    return jsonify(roteador.situacao())
+
+# Modos de execução:
+# - python servidor-henry.py: porta 3000 e API HTTP (servidor do Flask) no mesmo processo
+# - python servidor-henry.py --gateway [SOCKET]: só a porta 3000, sessões e coletor,
+#   atendendo os workers HTTP no socket Unix (padrão /tmp/hexa-gateway.sock)
+# - HEXA_GATEWAY=SOCKET gunicorn -w 4 -b 0.0.0.0:5000 wsgi:app: workers HTTP (ver wsgi.py)
+# - Cluster: cada nó com python servidor-henry.py --gateway 127.0.0.1:PORTA --no ID
+#   --porta-relogios PORTA, e os workers com HEXA_CLUSTER=1, todos na mesma máquina
+#   (diretório no SQLite local e canal do gateway sem autenticação; ver cluster.py)
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Servidor dos relógios HEXA")
+    parser.add_argument('--gateway', nargs='?', const=SOCKET_PADRAO, metavar='SOCKET',
+                        help="roda só o gateway dos relógios, atendendo os workers HTTP neste socket Unix")
+    parser.add_argument('--porta-http', type=int, default=5000)
+    parser.add_argument('--porta-relogios', type=int, default=3000)
+    parser.add_argument('--no', metavar='ID',
+                        help="anuncia este gateway no diretório do cluster com este identificador")
+    args = parser.parse_args()
+    if args.gateway and WORKER:
+        parser.error("--gateway não pode ser usado com HEXA_GATEWAY ou HEXA_CLUSTER definido")
+    if args.no and not args.gateway:
+        parser.error("--no exige --gateway")
+
+    configurar_logs()
     init_db()
-    threading.Thread(target=servidor_socket, daemon=True).start()
-    app.run(host='0.0.0.0', port=5000)
+    if not WORKER:
+        motor.porta = args.porta_relogios
+        motor.iniciar()
+        coletor.iniciar()
+
+    if args.gateway:
+        # A API fica nos workers: as métricas HTTP e do executor de lote são exportadas por eles
+        metricas.remover("api_requisicao_segundos")
+        metricas.remover("executor_fila_profundidade")
+        metricas.medidor("executor_fila_profundidade", "Tarefas aguardando thread nos executores.",
+                         lambda: {("identificacao",): executor_identificacao._work_queue.qsize(),
+                                  ("heartbeat",): executor_heartbeat._work_queue.qsize()}, ("executor",))
+        ServidorGateway(args.gateway, registro, sessoes, metricas).iniciar()
+        # No cluster, o nó sai do diretório ao encerrar (ou expira, se cair)
+        anuncio = AnuncioNo(diretorio, args.no, args.gateway, registro) if args.no else None
+        if anuncio is not None:
+            anuncio.iniciar()
+        try:
+            threading.Event().wait()
+        finally:
+            if anuncio is not None:
+                anuncio.parar()
+    else:
+        app.run(host='0.0.0.0', port=args.porta_http)
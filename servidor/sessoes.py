@@ -0,0 +1,427 @@
+# Gerenciamento de sessões autenticadas com os relógios
+# - Mantém um HexaProtocolClient autenticado por NS (socket + chave AES + contador de índice)
+# - Reutiliza a sessão entre requisições, evitando o handshake RA/EA a cada comando
+# - Reautentica apenas quando o relógio responde status 005 ou a descriptografia falha
+# - Cada relógio tem uma fila de comandos com prioridade (FilaRelogio): comandos da
+#   interface passam à frente de downloads e da coleta em segundo plano, e a fila
+#   tem profundidade máxima (FilaCheia) e prazo de espera (FilaEsgotada)
+# - Comandos de leitura idênticos ao mesmo relógio (ex.: vários usuários pedindo RQ)
+#   são agrupados: só o primeiro vai ao relógio e os demais recebem a mesma resposta
+# - Respostas de leituras podem ser reaproveitadas por alguns segundos ou minutos
+#   (executar_com_cache); qualquer outro comando enviado ao relógio as invalida
+import heapq
+import itertools
+import logging
+import threading
+import time
+from concurrent.futures import Future
+from contextlib import contextmanager
+
+from cache import CacheLRU
+from hexa_client import HexaProtocolClient, HexaResponse
+
+logger = logging.getLogger("sessoes")
+
+# Status devolvido pelo relógio quando a sessão de autenticação expirou
+STATUS_SESSAO_EXPIRADA = "005"
+
+# Comando leve enviado como heartbeat a relógios ociosos (ler quantidades)
+COMANDO_HEARTBEAT = "RQ"
+
+# Comandos que só leem o relógio: chamadas idênticas em andamento são agrupadas
+COMANDOS_LEITURA = frozenset({"RC", "RQ", "RR"})
+
+# Prioridades na fila de cada relógio (menor passa primeiro)
+PRIORIDADE_INTERATIVA = 0     # Comandos da interface (/api/comando)
+PRIORIDADE_TRANSFERENCIA = 1  # Lotes e downloads de registros
+PRIORIDADE_FUNDO = 2          # Coletor e heartbeat
+
+# Padrões da fila de cada relógio: comandos aguardando e segundos de espera
+MAX_FILA = 32
+PRAZO_FILA = 30.0
+
+# Situação de uma resposta de executar_com_cache (cabeçalho X-Cache da API)
+CACHE_HIT = "HIT"        # Resposta guardada, sem ida ao relógio
+CACHE_MISS = "MISS"      # Lida do relógio e guardada
+CACHE_BYPASS = "BYPASS"  # Comando sem cache (escrita, sem validade configurada ou cache ignorado)
+
+
+# Erro levantado quando não é possível autenticar com o relógio
+class ErroAutenticacao(Exception):
+    pass
+
+
+# A fila de comandos do relógio já tem o máximo de comandos aguardando
+class FilaCheia(Exception):
+    pass
+
+
+# O comando esperou na fila do relógio além do prazo, sem chegar a ser enviado
+class FilaEsgotada(Exception):
+    pass
+
+
+# Fila de comandos de um relógio: um comando por vez, na ordem de prioridade
+# (e de chegada, entre os de mesma prioridade)
+# - maximo: comandos aguardando além do que está em execução; acima disso, FilaCheia
+class FilaRelogio:
+    def __init__(self, maximo=MAX_FILA):
+        self.maximo = maximo
+        self._lock = threading.Lock()
+        self._ocupada = False
+        self._espera = []  # heap de [prioridade, ordem, Event]
+        self._ordem = itertools.count()
+
+    def __len__(self):
+        return len(self._espera)
+
+    # Aguarda a vez do comando; cada entrar() bem-sucedido exige um sair()
+    # Levanta FilaCheia (sem esperar) ou FilaEsgotada (depois de `timeout` segundos)
+    def entrar(self, prioridade=PRIORIDADE_INTERATIVA, timeout=None):
+        with self._lock:
+            if not self._ocupada:
+                self._ocupada = True
+                return
+            if len(self._espera) >= self.maximo:
+                raise FilaCheia(f"{len(self._espera)} comandos já aguardam este relógio.")
+            item = [prioridade, next(self._ordem), threading.Event()]
+            heapq.heappush(self._espera, item)
+        if item[2].wait(timeout):
+            return
+        with self._lock:
+            if item[2].is_set():  # A vez chegou junto com o prazo
+                return
+            self._espera.remove(item)
+            heapq.heapify(self._espera)
+        raise FilaEsgotada(f"Comando aguardou {timeout}s na fila do relógio.")
+
+    # Passa a vez ao próximo da fila (a fila continua ocupada) ou a libera
+    def sair(self):
+        with self._lock:
+            if self._espera:
+                heapq.heappop(self._espera)[2].set()
+            else:
+                self._ocupada = False
+
+
+# Sessão autenticada com um relógio
+# - ns: número de série do relógio
+# - conexao: conexão do motor TCP sobre a qual a sessão foi estabelecida
+# - cliente: HexaProtocolClient que guarda a chave AES e o contador de índice; se
+#   informado, reaproveita um cliente já autenticado nessa conexão
+# - max_fila: comandos aguardando a vez nessa sessão (FilaRelogio)
+class SessaoRelogio:
+    def __init__(self, ns, conexao, cliente=None, max_fila=MAX_FILA):
+        self.ns = ns
+        self.conexao = conexao
+        self.cliente = cliente or HexaProtocolClient(ns)
+        self.cliente.transport = conexao  # Injeta a conexão que já está aberta
+        self.cliente.set_log_context(f"NS {ns}")
+        self.fila = FilaRelogio(max_fila)  # Serializa autenticação + comando na mesma sessão
+        self.ultimo_uso = time.monotonic()
+
+
+# Pool de sessões autenticadas, indexado pelo NS do relógio
+# Parâmetros:
+# - obter_conexao: função ns -> conexão aberta do relógio (KeyError se offline)
+# - obter_credenciais: função ns -> (usuario, senha) do relógio
+# - obter_chave / salvar_chave: funções ns -> chave pública RSA guardada (ou None) e
+#   (ns, chave) para guardar a chave recebida no RA; com elas, uma sessão nova
+#   autentica só com o EA (HexaProtocolClient.public_key)
+# - max_fila / prazo_fila: comandos aguardando por relógio e segundos de espera na fila
+# - ttl_respostas: {comando: segundos} das leituras que executar_com_cache pode
+#   reaproveitar (ex.: {"RC": 300, "RQ": 5}); tamanho_cache: respostas guardadas (LRU)
+class GerenciadorSessoes:
+    def __init__(self, obter_conexao, obter_credenciais, obter_chave=None, salvar_chave=None,
+                 max_fila=MAX_FILA, prazo_fila=PRAZO_FILA, ttl_respostas=None, tamanho_cache=10000):
+        self._obter_conexao = obter_conexao
+        self._obter_credenciais = obter_credenciais
+        self._obter_chave = obter_chave
+        self._salvar_chave = salvar_chave
+        self.max_fila = max_fila
+        self.prazo_fila = prazo_fila
+        self._sessoes = {}
+        self._em_andamento = {}  # (ns, comando, status, dados) -> (Future, prioridade) da leitura em andamento
+        self._lock = threading.Lock()
+
+        # Respostas de leitura: chave (ns, versão, comando, status, dados) -> (resposta, guardada_em)
+        # Uma escrita incrementa a versão do NS, e as respostas antigas deixam de ser encontradas
+        self.ttl_respostas = dict(ttl_respostas or {})
+        self.cache_respostas = CacheLRU(tamanho_cache, ttl=None)
+        self._versao_ns = {}
+
+        # Contadores expostos em estatisticas()
+        self.hits = 0              # Comando enviado em sessão já autenticada
+        self.misses = 0            # Sessão nova: foi preciso fazer o handshake completo
+        self.reautenticacoes = 0   # Sessão reaproveitada que expirou (005 / falha de AES)
+        self.chaves_reutilizadas = 0  # Autenticação feita só com o EA (chave pública guardada)
+        self.agrupados = 0         # Leitura respondida por uma chamada idêntica já em andamento
+        self.filas_cheias = 0      # Comando recusado: fila do relógio cheia
+        self.filas_esgotadas = 0   # Comando desistiu após o prazo na fila
+        self.respostas_invalidadas = 0  # Escritas que invalidaram as respostas guardadas do relógio
+
+    # Retorna a sessão do NS, criando uma nova se não existir
+    # ou se o relógio reconectou com outro socket
+    def _obter_sessao(self, ns):
+        conexao = self._obter_conexao(ns)
+        with self._lock:
+            sessao = self._sessoes.get(ns)
+            if sessao is None or sessao.conexao is not conexao:
+                sessao = SessaoRelogio(ns, conexao, max_fila=self.max_fila)
+                self._sessoes[ns] = sessao
+            return sessao
+
+    # Adota um cliente já autenticado (ex.: o usado para identificar o NS na conexão)
+    # como sessão do NS, poupando o handshake do primeiro comando
+    # Uma sessão que já usa essa conexão é mantida: trocá-la criaria um segundo
+    # cliente (outra chave AES, outra fila) sobre o mesmo transporte
+    def adotar(self, ns, conexao, cliente):
+        with self._lock:
+            atual = self._sessoes.get(ns)
+            if atual is None or atual.conexao is not conexao:
+                self._sessoes[ns] = SessaoRelogio(ns, conexao, cliente, self.max_fila)
+
+    # Executa o handshake RA/EA na sessão
+    # - credenciais: (usuario, senha) já consultadas pelo chamador; se None, usa obter_credenciais
+    # Levanta ErroAutenticacao se o relógio recusar as credenciais
+    # - Usa a chave pública guardada do relógio, se houver, e guarda a chave de um RA novo
+    def _autenticar(self, sessao, credenciais=None):
+        usuario, senha = credenciais or self._obter_credenciais(sessao.ns)
+        cliente = sessao.cliente
+        cliente.is_authenticated = False
+        if cliente.public_key is None and self._obter_chave is not None:
+            cliente.public_key = self._obter_chave(sessao.ns)
+        chave_anterior = cliente.public_key
+        ok = cliente.authenticate(usuario, senha)
+        if cliente.used_cached_key:
+            self._contar('chaves_reutilizadas')
+        elif cliente.public_key is not None and cliente.public_key is not chave_anterior \
+                and self._salvar_chave is not None:
+            try:
+                self._salvar_chave(sessao.ns, cliente.public_key)
+            except Exception as e:
+                # Sem a chave guardada a próxima sessão só volta a fazer o RA
+                logger.warning("Não foi possível guardar a chave pública do relógio NS %s: %s", sessao.ns, e)
+        if not ok:
+            raise ErroAutenticacao(f"Falha de autenticação com o relógio NS {sessao.ns}.")
+
+    # Envia um comando ao relógio usando a sessão em cache
+    # - Autentica apenas se a sessão ainda não estiver autenticada
+    # - Em status 005 ou erro de descriptografia, reautentica e repete o comando uma vez
+    # - credenciais: (usuario, senha) do relógio, se o chamador já as tiver consultado
+    # - prioridade: posição na fila do relógio (PRIORIDADE_*)
+    # - Leitura (COMANDOS_LEITURA) idêntica a uma já em andamento com prioridade igual
+    #   ou maior espera a resposta dela; uma de prioridade maior que a em andamento vai
+    #   à fila por conta própria (um RQ da interface não espera na vez do heartbeat)
+    # Retorna o HexaResponse do HexaProtocolClient
+    # Levanta FilaCheia / FilaEsgotada se o comando não conseguir a vez no relógio
+    def executar(self, ns, comando, status="00", dados="", credenciais=None, prioridade=PRIORIDADE_INTERATIVA):
+        if comando not in COMANDOS_LEITURA:
+            # Invalida antes e depois: uma leitura que passe à frente na fila não fica guardada
+            self._nova_versao(ns, contar=True)
+            try:
+                return self._executar(ns, comando, status, dados, credenciais, prioridade)
+            finally:
+                self._nova_versao(ns)
+
+        chave = (ns, comando, status, dados)
+        with self._lock:
+            atual = self._em_andamento.get(chave)
+            agrupar = atual is not None and atual[1] <= prioridade
+            if agrupar:
+                andamento = atual[0]
+                self.agrupados += 1
+            else:
+                # Passa a ser a leitura em andamento para as próximas idênticas
+                andamento = Future()
+                self._em_andamento[chave] = (andamento, prioridade)
+        if agrupar:
+            return andamento.result()
+        try:
+            resposta = self._executar(ns, comando, status, dados, credenciais, prioridade)
+            andamento.set_result(resposta)
+            return resposta
+        except BaseException as e:
+            andamento.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                if self._em_andamento.get(chave, (None,))[0] is andamento:
+                    del self._em_andamento[chave]
+
+    # Como executar(), reaproveitando a resposta de uma leitura idêntica recente
+    # - Só comandos em ttl_respostas; respostas com status de erro não são guardadas
+    # - usar_cache=False ignora a resposta guardada (e guarda a nova)
+    # Retorna (resposta, situação CACHE_*, idade em segundos da resposta guardada ou None)
+    def executar_com_cache(self, ns, comando, status="00", dados="", credenciais=None, usar_cache=True):
+        ttl = self.ttl_respostas.get(comando)
+        if ttl is None or comando not in COMANDOS_LEITURA:
+            return self.executar(ns, comando, status, dados, credenciais), CACHE_BYPASS, None
+
+        chave = (ns, self._versao_ns.get(ns, 0), comando, status, dados)
+        if usar_cache:
+            achou, guardada = self.cache_respostas.obter(chave)
+            if achou:
+                resposta, guardada_em = guardada
+                return resposta, CACHE_HIT, time.monotonic() - guardada_em
+        resposta = self.executar(ns, comando, status, dados, credenciais)
+        if resposta.status in ("00", "000"):
+            self.cache_respostas.guardar(chave, (resposta, time.monotonic()), ttl=ttl)
+        return resposta, CACHE_MISS, None
+
+    # Torna inalcançáveis as respostas guardadas do relógio (comando de escrita)
+    def _nova_versao(self, ns, contar=False):
+        with self._lock:
+            self._versao_ns[ns] = self._versao_ns.get(ns, 0) + 1
+            if contar:
+                self.respostas_invalidadas += 1
+
+    # Vez do comando na fila da sessão (bloco with), contando as recusas
+    @contextmanager
+    def _vez(self, sessao, prioridade):
+        try:
+            sessao.fila.entrar(prioridade, self.prazo_fila)
+        except FilaCheia:
+            self._contar('filas_cheias')
+            raise
+        except FilaEsgotada:
+            self._contar('filas_esgotadas')
+            raise
+        try:
+            yield
+        finally:
+            sessao.fila.sair()
+
+    def _executar(self, ns, comando, status, dados, credenciais, prioridade):
+        sessao = self._obter_sessao(ns)
+        with self._vez(sessao, prioridade):
+            try:
+                if sessao.cliente.is_authenticated:
+                    self._contar('hits')
+                else:
+                    self._contar('misses')
+                    self._autenticar(sessao, credenciais)
+
+                try:
+                    resposta = sessao.cliente.send_command(comando, status, dados)
+                except ValueError:
+                    # Chave AES dessincronizada: a sessão precisa ser refeita
+                    resposta = None
+
+                if resposta is None or resposta.status == STATUS_SESSAO_EXPIRADA:
+                    self._contar('reautenticacoes')
+                    self._autenticar(sessao, credenciais)
+                    resposta = sessao.cliente.send_command(comando, status, dados)
+
+                sessao.ultimo_uso = time.monotonic()
+                return resposta
+            except Exception:
+                # Qualquer outra falha (conexão perdida, autenticação recusada)
+                # descarta a sessão para que a próxima requisição comece do zero
+                self.invalidar(ns, sessao)
+                raise
+
+    # Envia vários comandos ao relógio em pipeline (HexaProtocolClient.send_commands)
+    # - comandos: lista de nomes de comando ou tuplas (comando, status, dados)
+    # - janela: máximo de comandos em voo; timeout: prazo por comando
+    # - Se a sessão expirou, reautentica e reenvia apenas os comandos recusados (005)
+    # - credenciais: (usuario, senha) do relógio, se o chamador já as tiver consultado
+    # - prioridade: posição na fila do relógio (padrão: atrás dos comandos interativos)
+    # Retorna as respostas na ordem dos comandos; comandos sem resposta no prazo
+    # recebem um TimeoutError na posição correspondente
+    def executar_lote(self, ns, comandos, janela=8, timeout=None, credenciais=None,
+                      prioridade=PRIORIDADE_TRANSFERENCIA):
+        escrita = any((c if isinstance(c, str) else c[0]) not in COMANDOS_LEITURA for c in comandos)
+        if escrita:
+            self._nova_versao(ns, contar=True)
+        try:
+            return self._executar_lote(ns, comandos, janela, timeout, credenciais, prioridade)
+        finally:
+            if escrita:
+                self._nova_versao(ns)
+
+    def _executar_lote(self, ns, comandos, janela, timeout, credenciais, prioridade):
+        sessao = self._obter_sessao(ns)
+        with self._vez(sessao, prioridade):
+            try:
+                if sessao.cliente.is_authenticated:
+                    self._contar('hits')
+                else:
+                    self._contar('misses')
+                    self._autenticar(sessao, credenciais)
+
+                try:
+                    respostas = sessao.cliente.send_commands(comandos, janela, timeout, return_exceptions=True)
+                except ValueError:
+                    # Chave AES dessincronizada: refaz a sessão e reenvia o lote inteiro
+                    respostas = [None] * len(comandos)
+
+                recusados = [i for i, r in enumerate(respostas)
+                             if r is None or (isinstance(r, HexaResponse) and r.status == STATUS_SESSAO_EXPIRADA)]
+                if recusados:
+                    self._contar('reautenticacoes')
+                    self._autenticar(sessao, credenciais)
+                    reenviadas = sessao.cliente.send_commands(
+                        [comandos[i] for i in recusados], janela, timeout, return_exceptions=True)
+                    for i, resposta in zip(recusados, reenviadas):
+                        respostas[i] = resposta
+
+                sessao.ultimo_uso = time.monotonic()
+                return respostas
+            except Exception:
+                self.invalidar(ns, sessao)
+                raise
+
+    # Heartbeat de aplicação: um comando leve na sessão do relógio ocioso
+    # A resposta atualiza o último contato da conexão; se não vier, o motor conta o
+    # timeout e derruba a conexão meio-aberta (MotorTCP.max_timeouts / inatividade)
+    # Retorna True se o relógio respondeu
+    def pulsar(self, ns):
+        try:
+            self.executar(ns, COMANDO_HEARTBEAT, prioridade=PRIORIDADE_FUNDO)
+            return True
+        except Exception as e:
+            logger.debug("Heartbeat sem resposta do relógio NS %s: %s", ns, e)
+            return False
+
+    # Descarta a sessão de uma conexão que fechou (MotorTCP.ao_desconectar)
+    def descartar_conexao(self, ns, conexao):
+        with self._lock:
+            sessao = self._sessoes.get(ns)
+            if sessao is not None and sessao.conexao is conexao:
+                del self._sessoes[ns]
+
+    # Incrementa um contador sob o lock do pool (várias sessões rodam em paralelo)
+    def _contar(self, nome):
+        with self._lock:
+            setattr(self, nome, getattr(self, nome) + 1)
+
+    # Remove a sessão do NS do pool
+    # - sessao: se informada, só remove se ainda for a sessão atual
+    def invalidar(self, ns, sessao=None):
+        with self._lock:
+            atual = self._sessoes.get(ns)
+            if atual is not None and (sessao is None or atual is sessao):
+                atual.cliente.is_authenticated = False
+                atual.cliente.aes_key = None
+                del self._sessoes[ns]
+
+    # Retorna os contadores de uso do pool
+    def estatisticas(self):
+        total = self.hits + self.misses
+        return {
+            "sessoes_ativas": len(self._sessoes),
+            "hits": self.hits,
+            "misses": self.misses,
+            "reautenticacoes": self.reautenticacoes,
+            "chaves_reutilizadas": self.chaves_reutilizadas,
+            "agrupados": self.agrupados,
+            "filas_cheias": self.filas_cheias,
+            "filas_esgotadas": self.filas_esgotadas,
+            "aguardando": sum(len(sessao.fila) for sessao in list(self._sessoes.values())),
+            "respostas_em_cache": len(self.cache_respostas),
+            "respostas_hits": self.cache_respostas.hits,
+            "respostas_misses": self.cache_respostas.misses,
+            "respostas_invalidadas": self.respostas_invalidadas,
+            "taxa_hit": round(self.hits / total, 4) if total else 0.0,
+        }
@@ -0,0 +1,5 @@
+# Os módulos do servidor são importados pelo nome, como ao rodar servidor-henry.py
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,119 @@
+import threading
+
+import pytest
+
+import cache
+from cache import CacheLRU
+
+
+class Relogio:
+    def __init__(self):
+        self.agora = 1000.0
+
+    def __call__(self):
+        return self.agora
+
+
+@pytest.fixture
+def relogio(monkeypatch):
+    relogio = Relogio()
+    monkeypatch.setattr(cache.time, "monotonic", relogio)
+    return relogio
+
+
+def test_obter_e_guardar():
+    lru = CacheLRU()
+    assert lru.obter("a") == (False, None)
+    lru.guardar("a", None)  # None também é um valor guardado (ex.: relógio sem chave)
+    assert lru.obter("a") == (True, None)
+    assert (lru.hits, lru.misses) == (1, 1)
+
+
+def test_expira_pelo_ttl(relogio):
+    lru = CacheLRU(ttl=10)
+    lru.guardar("a", 1)
+    relogio.agora += 9.9
+    assert lru.obter("a") == (True, 1)
+    relogio.agora += 0.2
+    assert lru.obter("a") == (False, None)
+    assert len(lru) == 0
+
+
+def test_sem_ttl_nao_expira(relogio):
+    lru = CacheLRU(ttl=None)
+    lru.guardar("a", 1)
+    relogio.agora += 1e9
+    assert lru.obter("a") == (True, 1)
+
+
+def test_remove_o_menos_usado():
+    lru = CacheLRU(maximo=2)
+    lru.guardar("a", 1)
+    lru.guardar("b", 2)
+    lru.obter("a")  # "b" passa a ser o menos usado
+    lru.guardar("c", 3)
+    assert lru.obter("b") == (False, None)
+    assert lru.obter("a") == (True, 1)
+    assert lru.obter("c") == (True, 3)
+
+
+def test_leitura_anterior_a_invalidacao_nao_e_guardada():
+    lru = CacheLRU()
+    geracao = lru.geracao()       # Consulta à origem começa...
+    lru.invalidar("a")            # ...um vínculo muda no meio...
+    lru.guardar("a", "antigo", geracao)
+    assert lru.obter("a") == (False, None)
+    lru.guardar("a", "novo", lru.geracao())
+    assert lru.obter("a") == (True, "novo")
+
+
+def test_limpar_tambem_descarta_leituras_em_andamento():
+    lru = CacheLRU()
+    lru.guardar("a", 1)
+    geracao = lru.geracao()
+    lru.limpar()
+    lru.guardar("b", 2, geracao)
+    assert len(lru) == 0
+
+
+def test_guardar_sem_geracao_ignora_invalidacoes():
+    lru = CacheLRU()
+    lru.invalidar("a")
+    lru.guardar("a", 1)
+    assert lru.obter("a") == (True, 1)
+
+
+def test_estatisticas():
+    lru = CacheLRU()
+    lru.guardar("a", 1)
+    lru.obter("a")
+    lru.obter("b")
+    lru.invalidar("a")
+    assert lru.estatisticas() == {"entradas": 0, "hits": 1, "misses": 1, "invalidacoes": 1, "taxa_hit": 0.5}
+
+
+def test_uso_simultaneo_respeita_o_maximo():
+    lru = CacheLRU(maximo=50)
+
+    def trabalhar(base):
+        for i in range(2000):
+            lru.guardar((base, i % 80), i)
+            lru.obter((base, (i * 7) % 80))
+            if i % 100 == 0:
+                lru.invalidar((base, i % 80))
+
+    threads = [threading.Thread(target=trabalhar, args=(n,)) for n in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(lru) <= 50
+
+
+def test_ttl_por_entrada(relogio):
+    lru = CacheLRU(ttl=None)
+    lru.guardar("rq", 1, ttl=5)
+    lru.guardar("rc", 2, ttl=300)
+    relogio.agora += 6
+    assert lru.obter("rq") == (False, None)
+    assert lru.obter("rc") == (True, 2)
@@ -0,0 +1,89 @@
+import pytest
+
+from banco import BancoDados
+from cluster import AnuncioNo, DiretorioSQLite, RegistroCluster, RoteadorGateways, SessoesCluster
+from gateway import ErroGateway
+from metricas import exposicao_nos, juntar_exposicoes
+
+
+class RegistroFalso:
+    def __init__(self, conectados):
+        self._conectados = list(conectados)
+        self.ao_mudar = None
+
+    def conectados(self):
+        return list(self._conectados)
+
+
+@pytest.fixture
+def diretorio(tmp_path):
+    banco = BancoDados(str(tmp_path / "cluster.sqlite"))
+    diretorio = DiretorioSQLite(banco)
+    diretorio.init_db()
+    yield diretorio
+    banco.pool.fechar()
+
+
+def test_no_reiniciado_com_o_mesmo_id_apaga_relogios_antigos(diretorio):
+    anterior = AnuncioNo(diretorio, "A", "/tmp/a.sock", RegistroFalso(["NS1", "NS2"]))
+    anterior._anunciar(completo=True)
+    assert diretorio.relogios() == {"NS1": "A", "NS2": "A"}
+
+    # Processo morto sem retirar(); o novo processo do nó A só tem o NS3
+    reiniciado = AnuncioNo(diretorio, "A", "/tmp/a.sock", RegistroFalso(["NS3"]))
+    reiniciado._anunciar(completo=True)
+    assert diretorio.relogios() == {"NS3": "A"}
+
+
+def test_anuncio_completo_nao_apaga_relogios_de_outro_no(diretorio):
+    AnuncioNo(diretorio, "B", "/tmp/b.sock", RegistroFalso(["NS9"]))._anunciar(completo=True)
+    AnuncioNo(diretorio, "A", "/tmp/a.sock", RegistroFalso(["NS1"]))._anunciar(completo=True)
+    assert diretorio.relogios() == {"NS1": "A", "NS9": "B"}
+
+
+def test_anuncios_seguintes_gravam_so_as_diferencas(diretorio):
+    registro = RegistroFalso(["NS1", "NS2"])
+    anuncio = AnuncioNo(diretorio, "A", "/tmp/a.sock", registro)
+    anuncio._anunciar(completo=True)
+    registro._conectados = ["NS2", "NS3"]
+    anuncio._anunciar()
+    assert diretorio.relogios() == {"NS2": "A", "NS3": "A"}
+
+
+class ClienteFalso:
+    def __init__(self, respostas):
+        self.respostas = respostas
+
+    def chamar(self, operacao, *args):
+        if self.respostas is None:
+            raise ErroGateway("Gateway dos relógios inacessível")
+        return self.respostas[operacao]
+
+
+@pytest.fixture
+def roteador(diretorio, monkeypatch):
+    diretorio.anunciar("A", "a", ["NS1"], completo=True)
+    diretorio.anunciar("B", "b", ["NS2"], completo=True)  # No ar pelo anúncio, mas sem responder
+    roteador = RoteadorGateways(diretorio)
+    clientes = {
+        "a": ClienteFalso({"listar": [{"ns": "NS1"}], "estatisticas_sessoes": {"hits": 3, "misses": 1},
+                           "metricas": "# HELP x X\n# TYPE x counter\nx 1\n", "por_usuario": ["NS1"]}),
+        "b": ClienteFalso(None),
+    }
+    monkeypatch.setattr(roteador, "cliente", clientes.__getitem__)
+    return roteador
+
+
+def test_no_inacessivel_fica_de_fora_das_consultas(roteador):
+    assert RegistroCluster(roteador).listar() == [{"ns": "NS1"}]
+    assert RegistroCluster(roteador).por_usuario("u") == {"NS1"}
+    assert SessoesCluster(roteador).estatisticas() == {"hits": 3, "misses": 1, "taxa_hit": 0.75}
+
+
+def test_metricas_com_no_inacessivel(roteador):
+    textos, falhas = roteador.em_cada_no(lambda cliente: cliente.chamar("metricas"))
+    assert falhas == ["B"]
+    texto = juntar_exposicoes(textos) + exposicao_nos(textos, falhas)
+    assert 'x{no="A"} 1' in texto
+    assert 'hexa_no_up{no="A"} 1' in texto
+    assert 'hexa_no_up{no="B"} 0' in texto
@@ -0,0 +1,241 @@
+import os
+import threading
+
+import pytest
+from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+
+from hexa_client import AesSessionCipher, HexaFramer, HexaProtocolClient, xor_checksum
+
+
+def pacote(payload):
+    tamanho = len(payload).to_bytes(2, 'little')
+    checksum = 0
+    for byte in tamanho + payload:
+        checksum ^= byte
+    return b'\x02' + tamanho + payload + bytes([checksum]) + b'\x03'
+
+
+# --- HexaFramer ---
+
+def test_framer_varios_pacotes_numa_leitura():
+    framer = HexaFramer()
+    a, b, c = pacote(b'01+RC+00'), pacote(b'02+RQ+00+x'), pacote(b'')
+    framer.feed(a + b + c)
+    assert [bytes(f) for f in framer.frames()] == [a, b, c]
+    assert len(framer) == 0
+
+
+def test_framer_pacote_em_pedacos():
+    framer = HexaFramer()
+    dados = pacote(b'01+RR+00+' + b'x' * 300)
+    for i in range(len(dados) - 1):
+        framer.feed(dados[i:i + 1])
+        assert framer.next_frame() is None
+    framer.feed(dados[-1:])
+    assert bytes(framer.next_frame()) == dados
+
+
+def test_framer_ressincroniza_depois_de_lixo():
+    framer = HexaFramer()
+    dados = pacote(b'01+RC+00')
+    framer.feed(b'\xff\x00lixo' + dados)
+    assert bytes(framer.next_frame()) == dados
+    assert framer.discarded == 6
+
+
+def test_framer_descarta_start_falso_com_tamanho_inconsistente():
+    framer = HexaFramer()
+    dados = pacote(b'01+RC+00')
+    # START seguido de um tamanho que aponta para um byte que não é END
+    lixo = b'\x02\x01\x00AB'
+    framer.feed(lixo + dados)
+    assert bytes(framer.next_frame()) == dados
+    assert framer.discarded == len(lixo)
+
+
+def test_framer_cresce_para_pacote_maior_que_o_buffer():
+    framer = HexaFramer(capacity=64)
+    grande = pacote(b'01+RR+00+' + bytes(range(256)) * 40)
+    pequeno = pacote(b'02+RQ+00')
+    framer.feed(grande + pequeno)
+    assert bytes(framer.next_frame()) == grande
+    assert bytes(framer.next_frame()) == pequeno
+
+
+def test_framer_pacote_maximo():
+    framer = HexaFramer(capacity=16)
+    dados = pacote(b'0' * 65535)
+    assert len(dados) == HexaFramer.MAX_FRAME
+    framer.feed(dados * 2)
+    assert [bytes(f) for f in framer.frames()] == [dados, dados]
+
+
+def test_framer_cheio_levanta_buffer_error():
+    framer = HexaFramer(capacity=16)
+    # Pacote parcial de tamanho máximo, nunca consumido, seguido de mais dados
+    with pytest.raises(BufferError):
+        framer.feed(b'\x02\xff\xff' + b'0' * (3 * HexaFramer.MAX_FRAME))
+
+
+def test_framer_compacta_sem_perder_pacote_parcial():
+    framer = HexaFramer(capacity=32)
+    a, b = pacote(b'01+RC+00+abcdefgh'), pacote(b'02+RQ+00+ijklmnop')
+    framer.feed(a + b[:5])
+    assert bytes(framer.next_frame()) == a
+    framer.feed(b[5:])
+    assert bytes(framer.next_frame()) == b
+    assert framer.next_frame() is None
+
+
+def test_framer_recv_into():
+    class Socket:
+        def __init__(self, pedacos):
+            self.pedacos = list(pedacos)
+
+        def recv_into(self, area):
+            pedaco = self.pedacos.pop(0) if self.pedacos else b''
+            area[:len(pedaco)] = pedaco
+            return len(pedaco)
+
+    dados = pacote(b'01+RC+00')
+    framer = HexaFramer()
+    socket = Socket([dados[:4], dados[4:]])
+    assert framer.recv_into(socket) == 4
+    assert framer.next_frame() is None
+    framer.recv_into(socket)
+    assert bytes(framer.next_frame()) == dados
+    assert framer.recv_into(socket) == 0
+
+
+# --- xor_checksum ---
+
+def checksum_laco(dados):
+    checksum = 0
+    for byte in dados:
+        checksum ^= byte
+    return checksum
+
+
+@pytest.mark.parametrize("tamanho", [0, 1, 2, 31, 32, 33, 63, 64, 65, 255, 1000, 4096, 65537])
+def test_xor_checksum_igual_ao_laco(tamanho):
+    dados = bytes((i * 131 + 7) % 256 for i in range(tamanho))
+    assert xor_checksum(dados) == checksum_laco(dados)
+
+
+def test_xor_checksum_aceita_memoryview_e_bytearray():
+    dados = bytes(range(256)) * 3
+    assert xor_checksum(memoryview(dados)[5:700]) == checksum_laco(dados[5:700])
+    assert xor_checksum(bytearray(dados)) == checksum_laco(dados)
+
+
+def test_xor_checksum_bytes_altos_e_zeros_a_direita():
+    # Zeros no fim não podem sumir na conversão para inteiro ('little')
+    dados = b'\xff' * 33 + b'\x00' * 40
+    assert xor_checksum(dados) == 0xff
+    assert xor_checksum(b'\x80' + b'\x00' * 100) == 0x80
+
+
+# --- AesSessionCipher ---
+
+def cbc_da_biblioteca(chave, iv, dados, decifrar=False):
+    contexto = Cipher(algorithms.AES(chave), modes.CBC(iv))
+    contexto = contexto.decryptor() if decifrar else contexto.encryptor()
+    return contexto.update(dados) + contexto.finalize()
+
+
+TAMANHOS_AES = [0, 1, 15, 16, 17, 100, 511, 512, 513, 527, 528, 1024, 8192, 65519, 65535]
+
+
+@pytest.mark.parametrize("tamanho", TAMANHOS_AES)
+def test_aes_cifrar_igual_ao_cbc(tamanho):
+    chave, iv = os.urandom(16), os.urandom(16)
+    payload = os.urandom(tamanho)
+    contexto = AesSessionCipher(chave)
+    cifrado = contexto.encrypt(payload, iv)
+    preenchido = payload + b'\x00' * (16 - tamanho % 16)
+    assert cifrado == iv + cbc_da_biblioteca(chave, iv, preenchido)
+
+
+@pytest.mark.parametrize("tamanho", TAMANHOS_AES)
+def test_aes_decifrar_igual_ao_cbc(tamanho):
+    chave, iv = os.urandom(16), os.urandom(16)
+    preenchido = os.urandom(tamanho) + b'\x00' * (16 - tamanho % 16)
+    cifrado = iv + cbc_da_biblioteca(chave, iv, preenchido)
+    contexto = AesSessionCipher(chave)
+    assert contexto.decrypt(cifrado) == preenchido
+    assert contexto.decrypt(memoryview(cifrado)) == preenchido
+
+
+def test_aes_decrypt_many_em_grupos_com_tamanhos_misturados():
+    chave = os.urandom(16)
+    contexto = AesSessionCipher(chave)
+    tamanhos = [(i * 37) % 700 for i in range(200)] + [4096, 65535, 0]
+    payloads = [os.urandom(t) for t in tamanhos]
+    cifrados = contexto.encrypt_many(payloads)
+    esperados = [cbc_da_biblioteca(chave, c[:16], c[16:], decifrar=True) for c in cifrados]
+    assert contexto.decrypt_many(cifrados) == esperados
+    assert [p.rstrip(b'\x00') for p in esperados] == [p.rstrip(b'\x00') for p in payloads]
+
+
+def test_aes_tamanho_invalido():
+    contexto = AesSessionCipher(os.urandom(16))
+    for dados in (b'', b'x' * 15, b'x' * 33):
+        with pytest.raises(ValueError):
+            contexto.decrypt(dados)
+        with pytest.raises(ValueError):
+            contexto.decrypt_many([dados])
+
+
+def test_aes_contexto_compartilhado_entre_threads():
+    chave = os.urandom(16)
+    contexto = AesSessionCipher(chave)
+    payloads = [os.urandom(n) for n in range(1, 300)]
+    erros = []
+
+    def trabalhar():
+        for payload in payloads:
+            if contexto.decrypt(contexto.encrypt(payload)).rstrip(b'\x00') != payload.rstrip(b'\x00'):
+                erros.append(payload)
+
+    threads = [threading.Thread(target=trabalhar) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert not erros
+
+
+# --- Índice das respostas em send_command ---
+
+class TransporteFalso:
+    def __init__(self, respostas):
+        self.respostas = list(respostas)
+        self.enviados = []
+
+    def discard_pending(self):
+        pass
+
+    def write(self, packet):
+        self.enviados.append(packet)
+
+    def read_frame(self, timeout):
+        if not self.respostas:
+            raise TimeoutError("sem resposta")
+        return self.respostas.pop(0)
+
+
+def test_send_command_descarta_resposta_atrasada_de_outro_indice():
+    cliente = HexaProtocolClient("teste")
+    atrasada = cliente._build_packet("RC", status="00", data="antiga", index="07")
+    certa = cliente._build_packet("RA", status="00", data="chave]01", index="01")
+    cliente.transport = TransporteFalso([atrasada, certa])
+    cliente.index_counter = 1
+    resposta = cliente.send_command("RA")
+    assert (resposta.index, resposta.command, resposta.data) == ("01", "RA", "chave]01")
+
+
+def test_send_command_so_com_respostas_atrasadas_expira():
+    cliente = HexaProtocolClient("teste")
+    cliente.transport = TransporteFalso([cliente._build_packet("RQ", index="42")])
+    with pytest.raises(TimeoutError):
+        cliente.send_command("RA", timeout=0.1)
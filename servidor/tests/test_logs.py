@@ -0,0 +1,49 @@
+import logging
+import os
+
+import pytest
+
+import logs
+
+
+@pytest.fixture
+def raiz_restaurada():
+    raiz = logging.getLogger()
+    handlers, nivel = list(raiz.handlers), raiz.level
+    yield
+    for handler in list(raiz.handlers):
+        raiz.removeHandler(handler)
+    for handler in handlers:
+        raiz.addHandler(handler)
+    raiz.setLevel(nivel)
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="requer fork()")
+def test_log_do_filho_apos_fork_e_escrito(tmp_path, raiz_restaurada):
+    arquivo = tmp_path / "servidor.log"
+    destino = logging.FileHandler(arquivo)
+    destino.setFormatter(logging.Formatter("%(process)d %(message)s"))
+    ouvinte = logs.configurar_logs(nivel="INFO", destino=destino)
+    logging.getLogger("teste").info("antes do fork")
+
+    pid = os.fork()
+    if pid == 0:
+        try:
+            logging.getLogger("teste").info("no filho")
+            ouvinte.stop()  # Esvazia a fila do filho antes de sair
+        finally:
+            os._exit(0)
+    _, situacao = os.waitpid(pid, 0)
+    assert os.waitstatus_to_exitcode(situacao) == 0
+
+    ouvinte.stop()
+    destino.close()
+    linhas = arquivo.read_text().splitlines()
+    assert f"{pid} no filho" in linhas
+    assert any(linha.endswith("antes do fork") for linha in linhas)
+
+
+def test_parar_depois_de_parado_pelo_chamador(raiz_restaurada):
+    ouvinte = logs.configurar_logs(nivel="INFO", destino=logging.NullHandler())
+    ouvinte.stop()
+    logs._parar()  # O mesmo que roda no atexit
@@ -0,0 +1,13 @@
+from metricas import Metricas, ObservadorHexa
+
+
+def test_comando_desconhecido_vai_para_outro():
+    metricas = Metricas()
+    observador = ObservadorHexa(metricas)
+    observador.command_done("NS1", "RQ", 0.01)
+    for i in range(100):
+        observador.command_done("NS1", f"X{i}", 0.01)
+    texto = metricas.renderizar()
+    assert 'hexa_comando_rtt_segundos_count{comando="RQ"} 1' in texto
+    assert 'hexa_comando_rtt_segundos_count{comando="outro"} 100' in texto
+    assert 'comando="X1"' not in texto
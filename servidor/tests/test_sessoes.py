@@ -0,0 +1,175 @@
+import threading
+import time
+
+import pytest
+
+import sessoes
+from hexa_client import HexaResponse
+from sessoes import (FilaCheia, FilaEsgotada, FilaRelogio, GerenciadorSessoes, PRIORIDADE_FUNDO,
+                     PRIORIDADE_INTERATIVA, PRIORIDADE_TRANSFERENCIA)
+
+
+def aguardar(condicao, prazo=2.0):
+    limite = time.monotonic() + prazo
+    while not condicao():
+        assert time.monotonic() < limite, "condição não atingida no prazo"
+        time.sleep(0.005)
+
+
+# --- FilaRelogio ---
+
+def test_fila_livre_nao_espera():
+    fila = FilaRelogio()
+    fila.entrar()
+    fila.sair()
+    fila.entrar(timeout=0)
+    fila.sair()
+
+
+def test_fila_por_prioridade_e_chegada():
+    fila = FilaRelogio()
+    fila.entrar()  # Comando em execução
+    ordem = []
+    threads = []
+    for nome, prioridade in (("fundo", PRIORIDADE_FUNDO), ("lote1", PRIORIDADE_TRANSFERENCIA),
+                             ("ui1", PRIORIDADE_INTERATIVA), ("lote2", PRIORIDADE_TRANSFERENCIA),
+                             ("ui2", PRIORIDADE_INTERATIVA)):
+        def trabalhar(nome=nome, prioridade=prioridade):
+            fila.entrar(prioridade, timeout=5)
+            ordem.append(nome)
+            fila.sair()
+        thread = threading.Thread(target=trabalhar)
+        thread.start()
+        threads.append(thread)
+        aguardar(lambda n=len(threads): len(fila) == n)
+    fila.sair()
+    for thread in threads:
+        thread.join()
+    assert ordem == ["ui1", "ui2", "lote1", "lote2", "fundo"]
+
+
+def test_fila_cheia_recusa_sem_esperar():
+    fila = FilaRelogio(maximo=1)
+    fila.entrar()
+    espera = threading.Thread(target=lambda: (fila.entrar(timeout=5), fila.sair()))
+    espera.start()
+    aguardar(lambda: len(fila) == 1)
+    inicio = time.monotonic()
+    with pytest.raises(FilaCheia):
+        fila.entrar(timeout=5)
+    assert time.monotonic() - inicio < 1
+    fila.sair()
+    espera.join()
+
+
+def test_fila_esgotada_sai_da_espera():
+    fila = FilaRelogio()
+    fila.entrar()
+    with pytest.raises(FilaEsgotada):
+        fila.entrar(timeout=0.05)
+    assert len(fila) == 0
+    fila.sair()
+    # Sem ninguém esperando, a fila fica livre de novo
+    fila.entrar(timeout=0)
+    fila.sair()
+
+
+def test_fila_vez_recebida_junto_com_o_prazo(monkeypatch):
+    # A vez chega entre o fim da espera do Event e a verificação com o lock:
+    # entrar() precisa ficar com ela, senão a fila ficaria ocupada para sempre
+    fila = FilaRelogio()
+    fila.entrar()
+
+    class EventAtrasado(threading.Event):
+        def wait(self, timeout=None):
+            fila.sair()  # Passa a vez a este comando no último instante
+            return False
+
+    monkeypatch.setattr(sessoes.threading, "Event", EventAtrasado)
+    fila.entrar(timeout=0.01)  # Não levanta FilaEsgotada: a vez é dele
+    monkeypatch.undo()
+    assert len(fila) == 0
+    fila.sair()
+    fila.entrar(timeout=0)  # E a devolveu normalmente
+    fila.sair()
+
+
+def test_fila_esgotada_nao_perde_a_vez_dos_outros():
+    fila = FilaRelogio()
+    fila.entrar()
+    with pytest.raises(FilaEsgotada):
+        fila.entrar(PRIORIDADE_INTERATIVA, timeout=0.02)
+    recebeu = threading.Event()
+    thread = threading.Thread(target=lambda: (fila.entrar(PRIORIDADE_FUNDO, timeout=5), recebeu.set(), fila.sair()))
+    thread.start()
+    aguardar(lambda: len(fila) == 1)
+    fila.sair()
+    thread.join()
+    assert recebeu.is_set()
+
+
+# --- Leituras agrupadas ---
+
+class ClienteFalso:
+    def __init__(self):
+        self.is_authenticated = True
+        self.liberar = threading.Event()
+        self.enviados = []
+        self.transport = None
+
+    def set_log_context(self, contexto):
+        pass
+
+    def send_command(self, comando, status="00", dados=""):
+        self.enviados.append(comando)
+        self.liberar.wait(5)
+        return HexaResponse("01", comando, "000", str(len(self.enviados)).encode())
+
+
+@pytest.fixture
+def gerenciador():
+    conexao = object()
+    gerenciador = GerenciadorSessoes(lambda ns: conexao, lambda ns: ("admin", "123"))
+    cliente = ClienteFalso()
+    gerenciador.adotar("NS1", conexao, cliente)
+    return gerenciador, cliente
+
+
+def em_thread(funcao, *args, **kwargs):
+    resultado = {}
+    thread = threading.Thread(target=lambda: resultado.setdefault("valor", funcao(*args, **kwargs)))
+    thread.start()
+    return thread, resultado
+
+
+def test_leituras_identicas_da_mesma_prioridade_sao_agrupadas(gerenciador):
+    gerenciador, cliente = gerenciador
+    primeira, r1 = em_thread(gerenciador.executar, "NS1", "RQ")
+    aguardar(lambda: cliente.enviados)
+    segunda, r2 = em_thread(gerenciador.executar, "NS1", "RQ")
+    aguardar(lambda: gerenciador.agrupados == 1)
+    cliente.liberar.set()
+    primeira.join()
+    segunda.join()
+    assert cliente.enviados == ["RQ"]
+    assert r1["valor"] is r2["valor"]
+
+
+def test_leitura_interativa_nao_espera_na_vez_do_fundo(gerenciador):
+    gerenciador, cliente = gerenciador
+    # Heartbeat (fundo) em execução; o RQ da interface não pode herdar a vez nem o
+    # resultado (ou a FilaEsgotada) dele
+    fundo, r_fundo = em_thread(gerenciador.executar, "NS1", "RQ", prioridade=PRIORIDADE_FUNDO)
+    aguardar(lambda: cliente.enviados)
+    interativo, r_interativo = em_thread(gerenciador.executar, "NS1", "RQ", prioridade=PRIORIDADE_INTERATIVA)
+    aguardar(lambda: gerenciador.estatisticas()["aguardando"] == 1)
+    # Outro RQ de fundo agora se junta à leitura interativa (prioridade maior ou igual)
+    outro_fundo, r_outro = em_thread(gerenciador.executar, "NS1", "RQ", prioridade=PRIORIDADE_FUNDO)
+    aguardar(lambda: gerenciador.agrupados == 1)
+    cliente.liberar.set()
+    for thread in (fundo, interativo, outro_fundo):
+        thread.join()
+    assert cliente.enviados == ["RQ", "RQ"]
+    assert gerenciador.agrupados == 1
+    assert r_interativo["valor"] is r_outro["valor"]
+    assert r_fundo["valor"] is not r_interativo["valor"]
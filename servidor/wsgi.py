@@ -0,0 +1,29 @@
+# Ponto de entrada WSGI da API para servidores com vários workers (gunicorn, uwsgi...)
+# Os relógios ficam num processo gateway separado, e cada worker fala com ele pelo
+# socket Unix de HEXA_GATEWAY (padrão /tmp/hexa-gateway.sock):
+#   python servidor-henry.py --gateway /tmp/hexa-gateway.sock
+#   HEXA_GATEWAY=/tmp/hexa-gateway.sock gunicorn -w 4 -b 0.0.0.0:5000 wsgi:app
+import importlib.util
+import os
+
+from gateway import SOCKET_PADRAO
+from logs import configurar_logs
+
+# Sem HEXA_GATEWAY cada worker abriria a própria porta 3000
+# (com HEXA_CLUSTER=1 os workers encontram os gateways pelo diretório do banco)
+if not os.environ.get("HEXA_CLUSTER"):
+    os.environ.setdefault("HEXA_GATEWAY", SOCKET_PADRAO)
+
+# servidor-henry.py tem hífen no nome: carregado pelo caminho
+_spec = importlib.util.spec_from_file_location(
+    "servidor_henry", os.path.join(os.path.dirname(os.path.abspath(__file__)), "servidor-henry.py"))
+servidor = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(servidor)
+
+# Com --preload a thread dos logs fica no processo mestre; logs.py a reinicia em cada worker
+configurar_logs()
+servidor.init_db()
+# Conexões SQLite não podem atravessar um fork (gunicorn --preload): o pool reabre sob demanda
+servidor.banco.pool.fechar()
+
+app = servidor.app